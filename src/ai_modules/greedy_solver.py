@@ -2,6 +2,9 @@
 This module implements a greedy solver for twisty puzzles based on dense reward counting the number of correct points up to symmetry.
 """
 import random # for choosing between multiple best actions
+
+import numpy as np
+
 if __name__ != "__main__":
     from .twisty_puzzle_model import perform_action
 else:
@@ -44,6 +47,7 @@ class Greedy_Puzzle_Solver():
         # initialize list of solved states considering rotations
         solved_states: list[list[int]] = get_symmetric_solvable_states(SOLVED_STATE, ACTIONS_DICT)
         self.get_state_value: callable = most_correct_points_reward_factory(solved_states, self.reward_dict)
+        self.get_state_values: callable = batched_most_correct_points_reward_factory(solved_states, self.reward_dict)
     
     def choose_action(self, state: list[int]) -> str:
         """
@@ -128,6 +132,28 @@ def most_correct_points_reward_factory(solved_states: list[tuple[int]], rewards:
     return most_correct_points_reward
 
 
+def batched_most_correct_points_reward_factory(solved_states: list[tuple[int]], rewards: dict[str, float]) -> callable:
+    np_solved_states: np.ndarray = np.array(solved_states)
+    def batched_most_correct_points_reward(states):
+        """
+        Batched version of `most_correct_points_reward`: evaluate many states at once.
+
+        Args:
+            states (np.ndarray): The states to evaluate with shape (n_states, n_points).
+
+        Returns:
+            (np.ndarray): The reward for each state.
+        """
+        states = np.asarray(states)
+        max_correct_points = np.max(np.sum(states[:, None, :] == np_solved_states, axis=-1), axis=-1)
+        match_percentage = max_correct_points/states.shape[1]
+        done = 1-match_percentage < 1e-5
+        reward = np.where(done, rewards["solved_up_to_symmetry"], rewards["unsolved_factor"] * match_percentage)
+        reward[np.all(states == np_solved_states[0], axis=-1)] = rewards["exact_solved"]
+        return reward
+    return batched_most_correct_points_reward
+
+
 
 def merge_dicts(dict_1, dict_2):
     """
@@ -0,0 +1,197 @@
+"""
+This module implements a precomputation of the algebraic relations between the moves of a twisty puzzle and a finite automaton of allowed move sequences derived from them.
+
+Many move sequences are redundant: `R R'` does nothing, `U U U U` is the identity, `R L R'` is the same as `L` if `R` and `L` commute. Searches, scramble generators and learners that apply such sequences waste work. `Move_Algebra` calculates
+    - the order of each move,
+    - the inverse of each move (if it is one of the moves),
+    - which pairs of moves commute,
+    - which pairs of moves can be replaced by a single move or nothing,
+and builds a finite automaton accepting exactly the move sequences in a canonical order without such redundant parts. Every state reachable with `n` moves is also reachable with at most `n` moves accepted by the automaton, so searches using the automaton still find all states and shortest solutions.
+
+The automaton is exposed as a table of transitions. `successor_mask[q]` is a boolean mask of the moves allowed in automaton state `q`, `transitions[q, move]` is the automaton state after applying `move`. Every sequence starts in automaton state `START_STATE`.
+
+Author: Sebastian Jost
+"""
+import numpy as np
+
+try:
+    from .permutation_engine import Permutation_Engine, permutation_order
+except ImportError:
+    from permutation_engine import Permutation_Engine, permutation_order
+
+
+START_STATE: int = 0
+
+
+class Move_Algebra:
+    """
+    Relations between the moves of a puzzle and a finite automaton of non-redundant move sequences.
+
+    Two rules define which sequences are accepted:
+        1. Canonical order: a sequence is rejected if a move `b` is followed by moves that all commute with a move `a < b` and then by `a` itself, since `a` could be moved in front of `b`. (lexicographic normal form of the trace monoid defined by the commuting moves)
+        2. No mergeable moves: a sequence is rejected if a move `a` is followed by moves that all commute with a move `b` and then by `b` itself, where `a b` can be replaced by a single move or nothing. Repetitions of the same move are only allowed as long as no other move or shorter repetition of the inverse achieves the same.
+
+    Args:
+        move_arrays (np.ndarray): moves as stacked index arrays (see `Permutation_Engine`)
+        move_names (list[str], optional): names of the moves. Defaults to None.
+    """
+    def __init__(self, move_arrays: np.ndarray, move_names: list[str] = None):
+        self.move_arrays: np.ndarray = move_arrays
+        self.move_names: list[str] | None = move_names
+        n_moves, n_points = move_arrays.shape
+        self.n_moves: int = n_moves
+        self.move_orders: np.ndarray = np.array([permutation_order(move) for move in move_arrays], dtype=np.int64)
+        # compositions[i, j] is the permutation of move i followed by move j
+        compositions: np.ndarray = move_arrays[:, move_arrays]
+        is_identity: np.ndarray = np.all(compositions == np.arange(n_points), axis=-1)
+        # index of the inverse of each move, -1 if the inverse is not one of the moves
+        self.inverse_indices: np.ndarray = np.array(
+            [int(row.argmax()) if row.any() else -1 for row in is_identity], dtype=np.int64)
+        self.commuting: np.ndarray = np.all(compositions == compositions.transpose(1, 0, 2), axis=-1)
+        # pairs of different moves that are equivalent to a single move or the identity
+        self.mergeable: np.ndarray = is_identity | _is_single_move(compositions, move_arrays)
+        np.fill_diagonal(self.mergeable, False)
+        self.max_repetitions: np.ndarray = np.array(
+            [self._get_max_repetitions(move_index) for move_index in range(n_moves)], dtype=np.int64)
+        self.transitions: np.ndarray = self._build_automaton()
+        self.successor_mask: np.ndarray = self.transitions >= 0
+
+    @staticmethod
+    def from_actions_dict(ACTIONS_DICT: dict[str, list[list[int]]], n_points: int) -> "Move_Algebra":
+        """
+        Calculate the move algebra of the moves in the given ACTIONS_DICT. Move indices follow the order of its keys.
+
+        Args:
+            ACTIONS_DICT (dict[str, list[list[int]]]): dictionary containing available moves as permutations in cyclic form
+            n_points (int): number of points of the puzzle
+
+        Returns:
+            Move_Algebra: the move algebra of the puzzle
+        """
+        permutation_engine: Permutation_Engine = Permutation_Engine(ACTIONS_DICT, n_points)
+        return Move_Algebra(permutation_engine.move_arrays, permutation_engine.move_names)
+
+    @property
+    def n_automaton_states(self) -> int:
+        return len(self.transitions)
+
+    def get_allowed_moves(self, automaton_state: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: indices of all moves allowed in the given automaton state
+        """
+        return np.flatnonzero(self.successor_mask[automaton_state])
+
+    def get_allowed_move_names(self, automaton_state: int) -> list[str]:
+        """
+        Returns:
+            list[str]: names of all moves allowed in the given automaton state
+        """
+        return [self.move_names[move] for move in self.get_allowed_moves(automaton_state)]
+
+    def next_state(self, automaton_state: int, move: int | str) -> int:
+        """
+        Get the automaton state after applying a move.
+
+        Args:
+            automaton_state (int): the current automaton state
+            move (int | str): index or name of the applied move
+
+        Returns:
+            int: the next automaton state. -1 if the move is not allowed.
+        """
+        if isinstance(move, str):
+            move = self.move_names.index(move)
+        return int(self.transitions[automaton_state, move])
+
+    def random_moves(self, automaton_states: np.ndarray, rng: np.random.Generator = None) -> np.ndarray:
+        """
+        Choose a random allowed move for each given automaton state.
+
+        Args:
+            automaton_states (np.ndarray): current automaton states
+            rng (np.random.Generator, optional): random number generator. Defaults to None (use `np.random`).
+
+        Returns:
+            np.ndarray: index of the chosen move for each automaton state
+        """
+        random_values: np.ndarray = np.random.random((len(automaton_states), self.n_moves)) if rng is None \
+            else rng.random((len(automaton_states), self.n_moves))
+        # forbidden moves get a negative value, so they are never the largest
+        return np.argmax(np.where(self.successor_mask[automaton_states], random_values, -1), axis=1)
+
+    def _get_max_repetitions(self, move_index: int) -> int:
+        """
+        Calculate how often a move may be repeated. A repetition is redundant if it equals the identity, a single move or an equally long repetition of the inverse move with lower index.
+        """
+        move: np.ndarray = self.move_arrays[move_index]
+        order: int = int(self.move_orders[move_index])
+        inverse_index: int = int(self.inverse_indices[move_index])
+        power: np.ndarray = move
+        for repetitions in range(2, order + 1):
+            power = power[move]
+            if np.any(np.all(self.move_arrays == power, axis=-1)) or repetitions == order:
+                return repetitions - 1
+            if inverse_index >= 0 and inverse_index != move_index:
+                # the same permutation can be reached with `order - repetitions` inverse moves
+                if order - repetitions < repetitions \
+                        or (order - repetitions == repetitions and inverse_index < move_index):
+                    return repetitions - 1
+        return 1
+
+    def _build_automaton(self) -> np.ndarray:
+        """
+        Enumerate all reachable automaton states starting at `START_STATE` and calculate the transition table.
+
+        An automaton state consists of the set of forbidden next moves, the last move and how often it was repeated.
+
+        Returns:
+            np.ndarray: transition table with shape (n_automaton_states, n_moves). -1 marks forbidden moves.
+        """
+        all_moves: np.ndarray = np.arange(self.n_moves)
+        # moves forbidden after each move (before intersecting with the previously forbidden moves)
+        newly_forbidden: np.ndarray = (self.commuting & (all_moves[None, :] < all_moves[:, None])) | self.mergeable
+        start_key: tuple[frozenset, int, int] = (frozenset(), -1, 0)
+        state_indices: dict[tuple[frozenset, int, int], int] = {start_key: START_STATE}
+        state_keys: list[tuple[frozenset, int, int]] = [start_key]
+        transitions: list[list[int]] = []
+        i: int = 0
+        while i < len(state_keys):
+            forbidden, last_move, repetitions = state_keys[i]
+            row: list[int] = []
+            for move in range(self.n_moves):
+                if move in forbidden or (move == last_move and repetitions >= self.max_repetitions[move]):
+                    row.append(-1)
+                    continue
+                # forbidden moves that commute with the new move stay forbidden
+                next_forbidden: frozenset = frozenset(
+                    [other for other in forbidden if self.commuting[move, other]]
+                    + np.flatnonzero(newly_forbidden[move]).tolist())
+                next_key: tuple[frozenset, int, int] = (
+                    next_forbidden, move, repetitions + 1 if move == last_move else 1)
+                if next_key not in state_indices:
+                    state_indices[next_key] = len(state_keys)
+                    state_keys.append(next_key)
+                row.append(state_indices[next_key])
+            transitions.append(row)
+            i += 1
+        return np.array(transitions, dtype=np.int32).reshape(len(transitions), self.n_moves)
+
+
+def _is_single_move(compositions: np.ndarray, move_arrays: np.ndarray) -> np.ndarray:
+    """
+    Check which compositions of two moves are equal to a single move.
+
+    Args:
+        compositions (np.ndarray): compositions of all pairs of moves with shape (n_moves, n_moves, n_points)
+        move_arrays (np.ndarray): moves as stacked index arrays
+
+    Returns:
+        np.ndarray: boolean array with shape (n_moves, n_moves)
+    """
+    n_moves: int = len(move_arrays)
+    flat_compositions: np.ndarray = compositions.reshape(n_moves * n_moves, move_arrays.shape[1])
+    is_move: np.ndarray = np.zeros(n_moves * n_moves, dtype=np.bool_)
+    for move in move_arrays:
+        is_move |= np.all(flat_compositions == move, axis=-1)
+    return is_move.reshape(n_moves, n_moves)
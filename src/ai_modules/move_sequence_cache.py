@@ -0,0 +1,145 @@
+"""
+This module implements a cache for permutations of move sequences.
+
+Algorithms, rotations and solutions are often replayed many times. Instead of applying every move of a sequence one after another, the cache composes the whole sequence into a single index array once. Applying a cached sequence to a state is then a single gather.
+
+Index arrays follow the same convention as `nn_rl_environment.permutation_cycles_to_tensor`: applying permutation `perm` to `state` yields `state[perm]`. This is also the `array_form` of the corresponding sympy permutation.
+
+Author: Sebastian Jost
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from .permutation_engine import INDEX_DTYPE, check_n_points, move_to_index_array, invert_index_array
+except ImportError:
+    from permutation_engine import INDEX_DTYPE, check_n_points, move_to_index_array, invert_index_array
+
+
+class Move_Sequence_Cache:
+    """
+    Least-recently-used cache mapping move sequences (tuples of move names) to their composed permutation as an index array.
+
+    Args:
+        moves (dict[str, list[list[int]]] | dict[str, Permutation]): the puzzle's moves given as names and permutations in cyclic form or as sympy permutations. Moves are converted lazily, so moves added to this dictionary later can be used as well.
+        n_points (int): number of points of the puzzle (length of a state)
+        max_size (int, optional): maximum number of cached sequences. The least recently used sequence is evicted first. Defaults to 10,000.
+    """
+    def __init__(self,
+            moves: dict,
+            n_points: int,
+            max_size: int = 10_000,
+            ):
+        check_n_points(n_points)
+        self.moves: dict = moves
+        self.n_points: int = n_points
+        self.max_size: int = max_size
+        self.identity: np.ndarray = np.arange(n_points, dtype=INDEX_DTYPE)
+        self.move_arrays: dict[str, np.ndarray] = dict()
+        # cache entries: move sequence -> [permutation, inverse permutation or None]
+        self._cache: OrderedDict[tuple[str, ...], list[np.ndarray | None]] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get_move_array(self, move_name: str) -> np.ndarray:
+        """
+        Get the index array of a single move.
+
+        Args:
+            move_name (str): name of the move
+
+        Returns:
+            np.ndarray: the move as index array
+        """
+        if move_name not in self.move_arrays:
+            self.move_arrays[move_name] = move_to_index_array(self.moves[move_name], self.n_points)
+        return self.move_arrays[move_name]
+
+    def get_permutation(self, move_sequence: list[str] | tuple[str, ...]) -> np.ndarray:
+        """
+        Get the permutation of the given move sequence as a single index array.
+
+        Args:
+            move_sequence (list[str] | tuple[str, ...]): sequence of move names
+
+        Returns:
+            np.ndarray: the composed permutation. Do not modify it in-place, it is shared with the cache.
+        """
+        return self._get_entry(tuple(move_sequence))[0]
+
+    def get_inverse_permutation(self, move_sequence: list[str] | tuple[str, ...]) -> np.ndarray:
+        """
+        Get the inverse permutation of the given move sequence as a single index array.
+
+        Args:
+            move_sequence (list[str] | tuple[str, ...]): sequence of move names
+
+        Returns:
+            np.ndarray: the inverse of the composed permutation. Do not modify it in-place, it is shared with the cache.
+        """
+        entry: list[np.ndarray | None] = self._get_entry(tuple(move_sequence))
+        if entry[1] is None:
+            entry[1] = invert_index_array(entry[0])
+        return entry[1]
+
+    def apply(self, state: list[int] | np.ndarray, move_sequence: list[str] | tuple[str, ...]) -> list[int] | np.ndarray:
+        """
+        Apply the given move sequence to a state with a single gather.
+
+        Args:
+            state (list[int] | np.ndarray): the state to apply the moves to. It is not changed.
+            move_sequence (list[str] | tuple[str, ...]): sequence of move names
+
+        Returns:
+            list[int] | np.ndarray: the new state. Same type as `state`.
+        """
+        permutation: np.ndarray = self.get_permutation(move_sequence)
+        if isinstance(state, np.ndarray):
+            return state[permutation]
+        return [state[i] for i in permutation.tolist()]
+
+    def cache_info(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: number of cache hits, misses, current and maximum size
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._cache),
+            "max_size": self.max_size,
+        }
+
+    def clear(self) -> None:
+        """
+        Remove all cached sequences and reset the hit/miss counters. Call this if a move was redefined.
+        """
+        self.move_arrays.clear()
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _get_entry(self, move_sequence: tuple[str, ...]) -> list[np.ndarray | None]:
+        """
+        Get the cache entry of a move sequence, calculating it on a cache miss. If the sequence without its last move is cached, it is extended by one move instead of composing the whole sequence again.
+        """
+        entry = self._cache.get(move_sequence)
+        if entry is not None:
+            self.hits += 1
+            self._cache.move_to_end(move_sequence)
+            return entry
+        self.misses += 1
+        prefix_entry = self._cache.get(move_sequence[:-1])
+        if prefix_entry is not None:
+            permutation: np.ndarray = prefix_entry[0][self.get_move_array(move_sequence[-1])]
+        else:
+            permutation: np.ndarray = self.identity
+            for move_name in move_sequence:
+                permutation = permutation[self.get_move_array(move_name)]
+        entry = [permutation, None]
+        self._cache[move_sequence] = entry
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return entry
+
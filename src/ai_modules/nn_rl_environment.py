@@ -9,6 +9,12 @@ import gymnasium as gym
 import numpy as np
 from gymnasium.spaces import MultiDiscrete, Discrete
 from stable_baselines3.common.callbacks import BaseCallback
+from stable_baselines3.common.vec_env import VecEnv
+
+try:
+    from .move_algebra import Move_Algebra, START_STATE
+except ImportError:
+    from move_algebra import Move_Algebra, START_STATE
 
 
 # STICKER_DTYPE: np.int32 = np.int32
@@ -27,6 +33,9 @@ class Twisty_Puzzle_Env(gym.Env):
         initial_scramble_length (int, optional): number of moves to scramble the puzzle with at the beginning of each episode. This can be increased dynmically during training using the `Update_Scramble_Length_Callback`. Defaults to 1.
         success_threshold (float, optional): success rate threshold for increasing the scramble length. Defaults to 0.1.
         reward_func (callable, optional): reward function to use. Should have call signature `reward_func(state: np.ndarray, truncated: bool) -> tuple[float, bool]` (returning the reward and terminated signal). Defaults to None.
+        action_masking (bool, optional): whether to track the actions of each episode to mask redundant actions (see `action_masks`). Defaults to False.
+        scramble_move_algebra (Move_Algebra, optional): move algebra of the base actions (see `get_move_algebras`). Pass the same instance to all environments of a puzzle to calculate it only once. Defaults to None (calculate it).
+        action_move_algebra (Move_Algebra, optional): move algebra of all actions, only used if `action_masking` is True. Defaults to None (calculate it if needed).
     """
     def __init__(self,
             solved_state: list[int],
@@ -37,9 +46,21 @@ class Twisty_Puzzle_Env(gym.Env):
             min_scramble_length=1,
             success_threshold=0.1,
             reward_func: callable = None,
+            action_masking: bool = False,
+            scramble_move_algebra: Move_Algebra = None,
+            action_move_algebra: Move_Algebra = None,
             # exp_identifier: str | None = None,
             ):
         self.solved_state, self.actions, self.base_actions = puzzle_info_to_np(solved_state, actions, base_actions)
+        # scrambles never contain redundant move sequences like `R R'`
+        self.scramble_move_algebra: Move_Algebra = scramble_move_algebra if scramble_move_algebra is not None \
+            else Move_Algebra(self.base_actions)
+        # used to mask redundant actions during the episode, None if action masking is disabled
+        self.action_move_algebra: Move_Algebra | None = None
+        if action_masking:
+            self.action_move_algebra = action_move_algebra if action_move_algebra is not None \
+                else Move_Algebra(self.actions)
+        self.automaton_state: int = START_STATE
         # initialize other parameters
         self.num_base_actions: int = len(self.base_actions)
         self.max_moves: int = max_moves
@@ -105,6 +126,7 @@ class Twisty_Puzzle_Env(gym.Env):
         self.episode_counter += 1
         self.move_counter: np.ndarray = STICKER_DTYPE(0)
         self.terminated: bool = False
+        self.automaton_state: int = START_STATE
         # Access the monitor wrapper to get episode rewards
         # if self.episode_counter%1000 == 0: # and hasattr(self, 'monitor'):
         #     self.mean_success_rate = np.mean(self.episode_success_history)
@@ -127,6 +149,10 @@ class Twisty_Puzzle_Env(gym.Env):
         
         permutation: np.ndarray = self.actions[action_index]
         self.state: np.ndarray = self.state[permutation]
+        if self.action_move_algebra is not None:
+            self.automaton_state = int(self.action_move_algebra.transitions[self.automaton_state, action_index])
+            if self.automaton_state < 0: # a masked action was chosen (e.g. by unmasked PPO)
+                self.automaton_state = START_STATE
         
         self.move_counter += 1
         
@@ -140,6 +166,17 @@ class Twisty_Puzzle_Env(gym.Env):
         
         return self.state, reward, self.terminated, truncated, {'terminated': self.terminated}
 
+    def action_masks(self) -> np.ndarray:
+        """
+        Get the actions that are not redundant after the previous actions of the episode. Actions undoing or merging with previous actions and non-canonical orders of commuting actions are masked (see `Move_Algebra`). This method is used by maskable PPO (`sb3_contrib.MaskablePPO`).
+
+        Returns:
+            np.ndarray: boolean mask of the allowed actions with shape `(n_actions,)`. All actions are allowed if action masking is disabled.
+        """
+        if self.action_move_algebra is None:
+            return np.ones(len(self.actions), dtype=bool)
+        return get_action_masks(self.action_move_algebra, np.array([self.automaton_state]))[0]
+
     def scramble_puzzle(self, max_scramble_length: int, min_scramble_length: int = -1) -> np.ndarray:
         """
         Scrample the puzzle by applying `scrable_length` random moves.
@@ -150,16 +187,213 @@ class Twisty_Puzzle_Env(gym.Env):
         Returns:
             np.ndarray: the scrambled state
         """
-        # scramble_length: int = max_scramble_length
         if min_scramble_length <= 0:
-            scramble_length = max_scramble_length
-        else:
-            scramble_length: int = np.random.randint(min_scramble_length, max_scramble_length+1)
-        self.scramble_action_indices = np.random.random_integers(0, self.num_base_actions-1, (scramble_length,))
-        for action in self.base_actions[self.scramble_action_indices]:
-            self.state = self.state[action]
+            min_scramble_length = max_scramble_length
+        states, scramble_action_indices = scramble_states(
+            solved_state=self.state,
+            base_actions=self.base_actions,
+            n_states=1,
+            max_scramble_length=max_scramble_length,
+            min_scramble_length=min_scramble_length,
+            move_algebra=self.scramble_move_algebra,
+        )
+        self.scramble_action_indices = scramble_action_indices[0][scramble_action_indices[0] >= 0]
+        self.state = states[0]
         return self.state
 
+
+class Twisty_Puzzle_VecEnv(VecEnv):
+    """
+    Vectorized twisty puzzle environment for RL training. Instead of wrapping `n_envs` copies of `Twisty_Puzzle_Env`, all puzzle states are stored as rows of one `(n_envs, n_stickers)` array. Actions are applied to all environments with a single gather, rewards are evaluated on the whole batch and finished environments are reset in place.
+
+    The reward function must accept batched inputs, i.e. `reward_func(states: np.ndarray, truncated: np.ndarray) -> tuple[np.ndarray, np.ndarray]` with states of shape `(n_envs, n_stickers)`. All reward factories in `nn_rl_reward_factories` support this.
+
+    Args:
+        n_envs (int): number of puzzles to simulate in parallel
+        solved_state (list[int]): the solved state of the puzzle as a list of color indices
+        actions (dict[str, list[list[int]]]): the puzzle's actions given as names and permutations in cyclic form
+        base_actions (list[str], optional): the base actions to use for scrambling the puzzle as list of action names. Defaults to None.
+        max_moves (int, optional): maximum number of moves allowed in an episode before it is truncated. Defaults to 50.
+        initial_scramble_length (int, optional): number of moves to scramble the puzzle with at the beginning of each episode. This can be increased dynmically during training using the `Update_Scramble_Length_Callback`. Defaults to 2.
+        min_scramble_length (int, optional): minimum number of scramble moves. If <= 0, always scramble with exactly `scramble_length` moves. Defaults to 1.
+        success_threshold (float, optional): success rate threshold for increasing the scramble length. Defaults to 0.1.
+        reward_func (callable, optional): batched reward function (see above). Defaults to None.
+        action_masking (bool, optional): whether to track the actions of each episode to mask redundant actions (see `action_masks`). Defaults to False.
+        scramble_move_algebra (Move_Algebra, optional): move algebra of the base actions (see `get_move_algebras`). Defaults to None (calculate it).
+        action_move_algebra (Move_Algebra, optional): move algebra of all actions, only used if `action_masking` is True. Defaults to None (calculate it if needed).
+    """
+    def __init__(self,
+            n_envs: int,
+            solved_state: list[int],
+            actions: dict[str, list[list[int]]],
+            base_actions: list[str] = None,
+            max_moves: int = 50,
+            initial_scramble_length: int = 2,
+            min_scramble_length: int = 1,
+            success_threshold: float = 0.1,
+            reward_func: callable = None,
+            action_masking: bool = False,
+            scramble_move_algebra: Move_Algebra = None,
+            action_move_algebra: Move_Algebra = None,
+            ):
+        self.solved_state, self.actions, self.base_actions = puzzle_info_to_np(solved_state, actions, base_actions)
+        # scrambles never contain redundant move sequences like `R R'`
+        self.scramble_move_algebra: Move_Algebra = scramble_move_algebra if scramble_move_algebra is not None \
+            else Move_Algebra(self.base_actions)
+        # used to mask redundant actions during the episodes, None if action masking is disabled
+        self.action_move_algebra: Move_Algebra | None = None
+        if action_masking:
+            self.action_move_algebra = action_move_algebra if action_move_algebra is not None \
+                else Move_Algebra(self.actions)
+        self.num_base_actions: int = len(self.base_actions)
+        self.max_moves: int = max_moves
+        self.episode_counter: int = 0
+        self.scramble_length: int = initial_scramble_length
+        self.min_scramble_length: int = min_scramble_length
+        self.reward_func: callable = reward_func
+        self.success_threshold: float = success_threshold
+        self.render_mode = None
+        super().__init__(
+            num_envs=n_envs,
+            observation_space=MultiDiscrete([len(set(solved_state))] * len(solved_state)),
+            action_space=Discrete(len(actions)),
+        )
+        # state of all environments, one puzzle per row
+        self.states: np.ndarray = np.tile(self.solved_state, (n_envs, 1))
+        self.move_counters: np.ndarray = np.zeros(n_envs, dtype=np.int32)
+        self.action_indices: np.ndarray = np.zeros(n_envs, dtype=np.int64) # actions set by `step_async`
+        self.automaton_states: np.ndarray = np.full(n_envs, START_STATE, dtype=np.int32)
+        # most recent scramble of each environment as base action indices, padded with -1
+        self.scramble_action_indices: np.ndarray = np.full((n_envs, 0), -1, dtype=np.int64)
+
+    def set_scramble_length(self, scramble_length: int) -> None:
+        """
+        Set the scramble length for all future episodes to the given value.
+
+        Args:
+            scramble_length (int): number of moves to scramble the puzzle with. (positive integer)
+        """
+        self.scramble_length: int = scramble_length
+
+    def get_scramble_length(self) -> int:
+        """
+        Get the current scramble length.
+
+        Returns:
+            int: the current scramble length
+        """
+        return self.scramble_length
+
+    def reset(self) -> np.ndarray:
+        """
+        Reset all environments to random scrambled states.
+
+        Returns:
+            np.ndarray: scrambled states of all environments with shape `(n_envs, n_stickers)`
+        """
+        if self._seeds[0] is not None:
+            np.random.seed(self._seeds[0])
+        self._reset_seeds()
+        self._reset_options()
+        self.reset_rows(np.arange(self.num_envs))
+        return self.states.copy()
+
+    def reset_rows(self, env_indices: np.ndarray) -> None:
+        """
+        Reset the given environments to solved and scramble them with random base moves. All selected environments are scrambled at the same time using `scramble_states`.
+
+        Args:
+            env_indices (np.ndarray): indices of the environments to reset
+        """
+        self.episode_counter += len(env_indices)
+        states, scramble_action_indices = scramble_states(
+            solved_state=self.solved_state,
+            base_actions=self.base_actions,
+            n_states=len(env_indices),
+            max_scramble_length=self.scramble_length,
+            min_scramble_length=self.min_scramble_length if self.min_scramble_length > 0 else self.scramble_length,
+            move_algebra=self.scramble_move_algebra,
+        )
+        self.states[env_indices] = states
+        # store scrambles for logging. Widen the stored matrix if the scramble length increased.
+        if self.scramble_action_indices.shape[1] < self.scramble_length:
+            padding = np.full((self.num_envs, self.scramble_length - self.scramble_action_indices.shape[1]), -1, dtype=np.int64)
+            self.scramble_action_indices = np.hstack((self.scramble_action_indices, padding))
+        self.scramble_action_indices[env_indices] = -1
+        self.scramble_action_indices[env_indices, :scramble_action_indices.shape[1]] = scramble_action_indices
+        self.move_counters[env_indices] = 0
+        self.automaton_states[env_indices] = START_STATE
+
+    def action_masks(self) -> np.ndarray:
+        """
+        Get the actions of each environment that are not redundant after the previous actions of its episode (see `Twisty_Puzzle_Env.action_masks`).
+
+        Returns:
+            np.ndarray: boolean masks of the allowed actions with shape `(n_envs, n_actions)`. All actions are allowed if action masking is disabled.
+        """
+        if self.action_move_algebra is None:
+            return np.ones((self.num_envs, len(self.actions)), dtype=bool)
+        return get_action_masks(self.action_move_algebra, self.automaton_states)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.action_indices = actions
+
+    def step_wait(self):
+        """
+        Apply the actions given in `step_async` to all environments at once, evaluate the rewards for the whole batch and auto-reset finished environments.
+
+        Returns:
+            np.ndarray: new states of all environments (reset states for finished environments)
+            np.ndarray: rewards
+            np.ndarray: done flags (terminated or truncated)
+            list[dict]: info dicts. Finished environments include the final state as `terminal_observation`.
+        """
+        permutations: np.ndarray = self.actions[self.action_indices]
+        self.states = np.take_along_axis(self.states, permutations, axis=1)
+        if self.action_move_algebra is not None:
+            self.automaton_states = self.action_move_algebra.transitions[self.automaton_states, self.action_indices]
+            # masked actions chosen anyway (e.g. by unmasked PPO) restart the automaton
+            self.automaton_states[self.automaton_states < 0] = START_STATE
+        self.move_counters += 1
+
+        truncated: np.ndarray = self.move_counters >= self.max_moves
+        rewards, terminated = self.reward_func(self.states, truncated)
+        rewards = np.broadcast_to(np.asarray(rewards, dtype=np.float32), (self.num_envs,)).copy()
+        terminated = np.broadcast_to(terminated, (self.num_envs,))
+        dones: np.ndarray = terminated | truncated
+
+        infos: list[dict] = [{"terminated": bool(done)} for done in terminated]
+        done_indices: np.ndarray = np.flatnonzero(dones)
+        for i in done_indices:
+            infos[i]["terminal_observation"] = self.states[i].copy()
+            infos[i]["TimeLimit.truncated"] = bool(truncated[i] and not terminated[i])
+        if len(done_indices) > 0:
+            self.reset_rows(done_indices)
+        return self.states.copy(), rewards, dones, infos
+
+    def close(self) -> None:
+        pass
+
+    def get_attr(self, attr_name: str, indices = None) -> list:
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value, indices = None) -> None:
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices = None, **method_kwargs) -> list:
+        """
+        Call a method of the environment. Since all environments share one object, the method is called once and the result is repeated for each requested index.
+        `action_masks` returns one row per environment, so each requested index gets its own row instead.
+        """
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+        if method_name == "action_masks":
+            return [result[i] for i in self._get_indices(indices)]
+        return [result for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices = None) -> list[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+
 class EarlyStopCallback(BaseCallback):
     def __init__(self, env: Twisty_Puzzle_Env, max_difficulty: int=100, verbose=0):
         super(EarlyStopCallback, self).__init__(verbose)
@@ -229,6 +463,44 @@ class Update_Scramble_Length_Callback(BaseCallback):
         #     print(f"Current success rate: {mean_success_rate:6.1%}")
 
 
+def get_action_masks(move_algebra: Move_Algebra, automaton_states: np.ndarray) -> np.ndarray:
+    """
+    Get the masks of allowed actions for the given automaton states. In dead ends of the automaton every further action is redundant, but episodes continue until they are truncated, so all actions are allowed there.
+
+    Args:
+        move_algebra (Move_Algebra): move algebra of the environment's actions
+        automaton_states (np.ndarray): current automaton state of each environment
+
+    Returns:
+        np.ndarray: boolean masks of the allowed actions with shape `(len(automaton_states), n_actions)`
+    """
+    masks: np.ndarray = move_algebra.successor_mask[automaton_states]
+    masks[~masks.any(axis=1)] = True
+    return masks
+
+def get_move_algebras(
+        solved_state: list[int],
+        actions_dict: dict[str, list[list[int]]],
+        base_actions: list[str] = None,
+        action_masking: bool = False,
+        ) -> tuple[Move_Algebra, Move_Algebra | None]:
+    """
+    Calculate the move algebras used by the environments of a puzzle. Calculating them takes up to a few seconds for puzzles with many actions, so they should be calculated once and passed to all environments.
+
+    Args:
+        solved_state (list[int]): the solved state of the puzzle as a list of color indices
+        actions_dict (dict[str, list[list[int]]]): the puzzle's actions given as names and permutations in cyclic form
+        base_actions (list[str], optional): the base actions to use for scrambling the puzzle as list of action names. Defaults to None.
+        action_masking (bool, optional): whether to calculate the move algebra of all actions for action masking. Defaults to False.
+
+    Returns:
+        Move_Algebra: move algebra of the base actions (`scramble_move_algebra`)
+        Move_Algebra | None: move algebra of all actions (`action_move_algebra`), None if `action_masking` is False
+    """
+    _, np_actions, np_base_actions = puzzle_info_to_np(solved_state, actions_dict, base_actions)
+    action_move_algebra: Move_Algebra | None = Move_Algebra(np_actions) if action_masking else None
+    return Move_Algebra(np_base_actions), action_move_algebra
+
 def puzzle_info_to_np(
         state: list[int],
         actions_dict: dict[str, list[tuple[int, ...]]],
@@ -267,6 +539,50 @@ def puzzle_info_to_np(
         base_actions,
         )
 
+def scramble_states(
+        solved_state: np.ndarray,
+        base_actions: np.ndarray,
+        n_states: int,
+        max_scramble_length: int,
+        min_scramble_length: int = None,
+        move_algebra: Move_Algebra = None,
+        ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Generate `n_states` random scrambles at once. All scramble moves are drawn in a single call and applied to all states simultaneously with one gather per scramble move.
+    Scrambles shorter than the longest one are padded with the identity permutation, so every gather covers the full batch.
+    If a `Move_Algebra` of the base actions is given, each scramble move is drawn from the moves its automaton allows after the previous moves, so scrambles contain no redundant sequences like `R R'`.
+
+    Args:
+        solved_state (np.ndarray): the solved state of the puzzle
+        base_actions (np.ndarray): permutations to scramble with, one per row
+        n_states (int): number of scrambled states to generate
+        max_scramble_length (int): maximum number of moves per scramble
+        min_scramble_length (int, optional): minimum number of moves per scramble. Lengths are drawn uniformly from `[min_scramble_length, max_scramble_length]`. Defaults to None (= always use `max_scramble_length`).
+        move_algebra (Move_Algebra, optional): move algebra of `base_actions`. Defaults to None (draw moves uniformly).
+
+    Returns:
+        np.ndarray: scrambled states with shape `(n_states, len(solved_state))`
+        np.ndarray: scramble matrix of base action indices with shape `(n_states, max_scramble_length)`. Unused moves of shorter scrambles are marked with -1.
+    """
+    num_base_actions: int = len(base_actions)
+    if move_algebra is None:
+        scramble_action_indices: np.ndarray = np.random.randint(0, num_base_actions, size=(n_states, max_scramble_length))
+    else:
+        scramble_action_indices: np.ndarray = np.empty((n_states, max_scramble_length), dtype=np.int64)
+        automaton_states: np.ndarray = np.full(n_states, START_STATE)
+        for move_index in range(max_scramble_length):
+            scramble_action_indices[:, move_index] = move_algebra.random_moves(automaton_states)
+            automaton_states = move_algebra.transitions[automaton_states, scramble_action_indices[:, move_index]]
+    if min_scramble_length is not None and min_scramble_length < max_scramble_length:
+        scramble_lengths: np.ndarray = np.random.randint(min_scramble_length, max_scramble_length+1, size=(n_states, 1))
+        scramble_action_indices[np.arange(max_scramble_length) >= scramble_lengths] = -1
+    # index -1 selects the appended identity permutation
+    padded_actions: np.ndarray = np.vstack((base_actions, np.arange(base_actions.shape[1], dtype=base_actions.dtype)))
+    states: np.ndarray = np.tile(solved_state, (n_states, 1))
+    for move_index in range(max_scramble_length):
+        states = np.take_along_axis(states, padded_actions[scramble_action_indices[:, move_index]], axis=1)
+    return states, scramble_action_indices
+
 def permutation_cycles_to_tensor(state_length: int, action: list[list[int]]) -> np.ndarray:
     """
     Convert a permutation in cycle notation to a tensor.
@@ -59,8 +59,9 @@ def correct_points_reward_factory(solved_state) -> callable:
         correct_points = np.sum(state == solved_state, axis=-1)
         reward: float = correct_points/state.shape[-1]
         done: bool = 1-reward < 1e-5
-        if done:
-            reward = 500.
+        reward = np.where(done, 500., reward)
+        if state.ndim == 1:
+            return float(reward), bool(done)
         # print("correct points reward: ",
         #       state,
         #       solved_state,
@@ -82,14 +83,12 @@ def most_correct_points_reward_factory(solved_states: np.ndarray) -> callable:
         Returns:
             (float): The reward in range [0, 1].
         """
-        max_correct_points: int = 0
-        for solved_state in solved_states:
-            correct_points: int = np.sum(state == solved_state, axis=-1)
-            max_correct_points: int = max_correct_points if max_correct_points > correct_points else correct_points
+        max_correct_points: int = np.max(np.sum(state[..., None, :] == solved_states, axis=-1), axis=-1)
         reward: float = max_correct_points/state.shape[-1]
         done: bool = 1-reward < 1e-5
-        if done:
-            reward = 500.
+        reward = np.where(done, 500., reward)
+        if state.ndim == 1:
+            return float(reward), bool(done)
         return reward, done
     return most_correct_points_reward
 
@@ -105,15 +104,11 @@ def sparse_most_correct_points_reward_factory(solved_states: np.ndarray) -> call
         Returns:
             (float): The reward in range [0, 1].
         """
-        max_correct_points: int = 0
-        for solved_state in solved_states:
-            correct_points: int = np.sum(state == solved_state, axis=-1)
-            max_correct_points: int = max_correct_points if max_correct_points > correct_points else correct_points
+        max_correct_points: int = np.max(np.sum(state[..., None, :] == solved_states, axis=-1), axis=-1)
         reward: float = max_correct_points/state.shape[-1]
         done: bool = 1-reward < 1e-5
-        if not (truncated or done):
-            reward = 0.
-        elif done:
-            reward = 100.
+        reward = np.where(done, 100., np.where(truncated, reward, 0.))
+        if state.ndim == 1:
+            return float(reward), bool(done)
         return reward, done
     return sparse_most_correct_points_reward
\ No newline at end of file
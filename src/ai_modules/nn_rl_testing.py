@@ -15,10 +15,10 @@ from stable_baselines3 import PPO
 
 try:
     from nn_rl_environment import Twisty_Puzzle_Env
-    from nn_rl_training import train_agent, get_action_index_to_name, setup_training
+    from nn_rl_training import train_agent, get_action_index_to_name, setup_training, get_model_class
 except ModuleNotFoundError:
     from .nn_rl_environment import Twisty_Puzzle_Env
-    from .nn_rl_training import train_agent, get_action_index_to_name, setup_training
+    from .nn_rl_training import train_agent, get_action_index_to_name, setup_training, get_model_class
 
 def test_agent(
         model: torch.nn.Module,
@@ -29,6 +29,7 @@ def test_agent(
         deterministic: bool = True,
         exp_folder_path: str = "",
         verbosity: int = 1,
+        action_masking: bool = False,
     ):
     """
     Test the given agent on the given environment with the given parameters.
@@ -42,6 +43,7 @@ def test_agent(
         deterministic (bool): Whether to use deterministic actions.
         exp_folder_path (str): The path to the experiment folder where test results will be saved.
         verbose (bool | None): Whether to print the results to stdout. If None, the results are printed if num_tests <= 5.
+        action_masking (bool): Whether the agent is a maskable PPO agent that should only choose actions allowed by `env.action_masks()`.
     """
     tests_folder: str = os.path.join(exp_folder_path, "tests")
     os.makedirs(tests_folder, exist_ok=True)
@@ -66,7 +68,10 @@ def test_agent(
         done = False
         action_sequence = []
         while not done:
-            action, _ = model.predict(obs, deterministic=deterministic)
+            if action_masking:
+                action, _ = model.predict(obs, deterministic=deterministic, action_masks=env.action_masks())
+            else:
+                action, _ = model.predict(obs, deterministic=deterministic)
             obs, _, terminated, truncated, _ = env.step(int(action))
             done = terminated or truncated
             action_sequence.append(action_index_to_name[int(action)])
@@ -140,14 +145,17 @@ def test_from_file(
         initial_scramble_length=exp_config["start_scramble_depth"],
         success_threshold=exp_config["success_threshold"],
         reward_func=reward_func,
+        action_masking=exp_config.get("action_masking", False),
     )
 
+    action_masking: bool = exp_config.get("action_masking", False)
+    model_class: type = get_model_class(action_masking)
     model_name: str = f"{model_snapshot_steps}_steps.zip"
     model_snapshots_folder: str = os.path.join(exp_folder_path, "model_snapshots")
     try:
         model_path = os.path.join(model_snapshots_folder, model_name)
         # load model from file
-        model = PPO.load(
+        model = model_class.load(
             model_path,
             env=env,
             device=exp_config["device"],
@@ -161,7 +169,7 @@ def test_from_file(
                 model_path = os.path.join(model_snapshots_folder, model_path)
                 break
         # load model from file
-        model = PPO.load(
+        model = model_class.load(
             model_path,
             env=env,
             device=exp_config["device"],
@@ -178,6 +186,7 @@ def test_from_file(
         deterministic=deterministic,
         exp_folder_path=exp_folder_path,
         verbosity=1,
+        action_masking=action_masking,
     )
 
 def train_and_test_agent(
@@ -196,6 +205,7 @@ def train_and_test_agent(
         n_steps: int = 50_000,
         batch_size: int = 1000,
         learning_rate: float = 0.0003,
+        action_masking: bool = False,
         # parallelization settings
         n_envs: int = 3000,
         device: str = "cuda",
@@ -236,6 +246,7 @@ def train_and_test_agent(
         n_steps=n_steps,
         batch_size=batch_size,
         learning_rate=learning_rate,
+        action_masking=action_masking,
         # parallelization settings
         n_envs=n_envs,
         device=device,
@@ -258,6 +269,7 @@ def train_and_test_agent(
             initial_scramble_length=start_scramble_depth,
             success_threshold=success_threshold,
             reward_func=reward_func,
+            action_masking=action_masking,
     )
 
     test_agent(
@@ -269,6 +281,7 @@ def train_and_test_agent(
         exp_folder_path=exp_folder_path,
         deterministic=False,
         verbosity=1,
+        action_masking=action_masking,
     )
     return exp_folder_path
 
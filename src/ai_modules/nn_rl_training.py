@@ -12,14 +12,15 @@ from stable_baselines3 import PPO
 from stable_baselines3.common.monitor import Monitor 
 from stable_baselines3.common.callbacks import CheckpointCallback
 from stable_baselines3.common.env_util import make_vec_env
+from stable_baselines3.common.vec_env import VecMonitor
 # vecenv, only for typehinting
 from stable_baselines3.common.vec_env import VecEnv
 
 try:
-    from nn_rl_environment import Twisty_Puzzle_Env, Update_Scramble_Length_Callback, EarlyStopCallback, permutation_cycles_to_tensor, STICKER_DTYPE
+    from nn_rl_environment import Twisty_Puzzle_Env, Twisty_Puzzle_VecEnv, Update_Scramble_Length_Callback, EarlyStopCallback, permutation_cycles_to_tensor, get_move_algebras, STICKER_DTYPE
     from nn_rl_reward_factories import binary_reward_factory, multi_binary_reward_factory, correct_points_reward_factory, most_correct_points_reward_factory, sparse_most_correct_points_reward_factory
 except ModuleNotFoundError:
-    from .nn_rl_environment import Twisty_Puzzle_Env, Update_Scramble_Length_Callback, EarlyStopCallback, permutation_cycles_to_tensor, STICKER_DTYPE
+    from .nn_rl_environment import Twisty_Puzzle_Env, Twisty_Puzzle_VecEnv, Update_Scramble_Length_Callback, EarlyStopCallback, permutation_cycles_to_tensor, get_move_algebras, STICKER_DTYPE
     from .nn_rl_reward_factories import binary_reward_factory, correct_points_reward_factory, most_correct_points_reward_factory, sparse_most_correct_points_reward_factory
 
 def train_agent(
@@ -38,8 +39,10 @@ def train_agent(
         n_steps: int = 20_000,
         batch_size: int = 10000,
         learning_rate: float = 0.0003,
+        action_masking: bool = False,
         # parallelization settings
         n_envs: int = 5000,
+        batched_env: bool = True,
         device: str = "cuda",
         verbosity: int = 1,
     ) -> tuple[str, torch.nn.Module, VecEnv]:
@@ -58,7 +61,9 @@ def train_agent(
         n_steps (int, optional): number of steps to train the model. Defaults to 20,000.
         batch_size (int, optional): batch size for training (= number of steps between model updates). Defaults to 10,000.
         learning_rate (float, optional): learning rate for the optimizer. Defaults to 0.0003.
+        action_masking (bool, optional): whether to train with maskable PPO (requires `sb3_contrib`). The agent then never chooses redundant actions like the inverse of its previous action (see `Twisty_Puzzle_Env.action_masks`). Defaults to False.
         n_envs (int, optional): number of parallel environments to use. Defaults to 5,000.
+        batched_env (bool, optional): whether to simulate all environments in one `Twisty_Puzzle_VecEnv` (fast) instead of `n_envs` separate `Twisty_Puzzle_Env`s. Defaults to True.
         device (str, optional): device to use for training (usually "cuda" or "cpu"). Defaults to "cuda".
         verbosity (int, optional): verbosity level for training output. Defaults to 1.
         
@@ -85,6 +90,12 @@ def train_agent(
         reward=reward)
 
     exp_identifier = f"{puzzle_name}_rew={reward}_sd={start_scramble_depth}_st={success_threshold}_eps={n_steps}_lr={learning_rate}_bs={batch_size}_ne={n_envs}"
+    # calculate the move automata once and share them between all environments
+    scramble_move_algebra, action_move_algebra = get_move_algebras(
+        solved_state,
+        actions_dict,
+        base_actions=base_actions,
+        action_masking=action_masking)
     def make_env():
         env = Twisty_Puzzle_Env(
                 solved_state,
@@ -95,12 +106,31 @@ def train_agent(
                 min_scramble_length=min_scramble_length,
                 success_threshold=success_threshold,
                 reward_func=reward_func,
+                action_masking=action_masking,
+                scramble_move_algebra=scramble_move_algebra,
+                action_move_algebra=action_move_algebra,
         )
         # env.scramble_length = start_scramble_depth
         monitor_env = Monitor(env)
         env.monitor = monitor_env
         return monitor_env
-    vec_env = make_vec_env(make_env, n_envs=n_envs)
+    if batched_env:
+        vec_env = VecMonitor(Twisty_Puzzle_VecEnv(
+                n_envs,
+                solved_state,
+                actions_dict,
+                base_actions=base_actions,
+                max_moves=max_moves,
+                initial_scramble_length=start_scramble_depth,
+                min_scramble_length=min_scramble_length,
+                success_threshold=success_threshold,
+                reward_func=reward_func,
+                action_masking=action_masking,
+                scramble_move_algebra=scramble_move_algebra,
+                action_move_algebra=action_move_algebra,
+        ))
+    else:
+        vec_env = make_vec_env(make_env, n_envs=n_envs)
     training_info: dict[str, str | int | float] = {
         # what model was trained
         "puzzle_name": puzzle_name,
@@ -117,12 +147,15 @@ def train_agent(
         "n_steps": n_steps,
         "learning_rate": learning_rate,
         "batch_size": batch_size,
+        "action_masking": action_masking,
         # parallelization settings
         "n_envs": n_envs,
+        "batched_env": batched_env,
         "device": device,
         "training_start": exp_folder,
     }
     # env
+    model_class: type = get_model_class(action_masking)
     if load_model:
         load_models_folder: str = os.path.join("src", "ai_files", puzzle_name, load_model, "model_snapshots")
         # load model with highest step count to continue training
@@ -134,7 +167,7 @@ def train_agent(
         model_path.strip(".zip")
         model_path = os.path.join(load_models_folder, model_path)
         print(f"Loading model from {model_path}...")
-        model = PPO.load(
+        model = model_class.load(
             model_path,
             env=vec_env,
             batch_size=batch_size,
@@ -147,7 +180,7 @@ def train_agent(
         training_info = {"continued_training_from": model_path, **training_info}
     else:
         print("Training new model...")
-        model = PPO(
+        model = model_class(
             "MlpPolicy",
             env=vec_env,
             batch_size=batch_size,
@@ -218,6 +251,22 @@ def train_agent(
 #     exp_identifier = f"{puzzle_name}_rew={reward}_sd={start_scramble_depth}_st={success_threshold}_eps={n_steps}"
 #     return exp_identifier
 
+def get_model_class(action_masking: bool = False) -> type:
+    """
+    Get the RL algorithm used to train and load agents.
+
+    Args:
+        action_masking (bool, optional): whether to use maskable PPO, which only chooses actions allowed by the environment's `action_masks` method. Defaults to False.
+
+    Returns:
+        type: `PPO` or `sb3_contrib.MaskablePPO`
+    """
+    if not action_masking:
+        return PPO
+    # optional dependency, only needed for training with action masking
+    from sb3_contrib import MaskablePPO
+    return MaskablePPO
+
 def save_training_info(
         exp_folder_path: str,
         puzzle_name: str = "",
@@ -273,7 +322,7 @@ def load_puzzle(puzzle_name: str) -> tuple[list[int], dict[str, list[list[int]]]
         dict[str, list[tuple[int, ...]]]: dictionary of actions (name -> permutation in cycle notation)
     """
     try:
-        from src.interaction_modules.load_from_xml import load_puzzle as load_xml_puzzle
+        from src.puzzle_model import Puzzle_Model
     except ImportError:
         import sys
         import os
@@ -281,17 +330,15 @@ def load_puzzle(puzzle_name: str) -> tuple[list[int], dict[str, list[list[int]]]
         project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')) 
         # Add the project root and the C directory to the Python path
         sys.path.insert(0, project_root)
-        from src.interaction_modules.load_from_xml import load_puzzle as load_xml_puzzle
+        from src.puzzle_model import Puzzle_Model
     try:
-        point_dicts, actions_dict, state_space_size = load_xml_puzzle(puzzle_name)
+        puzzle = Puzzle_Model(puzzle_name)
     except FileNotFoundError:
         raise FileNotFoundError(f"Could not find the puzzle '{puzzle_name}'.")
+    actions_dict = puzzle.moves
     # convert point colors to solved state for the environment
-    # point_dicts: list[dict[str, tuple[vpy.vector, vpy.vector, float]]]
-    #     list includes position, color and size (for visualization) of each point
-    #     convert to color index for each point
-    point_colors = [point["vpy_color"] for point in point_dicts]
-    point_colors = [(color.x, color.y, color.z) for color in point_colors]
+    #     convert (r, g, b) color of each point to color index
+    point_colors = [tuple(color) for color in puzzle.point_colors.tolist()]
     colors = list(set(point_colors))
     solved_state: list[int] = [colors.index(color) for color in point_colors]
     return solved_state, actions_dict
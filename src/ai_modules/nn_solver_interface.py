@@ -10,10 +10,11 @@ from tkinter.filedialog import askopenfilename
 
 import gymnasium as gym
 import numpy as np
+import torch
 from stable_baselines3 import PPO
 
 from .nn_rl_environment import Twisty_Puzzle_Env, puzzle_info_to_np
-from .nn_rl_training import setup_training, get_action_index_to_name
+from .nn_rl_training import setup_training, get_action_index_to_name, get_model_class
 from src.algorithm_generation.algorithm_generation import get_inverse_moves_dict
 
 # AI_FILES_FOLDER_NAME: str = "ai_files"
@@ -38,6 +39,7 @@ class NN_Solver():
             model_path (str): path to the trained model or puzzle name. If only a puzzle name is given, load the latest model for that puzzle. Otherwise, load the model from the given path.
         """
         self.solved_state: list[int] = SOLVED_STATE
+        self.SOLVED_STATE: list[int] = SOLVED_STATE # common interface with the other solvers
         self.actions_dict: dict[str, list[list[int]]] = ACTIONS_DICT
 
         self.np_solved_state, self.np_actions, _ = puzzle_info_to_np(SOLVED_STATE, ACTIONS_DICT, base_actions=None)
@@ -56,7 +58,8 @@ class NN_Solver():
             exp_folder_path=exp_folder_path)
         self.model: PPO = load_model(
             model_path=model_path,
-            env=self.env)
+            env=self.env,
+            action_masking=load_training_info(exp_folder_path).get("action_masking", False))
 
     def choose_action(self, state: list[int]) -> str:
         """
@@ -82,6 +85,33 @@ class NN_Solver():
         #         action_name: str = self.inverse_moves_dict[action_name]
         return action_name
 
+    def get_state_value(self, state: list[int] | tuple[int]) -> float:
+        """
+        Estimate the value of the given state using the value network of `self.model`.
+
+        Args:
+            state (list[int] | tuple[int]): the state of the puzzle as list of color indices
+
+        Returns:
+            float: the estimated value of the state
+        """
+        return float(self.get_state_values(np.array([state]))[0])
+
+    def get_state_values(self, states: np.ndarray) -> np.ndarray:
+        """
+        Estimate the values of many states with a single forward pass of the value network of `self.model`.
+
+        Args:
+            states (np.ndarray): the states of the puzzle as color indices with shape (n_states, n_points)
+
+        Returns:
+            np.ndarray: the estimated value of each state
+        """
+        obs_tensor, _ = self.model.policy.obs_to_tensor(np.asarray(states))
+        with torch.no_grad():
+            values = self.model.policy.predict_values(obs_tensor)
+        return values.cpu().numpy().reshape(-1)
+
 def load_environment(
             solved_state: list[int],
             actions_dict: dict[str, list[list[int]]],
@@ -91,8 +121,7 @@ def load_environment(
     Load puzzle environment from the given path
     """
     # load experiment configuration
-    with open(os.path.join(exp_folder_path, "training_info.json"), "r") as file:
-        exp_config: dict = json.load(file)
+    exp_config: dict = load_training_info(exp_folder_path)
     # get puzzle name as parent folder of exp_folder_path
     # if not MODEL_SNAPSHOT_FOLDER_NAME in exp_folder_path:
     try:
@@ -123,16 +152,30 @@ def load_environment(
     )
     return env, reward_func
 
-def load_model(model_path: str, env: gym.Env) -> PPO:
+def load_training_info(exp_folder_path: str) -> dict:
+    """
+    Load the configuration of a training run.
+
+    Args:
+        exp_folder_path (str): path to the experiment folder
+
+    Returns:
+        dict: contents of `training_info.json` in the experiment folder
+    """
+    with open(os.path.join(exp_folder_path, "training_info.json"), "r") as file:
+        return json.load(file)
+
+def load_model(model_path: str, env: gym.Env, action_masking: bool = False) -> PPO:
     """
     Load a model from a file.
     
     Args:
         model_path (str): path to the model file or an experiment folder path
         env (gym.Env): the environment to use the model in
+        action_masking (bool, optional): whether the model was trained with maskable PPO. Defaults to False.
     
     Returns:
-        PPO: the loaded model instance as sb3.PPO object
+        PPO: the loaded model instance as sb3.PPO object (or sb3_contrib.MaskablePPO object)
     """
     if not MODEL_SNAPSHOT_FOLDER_NAME in model_path:
         exp_folder_path: str = model_path
@@ -142,7 +185,7 @@ def load_model(model_path: str, env: gym.Env) -> PPO:
         model_file: str = model_files[-1]
         model_path = os.path.join(models_path, model_file)
     # load the model
-    model = PPO.load(
+    model = get_model_class(action_masking).load(
         model_path,
         env=env,
         device="auto",
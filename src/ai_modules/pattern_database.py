@@ -0,0 +1,343 @@
+"""
+This module implements pattern databases as admissible heuristics for the puzzle solvers.
+
+Each pattern database projects the puzzle onto the points of one piece orbit (see `orbit_calculation.calculate_piece_orbits`). Piece orbits are closed under all moves, so the projection of a state is a state of a smaller puzzle. A breadth-first search backwards from the solved state calculates the number of moves needed to solve every state of the smaller puzzle. Solving the whole puzzle takes at least as many moves as solving any projection, so the maximum of these distances is an admissible heuristic.
+
+Distances are stored as `State_Table`s, saved to `src/puzzles/<puzzle_name>/pattern_databases/<key>/` and memory-mapped when loaded. The key is a hash of `puzzle_definition.xml` (see `Puzzle_Analysis_Cache`), the moves, the solved state, the pieces and `max_states`, so databases built for a different puzzle definition or different parameters are never loaded. Only the databases of the latest key are kept. The info file listing the databases is written last, so an interrupted export never leaves an incomplete set of databases that would be loaded.
+
+Author: Sebastian Jost
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .permutation_engine import Permutation_Engine, invert_index_array
+from .state_table import State_Table, Hashed_State_Table, Sorted_State_Table, state_table_exists, first_occurrences
+from src.algorithm_generation.orbit_calculation import calculate_point_orbits, calculate_piece_orbits
+from src.puzzle_analysis_modules.piece_detection_v2 import detect_pieces
+from src.puzzle_analysis_modules.analysis_cache import Puzzle_Analysis_Cache, get_inputs_hash
+
+PATTERN_DATABASES_FOLDER_NAME: str = "pattern_databases"
+PATTERN_DATABASES_INFO_FILE_NAME: str = "pattern_databases_info.json"
+
+
+class Pattern_Database:
+    """
+    Number of moves needed to solve the projection of the puzzle onto a subset of its points.
+
+    Args:
+        points (list[int]): the points of the projection. The set of points must be closed under all moves.
+        distances (State_Table): maps projected states to their distance from the solved state
+        max_depth (int): all projected states with at most this distance are stored in `distances`
+    """
+    def __init__(self,
+            points: list[int],
+            distances: State_Table,
+            max_depth: int,
+            ):
+        self.points: np.ndarray = np.array(points, dtype=np.int64)
+        self.distances: State_Table = distances
+        self.max_depth: int = max_depth
+
+    def get_distances(self, states: np.ndarray) -> np.ndarray:
+        """
+        Get lower bounds for the number of moves needed to solve the given states.
+
+        Args:
+            states (np.ndarray): states of the whole puzzle with shape (n_states, n_points)
+
+        Returns:
+            np.ndarray: the distance of each projected state from the solved state. States that were not reached by the search have distance `max_depth + 1`.
+        """
+        return self.distances.get_many(np.asarray(states)[:, self.points], default=self.max_depth + 1)
+
+    @staticmethod
+    def build(
+            points: list[int],
+            move_arrays: np.ndarray,
+            solved_state: list[int],
+            n_colors: int,
+            max_states: int = 1_000_000,
+            chunk_size: int = 16_384,
+            ) -> "Pattern_Database":
+        """
+        Calculate the distances of all projected states from the solved state using a breadth-first search that applies the inverse moves starting at the solved state.
+
+        Args:
+            points (list[int]): the points of the projection. The set of points must be closed under all moves.
+            move_arrays (np.ndarray): moves of the whole puzzle as stacked index arrays
+            solved_state (list[int]): the solved state of the whole puzzle
+            n_colors (int): number of different colors
+            max_states (int, optional): maximum number of projected states. The search stops once this number is reached, possibly in the middle of a layer. Defaults to 1,000,000.
+            chunk_size (int, optional): number of states of a layer that are expanded at once. Limits the memory used by the search. Defaults to 16,384.
+
+        Returns:
+            Pattern_Database: the pattern database of the projection
+
+        Raises:
+            ValueError: if the points are not closed under all moves
+        """
+        points = np.array(points, dtype=np.int64)
+        projected_moves: np.ndarray = project_move_arrays(move_arrays, points)
+        inverse_moves: np.ndarray = np.array([invert_index_array(move) for move in projected_moves])
+        layer: np.ndarray = np.array(solved_state)[points][None]
+        distances: Hashed_State_Table = Hashed_State_Table(len(points), n_colors)
+        distances.set_many(layer, np.zeros(1))
+        depth: int = 0
+        while len(layer) > 0 and len(distances) < max_states:
+            next_layer: list[np.ndarray] = []
+            for start in range(0, len(layer), chunk_size):
+                children: np.ndarray = layer[start:start+chunk_size, inverse_moves].reshape(-1, len(points))
+                children = children[distances.get_many(children, default=-1) < 0]
+                children = children[first_occurrences(distances.encoder.encode(children))]
+                # states that are not stored get distance `max_depth + 1`, so truncating a layer keeps the heuristic admissible
+                children = children[:max_states - len(distances)]
+                distances.set_many(children, np.full(len(children), depth + 1))
+                next_layer.append(children)
+            layer = np.concatenate(next_layer)
+            if len(layer) == 0 or len(distances) >= max_states:
+                break
+            depth += 1
+        return Pattern_Database(points, distances, max_depth=depth)
+
+
+class Pattern_Database_Solver():
+    def __init__(self,
+            ACTIONS_DICT: dict[str, list[list[int]]],
+            SOLVED_STATE: list[int],
+            puzzle_name: str = None,
+            pieces: list[set[int]] = None,
+            max_states: int = 1_000_000,
+            keep_databases: bool = True,
+        ):
+        """
+        Initialize a solver using pattern databases of all piece orbits as heuristic.
+        This class implements the common interface for puzzle solvers (`get_state_value`, `get_state_values` and `choose_action`).
+
+        Args:
+            ACTIONS_DICT (dict[str, list[list[int]]]): dictionary containing available moves as permutations in cyclic form
+            SOLVED_STATE (list[int]): the solved state of the puzzle as list of color indices
+            puzzle_name (str, optional): name of the puzzle. Used to save and load the pattern databases. Defaults to None (databases are neither saved nor loaded). Databases are also not saved if the puzzle has no definition file.
+            pieces (list[set[int]], optional): the pieces of the puzzle. Calculated with `detect_pieces` if not given. Defaults to None.
+            max_states (int, optional): maximum number of states in each pattern database. Defaults to 1,000,000.
+            keep_databases (bool, optional): whether to load previously saved pattern databases. Defaults to True.
+        """
+        self.name: str | None = puzzle_name
+        self.ACTIONS_DICT: dict[str, list[list[int]]] = ACTIONS_DICT
+        self.ACTION_KEYS: list[str] = list(ACTIONS_DICT.keys())
+        self.SOLVED_STATE: list[int] = SOLVED_STATE
+        self.permutation_engine: Permutation_Engine = Permutation_Engine(ACTIONS_DICT, len(SOLVED_STATE))
+
+        # saved databases are only used for the same puzzle definition, moves, solved state and parameters
+        self.databases_key: str | None = None
+        if self.name is not None:
+            self.databases_key = get_pattern_databases_key(self.name, ACTIONS_DICT, SOLVED_STATE, pieces, max_states)
+
+        self.pattern_databases: list[Pattern_Database] | None = None
+        if keep_databases and self.databases_key is not None:
+            self.pattern_databases = self.import_pattern_databases()
+        if self.pattern_databases is None:
+            self.pattern_databases = self.build_pattern_databases(pieces=pieces, max_states=max_states)
+            if self.databases_key is not None:
+                self.export_pattern_databases()
+
+    def build_pattern_databases(self, pieces: list[set[int]] = None, max_states: int = 1_000_000) -> list[Pattern_Database]:
+        """
+        Build one pattern database for each piece orbit of the puzzle.
+
+        Args:
+            pieces (list[set[int]], optional): the pieces of the puzzle. Calculated with `detect_pieces` if not given. Defaults to None.
+            max_states (int, optional): maximum number of states in each pattern database. Defaults to 1,000,000.
+
+        Returns:
+            list[Pattern_Database]: pattern databases of all piece orbits with more than one state
+        """
+        n_points: int = len(self.SOLVED_STATE)
+        if pieces is None and self.name is not None:
+            # pieces and their orbits are cached next to the puzzle definition
+            piece_orbits: list[list[set[int]]] = Puzzle_Analysis_Cache(self.name).get_piece_orbits(self.ACTIONS_DICT, n_points)
+        else:
+            if pieces is None:
+                pieces = detect_pieces(self.ACTIONS_DICT, n_points)
+            point_orbits: list[set[int]] = calculate_point_orbits(
+                n_points=n_points,
+                moves=self.permutation_engine.move_arrays,
+            )
+            piece_orbits: list[list[set[int]]] = calculate_piece_orbits(pieces=pieces, point_orbits=point_orbits)
+        pattern_databases: list[Pattern_Database] = []
+        for piece_orbit in piece_orbits:
+            points: list[int] = sorted(set().union(*piece_orbit))
+            pattern_database: Pattern_Database = Pattern_Database.build(
+                points,
+                self.permutation_engine.move_arrays,
+                self.SOLVED_STATE,
+                n_colors=max(self.SOLVED_STATE) + 1,
+                max_states=max_states,
+            )
+            if pattern_database.max_depth > 0: # projections that are always solved do not help
+                pattern_databases.append(pattern_database)
+        return pattern_databases
+
+    def get_lower_bounds(self, states: np.ndarray) -> np.ndarray:
+        """
+        Calculate lower bounds for the number of moves needed to solve the given states as the maximum distance given by any pattern database.
+
+        Args:
+            states (np.ndarray): the states of the puzzle with shape (n_states, n_points)
+
+        Returns:
+            np.ndarray: lower bound for the number of moves needed to solve each state
+        """
+        lower_bounds: np.ndarray = np.zeros(len(states), dtype=np.float32)
+        for pattern_database in self.pattern_databases:
+            lower_bounds = np.maximum(lower_bounds, pattern_database.get_distances(states))
+        return lower_bounds
+
+    def get_state_value(self, state: tuple[int]) -> float:
+        """
+        Return the value of the given state as the negative lower bound for the number of moves needed to solve it.
+
+        Args:
+            state (tuple[int]): The state of the puzzle as a tuple of integers.
+
+        Returns:
+            float: The value of the given state. Higher values are better.
+        """
+        return float(self.get_state_values(np.array([state]))[0])
+
+    def get_state_values(self, states: np.ndarray) -> np.ndarray:
+        """
+        Return the values of many states at once as the negative lower bounds for the number of moves needed to solve them.
+
+        Args:
+            states (np.ndarray): The states of the puzzle with shape (n_states, n_points).
+
+        Returns:
+            np.ndarray: The values of the given states. Higher values are better.
+        """
+        return -self.get_lower_bounds(states)
+
+    def choose_action(self, state: list[int]) -> str:
+        """
+        Choose the action leading to the state with the lowest lower bound. If multiple actions have the same value, choose the first one.
+
+        Args:
+            state (list[int]): the current state of the puzzle
+
+        Returns:
+            str: the name of the chosen action
+        """
+        next_states: np.ndarray = self.permutation_engine.apply_all(np.array(state))
+        return self.permutation_engine.move_names[int(np.argmax(self.get_state_values(next_states)))]
+
+    def export_pattern_databases(self) -> None:
+        """
+        Save all pattern databases to `src/puzzles/<puzzle_name>/pattern_databases/<key>/` and remove databases saved with other keys.
+        """
+        databases_folder: str = get_pattern_databases_folder(self.name)
+        folder_path: str = os.path.join(databases_folder, self.databases_key[:16])
+        os.makedirs(folder_path, exist_ok=True)
+        for i, pattern_database in enumerate(self.pattern_databases):
+            pattern_database.distances.save(os.path.join(folder_path, f"pattern_database_{i}"))
+        # write the info file last, so that incomplete exports are never loaded
+        info_path: str = os.path.join(folder_path, PATTERN_DATABASES_INFO_FILE_NAME)
+        with open(info_path + ".tmp", "w") as file:
+            json.dump({
+                "key": self.databases_key,
+                "action_keys": self.ACTION_KEYS,
+                "points": [pattern_database.points.tolist() for pattern_database in self.pattern_databases],
+                "max_depths": [pattern_database.max_depth for pattern_database in self.pattern_databases],
+            }, file)
+        os.replace(info_path + ".tmp", info_path)
+        # remove outdated databases (including files saved before databases were stored by key)
+        for file_name in os.listdir(databases_folder):
+            path: str = os.path.join(databases_folder, file_name)
+            if file_name == self.databases_key[:16]:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def import_pattern_databases(self) -> list[Pattern_Database] | None:
+        """
+        Load the pattern databases saved for this puzzle. The distances are memory-mapped.
+
+        Returns:
+            list[Pattern_Database] | None: the loaded pattern databases or None if no databases were saved for this puzzle definition, moves, solved state and parameters
+        """
+        folder_path: str = os.path.join(get_pattern_databases_folder(self.name), self.databases_key[:16])
+        try:
+            with open(os.path.join(folder_path, PATTERN_DATABASES_INFO_FILE_NAME), "r") as file:
+                info: dict = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if info.get("key") != self.databases_key:
+            return None
+        pattern_databases: list[Pattern_Database] = []
+        for i, (points, max_depth) in enumerate(zip(info["points"], info["max_depths"])):
+            path: str = os.path.join(folder_path, f"pattern_database_{i}")
+            if not state_table_exists(path):
+                return None
+            pattern_databases.append(Pattern_Database(points, Sorted_State_Table(path), max_depth))
+        return pattern_databases
+
+
+def project_move_arrays(move_arrays: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Restrict moves given as index arrays to a subset of points. The points are renumbered in the given order.
+
+    Args:
+        move_arrays (np.ndarray): moves of the whole puzzle as stacked index arrays
+        points (np.ndarray): the points of the projection
+
+    Returns:
+        np.ndarray: the projected moves as stacked index arrays with shape (n_moves, len(points))
+
+    Raises:
+        ValueError: if the points are not closed under all moves
+    """
+    moved_points: np.ndarray = move_arrays[:, points]
+    if not np.isin(moved_points, points).all():
+        raise ValueError("The given points are not closed under all moves.")
+    point_indices: np.ndarray = np.zeros(move_arrays.shape[1], dtype=move_arrays.dtype)
+    point_indices[points] = np.arange(len(points))
+    return point_indices[moved_points]
+
+def get_pattern_databases_key(
+        puzzle_name: str,
+        ACTIONS_DICT: dict[str, list[list[int]]],
+        SOLVED_STATE: list[int],
+        pieces: list[set[int]] | None,
+        max_states: int,
+    ) -> str | None:
+    """
+    Calculate the key identifying pattern databases built for the given puzzle and parameters.
+
+    Args:
+        puzzle_name (str): name of the puzzle
+        ACTIONS_DICT (dict[str, list[list[int]]]): dictionary containing available moves as permutations in cyclic form
+        SOLVED_STATE (list[int]): the solved state of the puzzle as list of color indices
+        pieces (list[set[int]] | None): the pieces of the puzzle or None if they are calculated with `detect_pieces`
+        max_states (int): maximum number of states in each pattern database
+
+    Returns:
+        str | None: SHA-256 hash of the puzzle definition and all inputs. None if the puzzle has no definition file.
+    """
+    content_hash: str | None = Puzzle_Analysis_Cache(puzzle_name).content_hash
+    if content_hash is None:
+        return None
+    encoded_pieces: list[list[int]] | None = None if pieces is None else [sorted(int(i) for i in piece) for piece in pieces]
+    return get_inputs_hash((content_hash, ACTIONS_DICT, SOLVED_STATE, encoded_pieces, max_states))
+
+def get_pattern_databases_folder(puzzle_name: str) -> str:
+    """
+    Returns:
+        str: path of the folder storing the pattern databases of the given puzzle
+    """
+    return os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, PATTERN_DATABASES_FOLDER_NAME)
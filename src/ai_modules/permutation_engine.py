@@ -0,0 +1,270 @@
+"""
+This module implements an array-based permutation engine for twisty puzzles.
+
+Each move is compiled once from its cycles into an index array. Applying a move to a state is then a single gather `state[perm]` instead of swapping list elements cycle by cycle. This follows the same convention as `perform_action` and `nn_rl_environment.permutation_cycles_to_tensor`.
+
+Author: Sebastian Jost
+"""
+from math import lcm
+
+import numpy as np
+
+
+# uint16 is sufficient for puzzles with up to 65536 points (see `check_n_points`)
+INDEX_DTYPE: np.dtype = np.uint16
+
+
+class Permutation_Engine:
+    """
+    Compile the moves of a puzzle into index arrays and apply them to single states or batches of states.
+
+    Args:
+        actions_dict (dict[str, list[list[int]]]): the puzzle's moves given as names and permutations in cyclic form
+        n_points (int): number of points of the puzzle (length of a state)
+    """
+    def __init__(self,
+            actions_dict: dict[str, list[list[int]]],
+            n_points: int,
+            ):
+        check_n_points(n_points)
+        self.n_points: int = n_points
+        self.move_names: list[str] = list(actions_dict.keys())
+        self.move_indices: dict[str, int] = {name: i for i, name in enumerate(self.move_names)}
+        # stacked index arrays of all moves, one move per row
+        self.move_arrays: np.ndarray = np.stack(
+            [move_to_index_array(actions_dict[name], n_points) for name in self.move_names]
+        ) if self.move_names else np.empty((0, n_points), dtype=INDEX_DTYPE)
+        self.identity: np.ndarray = np.arange(n_points, dtype=INDEX_DTYPE)
+
+    def get_move_array(self, move_name: str) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: index array of the given move
+        """
+        return self.move_arrays[self.move_indices[move_name]]
+
+    def apply(self, state: np.ndarray, move_name: str) -> np.ndarray:
+        """
+        Apply a move to a state out-of-place.
+
+        Args:
+            state (np.ndarray): the state to apply the move to. It is not changed.
+            move_name (str): name of the move
+
+        Returns:
+            np.ndarray: the new state
+        """
+        return state[self.get_move_array(move_name)]
+
+    def apply_inplace(self, state: np.ndarray, move_name: str) -> np.ndarray:
+        """
+        Apply a move to a state in-place.
+
+        Args:
+            state (np.ndarray): the state to apply the move to. It is changed in-place.
+            move_name (str): name of the move
+
+        Returns:
+            np.ndarray: the changed state
+        """
+        state[:] = state[self.get_move_array(move_name)]
+        return state
+
+    def apply_sequence(self, state: np.ndarray, move_sequence: list[str]) -> np.ndarray:
+        """
+        Apply a sequence of moves to a state out-of-place by composing the moves first.
+
+        Args:
+            state (np.ndarray): the state to apply the moves to. It is not changed.
+            move_sequence (list[str]): sequence of move names
+
+        Returns:
+            np.ndarray: the new state
+        """
+        return state[self.compose(move_sequence)]
+
+    def apply_batch(self, states: np.ndarray, move_indices: np.ndarray) -> np.ndarray:
+        """
+        Apply one move to each state of a batch with a single gather.
+
+        Args:
+            states (np.ndarray): states with shape `(n_states, n_points)`
+            move_indices (np.ndarray): index of the move to apply to each state, shape `(n_states,)`
+
+        Returns:
+            np.ndarray: the new states with shape `(n_states, n_points)`
+        """
+        return np.take_along_axis(states, self.move_arrays[move_indices], axis=1)
+
+    def apply_all(self, state: np.ndarray) -> np.ndarray:
+        """
+        Apply every move to the given state.
+
+        Args:
+            state (np.ndarray): the state to apply the moves to
+
+        Returns:
+            np.ndarray: all successor states with shape `(n_moves, n_points)`. Row `i` is the result of move `self.move_names[i]`.
+        """
+        return state[self.move_arrays]
+
+    def compose(self, move_sequence: list[str]) -> np.ndarray:
+        """
+        Compose a sequence of moves into one index array.
+
+        Args:
+            move_sequence (list[str]): sequence of move names
+
+        Returns:
+            np.ndarray: the permutation of the whole sequence
+        """
+        permutation: np.ndarray = self.identity
+        for move_name in move_sequence:
+            permutation = permutation[self.get_move_array(move_name)]
+        return permutation
+
+    def invert(self, move_name: str) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: index array of the inverse of the given move
+        """
+        return invert_index_array(self.get_move_array(move_name))
+
+    def order(self, move_name: str) -> int:
+        """
+        Returns:
+            int: order of the given move
+        """
+        return permutation_order(self.get_move_array(move_name))
+
+    def as_actions_dict(self) -> dict[str, np.ndarray]:
+        """
+        Compatibility shim for code written for `ACTIONS_DICT`s with moves in cyclic form: `perform_action` and `smart_scramble.get_action_order` also accept index arrays, so the returned dictionary can replace such an `ACTIONS_DICT`.
+
+        Returns:
+            dict[str, np.ndarray]: dictionary mapping move names to their index arrays
+        """
+        return {name: self.move_arrays[i] for name, i in self.move_indices.items()}
+
+
+def move_to_index_array(move, n_points: int) -> np.ndarray:
+    """
+    Convert a move to an index array.
+
+    Args:
+        move (list[list[int]] | Permutation): move given in cyclic form or as sympy permutation
+        n_points (int): number of points of the puzzle
+
+    Returns:
+        np.ndarray: the move as index array
+
+    Raises:
+        ValueError: if point indices of `n_points` points do not fit into `INDEX_DTYPE`
+    """
+    check_n_points(n_points)
+    permutation: np.ndarray = np.arange(n_points, dtype=INDEX_DTYPE)
+    if hasattr(move, "array_form"): # sympy permutation
+        array_form: list[int] = move.array_form
+        permutation[:len(array_form)] = array_form
+        return permutation
+    for cycle in move:
+        for j, element in enumerate(cycle):
+            permutation[element] = cycle[(j+1) % len(cycle)]
+    return permutation
+
+def to_index_array(permutation, n_points: int) -> np.ndarray:
+    """
+    Convert a permutation to an index array unless it already is one.
+
+    Args:
+        permutation (np.ndarray | list[list[int]] | Permutation): permutation as index array, in cyclic form or as sympy permutation
+        n_points (int): number of points the permutation acts on
+
+    Returns:
+        np.ndarray: the permutation as index array
+
+    Raises:
+        ValueError: if point indices of `n_points` points do not fit into `INDEX_DTYPE`
+    """
+    if isinstance(permutation, np.ndarray):
+        check_n_points(len(permutation))
+        return permutation
+    return move_to_index_array(permutation, n_points)
+
+def check_n_points(n_points: int) -> None:
+    """
+    Check that all point indices of a puzzle can be stored as `INDEX_DTYPE`. Larger indices would silently wrap around and corrupt all permutations.
+
+    Args:
+        n_points (int): number of points of the puzzle
+
+    Raises:
+        ValueError: if the puzzle has more than `np.iinfo(INDEX_DTYPE).max + 1` points
+    """
+    max_points: int = int(np.iinfo(INDEX_DTYPE).max) + 1
+    if n_points > max_points:
+        raise ValueError(f"Puzzles with more than {max_points} points are not supported, got {n_points} points.")
+
+def compose_index_arrays(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Compose two permutations given as index arrays.
+
+    Args:
+        first (np.ndarray): permutation that is applied first
+        second (np.ndarray): permutation that is applied second
+
+    Returns:
+        np.ndarray: permutation equivalent to applying `first`, then `second`
+    """
+    return first[second]
+
+def invert_index_array(permutation: np.ndarray) -> np.ndarray:
+    """
+    Calculate the inverse of a permutation given as index array.
+
+    Args:
+        permutation (np.ndarray): permutation as index array
+
+    Returns:
+        np.ndarray: the inverse permutation
+    """
+    inverse: np.ndarray = np.empty_like(permutation)
+    inverse[permutation] = np.arange(len(permutation), dtype=permutation.dtype)
+    return inverse
+
+def index_array_to_cycles(permutation: np.ndarray) -> list[list[int]]:
+    """
+    Calculate the cyclic form of a permutation given as index array. Fixed points are omitted.
+
+    Args:
+        permutation (np.ndarray): permutation as index array
+
+    Returns:
+        list[list[int]]: the permutation as list of cycles
+    """
+    perm_list: list[int] = permutation.tolist()
+    visited: list[bool] = [False] * len(perm_list)
+    cycles: list[list[int]] = []
+    for start in np.flatnonzero(permutation != np.arange(len(permutation))).tolist():
+        if visited[start]:
+            continue
+        cycle: list[int] = []
+        point: int = start
+        while not visited[point]:
+            visited[point] = True
+            cycle.append(point)
+            point = perm_list[point]
+        cycles.append(cycle)
+    return cycles
+
+def permutation_order(permutation: np.ndarray) -> int:
+    """
+    Calculate the order of a permutation given as index array as the least common multiple of its cycle lengths.
+
+    Args:
+        permutation (np.ndarray): permutation as index array
+
+    Returns:
+        int: the order of the permutation
+    """
+    return lcm(1, *[len(cycle) for cycle in index_array_to_cycles(permutation)])
@@ -3,7 +3,12 @@ import time
 import random
 import pickle
 from math import ceil, log10
+
+import numpy as np
+
 from .twisty_puzzle_model import scramble, perform_action
+from .move_algebra import Move_Algebra
+from .state_table import Hashed_State_Table, Sorted_State_Table, state_table_exists
 
 class Puzzle_Q_AI():
     def __init__(self,
@@ -38,7 +43,11 @@ class Puzzle_Q_AI():
             self.name = name
             
         self.ACTIONS_DICT = ACTIONS_DICT
+        self.ACTION_KEYS = list(self.ACTIONS_DICT.keys())
         self.SOLVED_STATE = SOLVED_STATE
+        self.N_COLORS = max(SOLVED_STATE) + 1
+        # used to generate scrambles without redundant move sequences
+        self.move_algebra = Move_Algebra.from_actions_dict(self.ACTIONS_DICT, len(SOLVED_STATE))
 
         self.reward_dict = reward_dict
         self.learning_rate = learning_rate
@@ -48,7 +57,7 @@ class Puzzle_Q_AI():
 
         if keep_q_table:
             try:
-                self.q_table = dict()
+                self.q_table = self.new_q_table()
                 self.import_q_table()
             except FileNotFoundError:
                 self.q_table = None
@@ -138,7 +147,7 @@ class Puzzle_Q_AI():
 
                 # generate a starting state by scrambling the solved state
                 start_state = self.SOLVED_STATE[:]
-                scramble(start_state, self.ACTIONS_DICT, max_moves=n_scramble_moves)
+                scramble(start_state, self.ACTIONS_DICT, max_moves=n_scramble_moves, move_algebra=self.move_algebra)
                 # play episode
                 state_hist, action_hist = self.play_episode(
                     start_state,
@@ -209,11 +218,24 @@ class Puzzle_Q_AI():
             self.base_exploration_rate = base_exploration_rate
 
         if self.q_table == None or not keep_q_table: # q_table doesn't exist yet or shall be overwritten
-            self.q_table = dict()    # assign values to every visited state-action pair
+            self.q_table = self.new_q_table()    # assign values to every visited state-action pair
+        elif isinstance(self.q_table, Sorted_State_Table): # imported Q-tables are read-only
+            self.q_table = self.q_table.to_hashed_table()
         # if self.N_table == None or not keep_q_table: # N_table doesn't exist yet or shall be overwritten
         #     self.N_table = dict()    # counting how often each state-action pair was visited
 
 
+    def new_q_table(self) -> Hashed_State_Table:
+        """
+        create an empty Q-table storing states in packed form and the Q-values of all actions of a state in one row
+
+        returns:
+        --------
+            (Hashed_State_Table) - empty Q-table for this puzzle
+        """
+        return Hashed_State_Table(len(self.SOLVED_STATE), self.N_COLORS, action_keys=self.ACTION_KEYS)
+
+
     def get_new_exploration_rate(self,exploration_rate, n, num_episodes):
         """
         function which updates the exploration rate
@@ -300,22 +322,15 @@ class Puzzle_Q_AI():
         state = state_history[-1] # S' = next state after action A
 
         reward = self.get_reward(list(state), n_moves, max_moves=max_moves) # R = Reward
-        next_rewards = [] # Q(S', a') for all actions a'
-        for action in self.ACTIONS_DICT:
-            try:
-                next_rewards.append(self.q_table[(state, action)])
-            except KeyError:
-                # initialize Q-values
-                self.q_table[(state, action)] = 0
-                # self.N_table[(state, action)] = 0
-                next_rewards.append(0)
-
-        if not action in self.q_table.keys():
+        next_rewards = self.q_table.get_values(state, default=0) # Q(S', a') for all actions a'
+
+        if not (prev_state, prev_action) in self.q_table:
+            # initialize Q-values
             self.q_table[(prev_state, prev_action)] = 0
             # self.N_table[(prev_state, prev_action)] = 0
         # actually update the q-value of the considered move
         # Q(S,A) += alpha*(R + gamma * max(S', a') - Q(S,A))
-        self.q_table[(prev_state, prev_action)] += self.learning_rate*(reward + self.discount_factor * max(next_rewards, default=0) - self.q_table[(prev_state, prev_action)])
+        self.q_table[(prev_state, prev_action)] += self.learning_rate*(reward + self.discount_factor * next_rewards.max() - self.q_table[(prev_state, prev_action)])
         # self.N_table[(prev_state, prev_action)] += 1
 
     def get_reward(self,
@@ -372,13 +387,10 @@ class Puzzle_Q_AI():
         if r > exploration_rate:
             # exploit knowledge
             # get the Q-value of each action in the given state
-            action_values = [
-                self.q_table.get((state,action_key), 0)
-                    for action_key in self.ACTIONS_DICT.keys()
-            ]
-            max_value = max(action_values)
+            action_values = self.q_table.get_values(state, default=0)
+            max_value = action_values.max()
             best_actions = []
-            for action_key, value in zip(self.ACTIONS_DICT, action_values):
+            for action_key, value in zip(self.ACTION_KEYS, action_values):
                 if value == max_value:
                     best_actions.append(action_key)
             # return random action with maximum expected reward
@@ -397,42 +409,52 @@ class Puzzle_Q_AI():
         Returns:
             float: The value of the given state considering the Q-table.
         """
-        action_values = [
-            self.q_table.get((state,action_key), 0)
-                for action_key in self.ACTIONS_DICT.keys()
-        ]
-        max_value = max(action_values)
-        return max_value
+        return float(self.q_table.get_values(state, default=0).max())
 
 
-    def export_q_table(self, filename="pickle_q_table"):
+    def get_state_values(self, states: np.ndarray) -> np.ndarray:
         """
-        write the given Q-table into a file using pickle
+        Return the values of many states at once as the maximum Q-value of all possible actions in each state.
+
+        Args:
+            states (np.ndarray): The states of the puzzle with shape (n_states, n_points).
+
+        Returns:
+            np.ndarray: The values of the given states considering the Q-table.
+        """
+        return self.q_table.get_many(states, default=0).max(axis=1)
+
+
+    def export_q_table(self, filename="q_table"):
+        """
+        write the given Q-table into files as sorted packed states and a float32 value column per action (see `State_Table.save`)
         """
         # create a folder for the given puzzle if it doesn't exist yet
         os.makedirs(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name), exist_ok=True)
-        if not filename.endswith(".pickle"):
-            filename += ".pickle"
-        with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename), "wb") as file:
-            pickle.dump(self.q_table, file, protocol=4)
+        self.q_table.save(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename))
 
-    def import_q_table(self, filename="pickle_q_table"):
+    def import_q_table(self, filename="q_table"):
         """
-        import a Q-table from a file. Try using pickle to load 'pickle_q_table', otherwise try loading 'q_table.txt', which should be a sufficiently small dictionary
+        import a Q-table saved by `export_q_table`. The table is memory-mapped, so importing is instant and the table can be shared between processes.
+        If no such table exists, try loading a Q-table saved in the old format using pickle ('pickle_q_table' or 'pickle_q_table.pickle'), otherwise try loading 'q_table.txt', which should be a sufficiently small dictionary. Old tables are converted.
         """
-        try:
-            with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename), "rb") as file:
-                self.q_table = pickle.load(file)
-        except FileNotFoundError:
-            pass
-        if not filename.endswith(".pickle"):
-            filename += ".pickle"
-        try:
-            with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename), "rb") as file:
-                self.q_table = pickle.load(file)
-        except FileNotFoundError:
-            with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, "q_table.txt"), "r") as file:
-                self.q_table = eval(file.read())
+        puzzle_path = os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name)
+        if state_table_exists(os.path.join(puzzle_path, filename)):
+            self.q_table = Sorted_State_Table(os.path.join(puzzle_path, filename))
+            return
+        for pickle_filename in ("pickle_q_table", "pickle_q_table.pickle"):
+            try:
+                with open(os.path.join(puzzle_path, pickle_filename), "rb") as file:
+                    q_table = pickle.load(file)
+                break
+            except FileNotFoundError:
+                pass
+        else:
+            with open(os.path.join(puzzle_path, "q_table.txt"), "r") as file:
+                q_table = eval(file.read())
+        # convert Q-tables saved in the old format
+        self.q_table = self.new_q_table()
+        self.q_table.update(q_table)
 
     def export_param_hist(self, training_data, filename=None):
         """
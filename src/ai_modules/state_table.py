@@ -0,0 +1,476 @@
+"""
+This module implements compact tables to store values of puzzle states for tabular V- and Q-learning.
+
+States are encoded by packing the color index of every point into as few bits as possible. The packed keys are stored in an open-addressing hash table backed by numpy arrays. Compared to a dictionary with state tuples as keys, this reduces the memory per entry by about an order of magnitude.
+
+Tables are saved as sorted packed keys and a float32 value column in `.npy` files. Saved tables are memory-mapped on load, so they are available instantly and can be shared between processes.
+
+Author: Sebastian Jost
+"""
+import os
+import json
+from math import ceil
+
+import numpy as np
+
+
+KEY_DTYPE: np.dtype = np.uint64
+# saved keys are big-endian, so that they can be compared as byte strings
+SORTED_KEY_DTYPE: np.dtype = np.dtype(">u8")
+VALUE_DTYPE: np.dtype = np.float32
+HASH_MULTIPLIER: np.uint64 = np.uint64(0x9E3779B97F4A7C15) # 2^64 / golden ratio
+KEYS_SUFFIX: str = "_keys.npy"
+VALUES_SUFFIX: str = "_values.npy"
+INFO_SUFFIX: str = "_info.json"
+
+
+class State_Encoder:
+    """
+    Pack puzzle states given as color indices into arrays of 64-bit words using the minimal number of bits per point.
+
+    Args:
+        n_points (int): number of points of the puzzle (length of a state)
+        n_colors (int): number of different colors (all color indices must be in `range(n_colors)`)
+    """
+    def __init__(self, n_points: int, n_colors: int):
+        self.n_points: int = n_points
+        self.n_colors: int = n_colors
+        self.bits_per_point: int = max(1, (n_colors-1).bit_length())
+        # points never cross word boundaries
+        self.points_per_word: int = 64 // self.bits_per_point
+        self.n_words: int = ceil(n_points / self.points_per_word)
+        self.shifts: np.ndarray = np.arange(self.points_per_word, dtype=KEY_DTYPE) * KEY_DTYPE(self.bits_per_point)
+
+    def encode(self, states: np.ndarray | tuple[int] | list[int]) -> np.ndarray:
+        """
+        Encode one or several states.
+
+        Args:
+            states (np.ndarray | tuple[int] | list[int]): state(s) with shape `(..., n_points)`
+
+        Returns:
+            np.ndarray: packed state(s) with shape `(..., n_words)`
+        """
+        states = np.asarray(states, dtype=KEY_DTYPE)
+        batch_shape: tuple[int, ...] = states.shape[:-1]
+        padded: np.ndarray = np.zeros(batch_shape + (self.n_words * self.points_per_word,), dtype=KEY_DTYPE)
+        padded[..., :self.n_points] = states
+        padded = padded.reshape(batch_shape + (self.n_words, self.points_per_word))
+        return np.bitwise_or.reduce(padded << self.shifts, axis=-1)
+
+    def decode(self, words: np.ndarray) -> np.ndarray:
+        """
+        Decode one or several packed states.
+
+        Args:
+            words (np.ndarray): packed state(s) with shape `(..., n_words)`
+
+        Returns:
+            np.ndarray: state(s) with shape `(..., n_points)`
+        """
+        mask: np.uint64 = KEY_DTYPE((1 << self.bits_per_point) - 1)
+        points: np.ndarray = (words[..., None] >> self.shifts) & mask
+        points = points.reshape(words.shape[:-1] + (self.n_words * self.points_per_word,))
+        return points[..., :self.n_points].astype(np.int64)
+
+
+class State_Table:
+    """
+    Base class of tables mapping puzzle states to values. Tables support the dictionary operations used by the tabular learners (`in`, `[]`, `get`, `len`), so they can replace a V-table (`state -> value`) or a Q-table (`(state, action_key) -> value`).
+
+    For Q-tables, the values of all actions of a state are stored in one row.
+
+    Subclasses store the values in `self.values` and implement `_find_entries` and `_stored_keys`.
+
+    Args:
+        n_points (int): number of points of the puzzle (length of a state)
+        n_colors (int): number of different colors
+        action_keys (list[str], optional): names of all actions for Q-tables. Defaults to None (V-table).
+    """
+    def __init__(self,
+            n_points: int,
+            n_colors: int,
+            action_keys: list[str] = None,
+            ):
+        self.encoder: State_Encoder = State_Encoder(n_points, n_colors)
+        self.action_keys: list[str] | None = list(action_keys) if action_keys is not None else None
+        self.action_indices: dict[str, int] | None = None
+        if action_keys is not None:
+            self.action_indices = {action_key: i for i, action_key in enumerate(action_keys)}
+        self.n_values: int = len(action_keys) if action_keys is not None else 1
+        self.values: np.ndarray
+
+    def __contains__(self, key) -> bool:
+        state, _ = self._split_key(key)
+        _, found = self._find_entries(self.encoder.encode(state)[None])
+        return bool(found[0])
+
+    def __getitem__(self, key) -> float:
+        state, column = self._split_key(key)
+        entries, found = self._find_entries(self.encoder.encode(state)[None])
+        if not found[0]:
+            raise KeyError(key)
+        return self.values[entries[0], column].item()
+
+    def get(self, key, default: float = None) -> float:
+        """
+        Return the value stored for `key` or `default` if the key does not exist.
+        """
+        state, column = self._split_key(key)
+        entries, found = self._find_entries(self.encoder.encode(state)[None])
+        if not found[0]:
+            return default
+        return self.values[entries[0], column].item()
+
+    def get_values(self, state, default: float = 0.) -> np.ndarray:
+        """
+        Return the values of all actions of a state in a Q-table.
+
+        Args:
+            state (tuple[int] | np.ndarray): the state
+            default (float, optional): value returned for unknown states. Defaults to 0.
+
+        Returns:
+            np.ndarray: values of all actions in the order of `action_keys`
+        """
+        entries, found = self._find_entries(self.encoder.encode(state)[None])
+        if not found[0]:
+            return np.full(self.n_values, default, dtype=self.values.dtype)
+        return np.array(self.values[entries[0]])
+
+    def get_many(self, states: np.ndarray, default: float = 0.) -> np.ndarray:
+        """
+        Look up the values of many states at once.
+
+        Args:
+            states (np.ndarray): states with shape `(n_states, n_points)`
+            default (float, optional): value returned for unknown states. Defaults to 0.
+
+        Returns:
+            np.ndarray: values with shape `(n_states,)` for V-tables or `(n_states, n_actions)` for Q-tables
+        """
+        entries, found = self._find_entries(self.encoder.encode(states))
+        values: np.ndarray = np.full((len(entries), self.n_values), default, dtype=self.values.dtype)
+        values[found] = self.values[entries[found]]
+        return values if self.action_indices is not None else values[:, 0]
+
+    def items(self):
+        """
+        Iterate over all entries in the same format as the dictionary-based tables: `(state_tuple, value)` for V-tables and `((state_tuple, action_key), value)` for Q-tables.
+        """
+        entries, keys = self._stored_keys()
+        states: np.ndarray = self.encoder.decode(keys)
+        for state, entry in zip(states, entries):
+            state_tuple: tuple[int] = tuple(state.tolist())
+            if self.action_indices is None:
+                yield state_tuple, self.values[entry, 0].item()
+                continue
+            for action_key, column in self.action_indices.items():
+                yield (state_tuple, action_key), self.values[entry, column].item()
+
+    def save(self, path: str) -> None:
+        """
+        Save the table in the format read by `Sorted_State_Table`: packed keys sorted in lexicographic order (`<path>_keys.npy`), the corresponding values as float32 (`<path>_values.npy`) and the table layout (`<path>_info.json`).
+
+        Args:
+            path (str): path of the table files without suffix
+        """
+        entries, keys = self._stored_keys()
+        # big-endian words compare bytewise in the same order as the packed keys
+        keys = np.ascontiguousarray(keys, dtype=SORTED_KEY_DTYPE)
+        order: np.ndarray = np.argsort(_as_byte_strings(keys), kind="stable")
+        # write to temporary files first: replacing a file keeps existing memory maps of the old table valid
+        with open(path + KEYS_SUFFIX + ".tmp", "wb") as file:
+            np.save(file, keys[order])
+        with open(path + VALUES_SUFFIX + ".tmp", "wb") as file:
+            np.save(file, np.ascontiguousarray(self.values[entries[order]], dtype=VALUE_DTYPE))
+        with open(path + INFO_SUFFIX + ".tmp", "w") as file:
+            json.dump({
+                "n_points": self.encoder.n_points,
+                "n_colors": self.encoder.n_colors,
+                "action_keys": self.action_keys,
+            }, file)
+        for suffix in (KEYS_SUFFIX, VALUES_SUFFIX, INFO_SUFFIX):
+            os.replace(path + suffix + ".tmp", path + suffix)
+
+    def _find_entries(self, words: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows in `self.values` of packed states with shape `(n_states, n_words)`.
+
+        Returns:
+            np.ndarray: row of each state. Only meaningful where the state was found.
+            np.ndarray: whether each state is stored in the table
+        """
+        raise NotImplementedError
+
+    def _stored_keys(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            np.ndarray: rows in `self.values` of all stored states
+            np.ndarray: packed keys of all stored states with shape `(n_entries, n_words)`
+        """
+        raise NotImplementedError
+
+    def _split_key(self, key) -> tuple[tuple[int] | np.ndarray, int]:
+        """
+        Split a table key into the state and the value column.
+        """
+        if self.action_indices is None:
+            return key, 0
+        state, action_key = key
+        return state, self.action_indices[action_key]
+
+
+class Hashed_State_Table(State_Table):
+    """
+    Open-addressing hash table mapping puzzle states to values. The keys are packed states and the table is backed by numpy arrays.
+
+    For Q-tables, pass the action keys: the values of all actions of a state are then stored in one row.
+
+    Args:
+        n_points (int): number of points of the puzzle (length of a state)
+        n_colors (int): number of different colors
+        action_keys (list[str], optional): names of all actions for Q-tables. Defaults to None (V-table).
+        capacity (int, optional): initial number of slots. Rounded up to a power of two. Defaults to 1024.
+        max_load_factor (float, optional): the table doubles its capacity when more than this fraction of slots is used. Defaults to 0.5.
+        value_dtype (np.dtype, optional): data type of the stored values. Only float32 tables can be saved. Defaults to np.float32.
+    """
+    def __init__(self,
+            n_points: int,
+            n_colors: int,
+            action_keys: list[str] = None,
+            capacity: int = 1024,
+            max_load_factor: float = 0.5,
+            value_dtype: np.dtype = VALUE_DTYPE,
+            ):
+        super().__init__(n_points, n_colors, action_keys=action_keys)
+        self.max_load_factor: float = max_load_factor
+        self.value_dtype: np.dtype = value_dtype
+        self._allocate(1 << max(1, (capacity-1).bit_length()))
+
+    def __len__(self) -> int:
+        return self.n_entries
+
+    def __setitem__(self, key, value: float) -> None:
+        state, column = self._split_key(key)
+        slot: int = self._get_or_insert_slot(self.encoder.encode(state))
+        self.values[slot, column] = value
+
+    def set_many(self, states: np.ndarray, values: np.ndarray) -> None:
+        """
+        Set the values of many states at once. If a state occurs several times, its last value is stored.
+
+        Args:
+            states (np.ndarray): states with shape `(n_states, n_points)`
+            values (np.ndarray): values with shape `(n_states,)` for V-tables or `(n_states, n_actions)` for Q-tables
+        """
+        words: np.ndarray = self.encoder.encode(states)
+        values = np.asarray(values, dtype=self.value_dtype).reshape(len(words), self.n_values)
+        # remove duplicate states, keeping the last occurrence
+        unique_indices: np.ndarray = len(words) - 1 - first_occurrences(words[::-1])
+        words, values = words[unique_indices], values[unique_indices]
+        slots, found = self._find_slots(words)
+        self.values[slots[found]] = values[found]
+        n_new: int = len(words) - int(found.sum())
+        if n_new == 0:
+            return
+        while self.n_entries + n_new > self.max_load_factor * len(self.used):
+            self._grow()
+        self._insert_new_keys(words[~found], values[~found])
+
+    def update(self, mapping: dict) -> None:
+        """
+        Insert all entries of a dictionary, e.g. a V- or Q-table stored in the old dictionary format.
+        """
+        for key, value in mapping.items():
+            self[key] = value
+
+    def _find_entries(self, words: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        return self._find_slots(words)
+
+    def _stored_keys(self) -> tuple[np.ndarray, np.ndarray]:
+        used_slots: np.ndarray = np.flatnonzero(self.used)
+        return used_slots, self.keys[used_slots]
+
+    def _allocate(self, capacity: int) -> None:
+        """
+        Replace the table by an empty table with the given capacity.
+        """
+        self.n_entries: int = 0
+        self.keys: np.ndarray = np.zeros((capacity, self.encoder.n_words), dtype=KEY_DTYPE)
+        self.values: np.ndarray = np.zeros((capacity, self.n_values), dtype=self.value_dtype)
+        self.used: np.ndarray = np.zeros(capacity, dtype=np.bool_)
+
+    def _hash(self, words: np.ndarray) -> np.ndarray:
+        """
+        Hash packed states with shape `(n_states, n_words)` to slot indices.
+        """
+        return (hash_packed_states(words) & KEY_DTYPE(len(self.used)-1)).astype(np.int64)
+
+    def _find_slots(self, words: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the slots of packed states with shape `(n_states, n_words)` using linear probing. All states are probed at the same time.
+
+        Returns:
+            np.ndarray: slot of each state. For unknown states, this is the empty slot where they would be inserted.
+            np.ndarray: whether each state is stored in the table
+        """
+        mask: int = len(self.used) - 1
+        slots: np.ndarray = self._hash(words)
+        found: np.ndarray = np.zeros(len(words), dtype=np.bool_)
+        pending: np.ndarray = np.arange(len(words))
+        while len(pending) > 0:
+            pending_slots: np.ndarray = slots[pending]
+            empty: np.ndarray = ~self.used[pending_slots]
+            match: np.ndarray = ~empty & np.all(self.keys[pending_slots] == words[pending], axis=-1)
+            found[pending[match]] = True
+            pending = pending[~(empty | match)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return slots, found
+
+    def _get_or_insert_slot(self, words: np.ndarray) -> int:
+        """
+        Return the slot of a packed state, inserting the state with all values set to 0 if it is unknown.
+        """
+        slots, found = self._find_slots(words[None])
+        if found[0]:
+            return int(slots[0])
+        if self.n_entries + 1 > self.max_load_factor * len(self.used):
+            self._grow()
+            slots, _ = self._find_slots(words[None])
+        slot: int = int(slots[0])
+        self.used[slot] = True
+        self.keys[slot] = words
+        self.n_entries += 1
+        return slot
+
+    def _grow(self) -> None:
+        """
+        Double the capacity and reinsert all entries at once.
+        """
+        used_slots, old_keys = self._stored_keys()
+        old_values: np.ndarray = self.values[used_slots]
+        self._allocate(2 * len(self.used))
+        self._insert_new_keys(old_keys, old_values)
+
+    def _insert_new_keys(self, keys: np.ndarray, values: np.ndarray) -> None:
+        """
+        Insert many packed states at once. The states must be distinct and not yet in the table, and the capacity must be sufficient.
+
+        Args:
+            keys (np.ndarray): packed states with shape `(n_states, n_words)`
+            values (np.ndarray): values of the states with shape `(n_states, n_values)`
+        """
+        mask: int = len(self.used) - 1
+        slots: np.ndarray = self._hash(keys)
+        pending: np.ndarray = np.arange(len(keys))
+        while len(pending) > 0:
+            pending_slots: np.ndarray = slots[pending]
+            free: np.ndarray = ~self.used[pending_slots]
+            candidates, candidate_slots = pending[free], pending_slots[free]
+            # several entries may hash to the same free slot: the last write wins, the others keep probing
+            self.keys[candidate_slots] = keys[candidates]
+            inserted: np.ndarray = np.all(self.keys[candidate_slots] == keys[candidates], axis=-1)
+            self.used[candidate_slots[inserted]] = True
+            self.values[candidate_slots[inserted]] = values[candidates[inserted]]
+            pending = np.concatenate((pending[~free], candidates[~inserted]))
+            slots[pending] = (slots[pending] + 1) & mask
+        self.n_entries += len(keys)
+
+
+class Sorted_State_Table(State_Table):
+    """
+    Read-only table loaded from the files written by `State_Table.save`. Keys and values are memory-mapped, so loading is instant, only the accessed parts of the table are read from disk and several processes share the same pages. States are looked up by binary search.
+
+    Args:
+        path (str): path of the table files without suffix
+        mmap_mode (str, optional): memory-map mode passed to `np.load`. Use None to load the whole table into memory. Defaults to "r".
+    """
+    def __init__(self, path: str, mmap_mode: str = "r"):
+        with open(path + INFO_SUFFIX, "r") as file:
+            info: dict = json.load(file)
+        super().__init__(info["n_points"], info["n_colors"], action_keys=info["action_keys"])
+        self.path: str = path
+        self.keys: np.ndarray = np.load(path + KEYS_SUFFIX, mmap_mode=mmap_mode)
+        self.values: np.ndarray = np.load(path + VALUES_SUFFIX, mmap_mode=mmap_mode)
+        self._sorted_keys: np.ndarray = _as_byte_strings(self.keys)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def to_hashed_table(self, max_load_factor: float = 0.5) -> Hashed_State_Table:
+        """
+        Copy the table into a `Hashed_State_Table` that can be changed, e.g. to continue training.
+
+        Returns:
+            Hashed_State_Table: in-memory copy of this table
+        """
+        hashed_table: Hashed_State_Table = Hashed_State_Table(
+            self.encoder.n_points,
+            self.encoder.n_colors,
+            action_keys=self.action_keys,
+            capacity=max(2, ceil(len(self) / max_load_factor) + 1),
+            max_load_factor=max_load_factor,
+        )
+        hashed_table._insert_new_keys(np.asarray(self.keys, dtype=KEY_DTYPE), np.asarray(self.values))
+        return hashed_table
+
+    def _find_entries(self, words: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        queries: np.ndarray = _as_byte_strings(np.ascontiguousarray(words, dtype=SORTED_KEY_DTYPE))
+        entries: np.ndarray = np.searchsorted(self._sorted_keys, queries)
+        entries = np.minimum(entries, max(0, len(self) - 1))
+        found: np.ndarray = self._sorted_keys[entries] == queries if len(self) > 0 \
+            else np.zeros(len(queries), dtype=np.bool_)
+        return entries, found
+
+    def _stored_keys(self) -> tuple[np.ndarray, np.ndarray]:
+        return np.arange(len(self)), np.asarray(self.keys, dtype=KEY_DTYPE)
+
+
+def state_table_exists(path: str) -> bool:
+    """
+    Check whether a table was saved at `path` using `State_Table.save`.
+
+    Args:
+        path (str): path of the table files without suffix
+    """
+    return all(os.path.exists(path + suffix) for suffix in (KEYS_SUFFIX, VALUES_SUFFIX, INFO_SUFFIX))
+
+def hash_packed_states(words: np.ndarray) -> np.ndarray:
+    """
+    Hash packed states with a multiply-xor hash over their words.
+
+    Args:
+        words (np.ndarray): packed states with shape `(n_states, n_words)`
+
+    Returns:
+        np.ndarray: 64-bit hash of each state. Mask the lowest bits to get slot indices.
+    """
+    hashes: np.ndarray = np.zeros(words.shape[0], dtype=KEY_DTYPE)
+    for i in range(words.shape[1]):
+        hashes = (hashes ^ words[:, i]) * HASH_MULTIPLIER
+    hashes ^= hashes >> KEY_DTYPE(31)
+    return hashes
+
+def first_occurrences(words: np.ndarray) -> np.ndarray:
+    """
+    Find the first occurrence of each distinct packed state.
+
+    Args:
+        words (np.ndarray): packed states with shape `(n_states, n_words)`
+
+    Returns:
+        np.ndarray: sorted indices of the first occurrence of each distinct state
+    """
+    # lexsort is stable, so the first occurrence comes first among equal states
+    order: np.ndarray = np.lexsort(words.T[::-1])
+    sorted_words: np.ndarray = words[order]
+    is_first: np.ndarray = np.ones(len(words), dtype=np.bool_)
+    is_first[1:] = np.any(sorted_words[1:] != sorted_words[:-1], axis=1)
+    return np.sort(order[is_first])
+
+def _as_byte_strings(keys: np.ndarray) -> np.ndarray:
+    """
+    View packed keys with shape `(n_keys, n_words)` stored as big-endian words as a 1D array of byte strings. Byte strings compare in the same order as the keys.
+    """
+    return keys.view(f"V{keys.shape[1] * keys.itemsize}").reshape(keys.shape[0])
@@ -0,0 +1,107 @@
+"""
+This module tests the move automaton of `Move_Algebra` and its use in the scramble generator.
+
+The automaton must not lose any states: every state reachable with at most `n` moves must also be reachable with at most `n` moves accepted by the automaton.
+
+The tests can be run with pytest or by executing this file.
+
+Author: Sebastian Jost
+"""
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+parent2dir = os.path.dirname(parentdir)
+sys.path.insert(0,parent2dir)
+
+import numpy as np
+
+from src.ai_modules.move_algebra import Move_Algebra, START_STATE
+from src.puzzle_model import Puzzle_Model
+from src.smart_scramble import scramble_n, get_action_orders
+
+
+def is_accepted(move_algebra: Move_Algebra, move_sequence: list[str]) -> bool:
+    """
+    Check whether the automaton of the given move algebra accepts the move sequence.
+
+    Args:
+        move_algebra (Move_Algebra): move algebra with move names
+        move_sequence (list[str]): sequence of move names
+
+    Returns:
+        bool: True if every move of the sequence is allowed after the previous ones
+    """
+    automaton_state: int = START_STATE
+    for move in move_sequence:
+        automaton_state = move_algebra.next_state(automaton_state, move)
+        if automaton_state < 0:
+            return False
+    return True
+
+def reachable_states(move_arrays: np.ndarray, max_depth: int, move_algebra: Move_Algebra = None) -> list[set[bytes]]:
+    """
+    Calculate all permutations reachable with at most `d` moves for each depth `d <= max_depth` with a breadth-first search.
+
+    Args:
+        move_arrays (np.ndarray): moves as stacked index arrays
+        max_depth (int): maximum number of moves
+        move_algebra (Move_Algebra, optional): only use move sequences accepted by its automaton. Defaults to None (use all move sequences).
+
+    Returns:
+        list[set[bytes]]: for each depth, the reachable permutations as bytes
+    """
+    n_moves, n_points = move_arrays.shape
+    # each layer consists of permutations and the automaton state they were reached with
+    layer: np.ndarray = np.arange(n_points, dtype=move_arrays.dtype)[None]
+    automaton_states: np.ndarray = np.array([START_STATE])
+    reached: set[bytes] = {layer[0].tobytes()}
+    reached_by_depth: list[set[bytes]] = [set(reached)]
+    for _ in range(max_depth):
+        if move_algebra is None:
+            parents, moves = np.divmod(np.arange(len(layer) * n_moves), n_moves)
+            child_automaton_states: np.ndarray = np.full(len(parents), START_STATE)
+        else:
+            parents, moves = np.nonzero(move_algebra.successor_mask[automaton_states])
+            child_automaton_states: np.ndarray = move_algebra.transitions[automaton_states[parents], moves]
+        children: np.ndarray = np.take_along_axis(layer[parents], move_arrays[moves], axis=1)
+        # remove duplicate pairs of permutation and automaton state
+        _, unique_indices = np.unique(np.hstack((children, child_automaton_states[:, None])), axis=0, return_index=True)
+        layer, automaton_states = children[unique_indices], child_automaton_states[unique_indices]
+        reached.update(child.tobytes() for child in layer)
+        reached_by_depth.append(set(reached))
+    return reached_by_depth
+
+def test_automaton_covers_all_states(
+        puzzle_depths: tuple[tuple[str, int]] = (("cube_2x2x2", 4), ("rubiks_3x3", 3), ("cube_4x4x4", 3), ("gear_cube", 4))):
+    """
+    For each depth, the move sequences accepted by the automaton must reach the same states as all move sequences.
+    """
+    for puzzle_name, max_depth in puzzle_depths:
+        puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
+        move_algebra: Move_Algebra = Move_Algebra.from_actions_dict(puzzle.moves, puzzle.n_points)
+        all_states: list[set[bytes]] = reachable_states(move_algebra.move_arrays, max_depth)
+        accepted_states: list[set[bytes]] = reachable_states(move_algebra.move_arrays, max_depth, move_algebra)
+        for depth, (states, accepted) in enumerate(zip(all_states, accepted_states)):
+            assert states == accepted, f"{puzzle_name}: {len(states - accepted)} states with {depth} moves are not reached by the automaton."
+
+def test_scrambles_are_accepted(
+        puzzle_names: tuple[str] = ("rubiks_3x3", "cube_4x4x4", "megaminx"),
+        n_scrambles: int = 50,
+        n_moves: int = 40):
+    """
+    Every scramble generated with a move algebra must be accepted by its automaton, also when states repeat during the scramble.
+    """
+    for puzzle_name in puzzle_names:
+        puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
+        move_algebra: Move_Algebra = Move_Algebra.from_actions_dict(puzzle.moves, puzzle.n_points)
+        action_orders: dict[str, int] = get_action_orders(puzzle.moves)
+        for _ in range(n_scrambles):
+            scramble: list[str] = scramble_n(puzzle.SOLVED_STATE, puzzle.moves, n_moves, action_orders, move_algebra=move_algebra)
+            assert len(scramble) == n_moves
+            assert is_accepted(move_algebra, scramble), f"{puzzle_name}: scramble {' '.join(scramble)} is not accepted."
+
+
+if __name__ == "__main__":
+    test_automaton_covers_all_states()
+    test_scrambles_are_accepted()
+    print("All tests passed.")
@@ -0,0 +1,107 @@
+"""
+This module tests the open-addressing hash table `Hashed_State_Table`, in particular lookups and insertions of states whose hashes collide.
+
+The tests can be run with pytest or by executing this file.
+
+Author: Sebastian Jost
+"""
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+parent2dir = os.path.dirname(parentdir)
+sys.path.insert(0,parent2dir)
+
+import numpy as np
+
+from src.ai_modules.state_table import Hashed_State_Table, State_Encoder
+
+
+def random_states(n_states: int, n_points: int = 20, n_colors: int = 6, seed: int = 0) -> np.ndarray:
+    """
+    Generate distinct random states.
+
+    Returns:
+        np.ndarray: states with shape `(n_states, n_points)`
+    """
+    rng: np.random.Generator = np.random.default_rng(seed)
+    states: np.ndarray = np.unique(rng.integers(0, n_colors, size=(2 * n_states, n_points)), axis=0)
+    return rng.permutation(states)[:n_states]
+
+def colliding_table(n_points: int = 20, n_colors: int = 6, **kwargs) -> Hashed_State_Table:
+    """
+    Create a table where all states hash to the same slot, so every insertion and lookup has to probe past colliding states.
+    """
+    table: Hashed_State_Table = Hashed_State_Table(n_points, n_colors, **kwargs)
+    table._hash = lambda words: np.zeros(len(words), dtype=np.int64)
+    return table
+
+def test_encoder_round_trip():
+    """
+    Decoding packed states must give the original states.
+    """
+    for n_points, n_colors in ((20, 6), (54, 6), (7, 2), (100, 300)):
+        states: np.ndarray = random_states(50, n_points, n_colors)
+        encoder: State_Encoder = State_Encoder(n_points, n_colors)
+        assert np.array_equal(encoder.decode(encoder.encode(states)), states)
+
+def test_insert_and_lookup_with_collisions():
+    """
+    Single insertions and lookups must find every stored state and no other state, even if all hashes collide and the table grows in between.
+    """
+    states: np.ndarray = random_states(300)
+    stored, unknown = states[:200], states[200:]
+    for table in (Hashed_State_Table(20, 6, capacity=4), colliding_table(capacity=4)):
+        for i, state in enumerate(stored):
+            table[tuple(state)] = i
+        # overwrite some values
+        for i, state in enumerate(stored[:50]):
+            table[tuple(state)] = -i
+        assert len(table) == len(stored)
+        for i, state in enumerate(stored):
+            assert tuple(state) in table
+            assert table[tuple(state)] == (-i if i < 50 else i)
+        for state in unknown:
+            assert tuple(state) not in table
+            assert table.get(tuple(state), default=-1.) == -1.
+
+def test_set_many_with_collisions():
+    """
+    Batched insertions must store the last value of duplicate states and agree with a dictionary, even if all hashes collide.
+    """
+    states: np.ndarray = random_states(300)
+    rng: np.random.Generator = np.random.default_rng(1)
+    for table in (Hashed_State_Table(20, 6, capacity=4), colliding_table(capacity=4)):
+        expected: dict[tuple[int], float] = dict()
+        for _ in range(5):
+            batch: np.ndarray = states[rng.integers(0, 200, size=80)] # contains duplicates
+            values: np.ndarray = rng.random(len(batch)).astype(np.float32)
+            table.set_many(batch, values)
+            for state, value in zip(batch, values):
+                expected[tuple(state)] = value
+        assert len(table) == len(expected)
+        assert np.array_equal(table.get_many(np.array(list(expected.keys()))), np.array(list(expected.values())))
+        assert np.all(table.get_many(states[200:], default=-1.) == -1.)
+        assert dict(table.items()) == {state: float(value) for state, value in expected.items()}
+
+def test_q_table_with_collisions():
+    """
+    Q-tables store the values of all actions of a state in one row.
+    """
+    action_keys: list[str] = ["U", "U'", "R", "R'"]
+    states: np.ndarray = random_states(100)
+    table: Hashed_State_Table = colliding_table(action_keys=action_keys, capacity=4)
+    for i, state in enumerate(states):
+        for j, action_key in enumerate(action_keys):
+            table[(tuple(state), action_key)] = 10 * i + j
+    for i, state in enumerate(states):
+        assert table[(tuple(state), "R")] == 10 * i + 2
+        assert np.array_equal(table.get_values(tuple(state)), 10 * i + np.arange(len(action_keys)))
+    assert np.array_equal(table.get_many(states), 10 * np.arange(len(states))[:, None] + np.arange(len(action_keys)))
+
+
+if __name__ == "__main__":
+    test_encoder_round_trip()
+    test_insert_and_lookup_with_collisions()
+    test_set_many_with_collisions()
+    test_q_table_with_collisions()
+    print("All tests passed.")
@@ -1,25 +1,36 @@
 import random
 
+import numpy as np
+
 def scramble(
         state: list[int],
         actions: dict[str, list[list[int]]],
-        max_moves: int = 30) -> list[str]:
+        max_moves: int = 30,
+        move_algebra: "Move_Algebra" = None) -> list[str]:
     """
     scramble the puzzle starting at the given state by randomly applying [max_moves] actions
     `state` will be changed in-place!
+    If a `Move_Algebra` of the actions is given, only actions allowed by its automaton are chosen, so the scramble contains no redundant sequences like `R R'`.
 
     Argss:
         state (list[int]): list representing the initial state of the puzzle
         actions (dict[str, list[list[int]]]): a dictionary of all possible actions with unique names as keys
             - the values must be actions represented as lists of cycles
             - cycles are lists of state indices for permutations
+        move_algebra (Move_Algebra, optional): move algebra of `actions`. Defaults to None (choose any action).
 
     Returns:
         (list[str]) - scramble described as a list of actions
     """
     scramble = []
+    automaton_state = 0 # start state of the move automaton
     for _ in range(max_moves):
-        action_key = random.choice(list(actions.keys())) # choose a radom action
+        if move_algebra is None:
+            action_key = random.choice(list(actions.keys())) # choose a radom action
+        else:
+            move_index = random.choice(move_algebra.get_allowed_moves(automaton_state).tolist())
+            automaton_state = move_algebra.next_state(automaton_state, move_index)
+            action_key = move_algebra.move_names[move_index]
         perform_action(state, actions[action_key]) # perform this action
         scramble.append(action_key)                # save action to replicate the scramble
     return scramble
@@ -36,10 +47,14 @@ def perform_action(
         state (list[int]): list representing the state
         action (list[list[int]]): list representing an action, here as a list of cycles
             cycles are lists of list indices of the state list.
+            May also be an index array compiled by `Permutation_Engine`.
             
     Returns:
         (list[int]) - the new state (changed in-place and returned)
     """
+    if isinstance(action, np.ndarray): # compiled index array
+        state[:] = state[action] if isinstance(state, np.ndarray) else [state[i] for i in action.tolist()]
+        return state
     for cycle in action: # loop over all cycles in the move
         j = cycle[0]
         for i in cycle[-1:0:-1]:  # apply cycle
@@ -5,10 +5,18 @@ import random
 import pickle
 from math import ceil, log10
 
+import numpy as np
+
 if __name__ != "__main__":
     from .twisty_puzzle_model import scramble, perform_action
+    from .permutation_engine import Permutation_Engine
+    from .move_algebra import Move_Algebra
+    from .state_table import Hashed_State_Table, Sorted_State_Table, state_table_exists
 else:
     from twisty_puzzle_model import scramble, perform_action
+    from permutation_engine import Permutation_Engine
+    from move_algebra import Move_Algebra
+    from state_table import Hashed_State_Table, Sorted_State_Table, state_table_exists
 
 
 class Puzzle_V_AI():
@@ -47,6 +55,10 @@ class Puzzle_V_AI():
         self.ACTION_KEYS = list(self.ACTIONS_DICT.keys())
         self.N_ACTIONS = len(self.ACTION_KEYS)
         self.SOLVED_STATE = SOLVED_STATE
+        self.N_COLORS = max(SOLVED_STATE) + 1
+        self.permutation_engine = Permutation_Engine(self.ACTIONS_DICT, len(SOLVED_STATE))
+        # used to generate scrambles without redundant move sequences
+        self.move_algebra = Move_Algebra(self.permutation_engine.move_arrays, self.permutation_engine.move_names)
 
         self.reward_dict = reward_dict
         self.learning_rate = learning_rate
@@ -55,7 +67,7 @@ class Puzzle_V_AI():
 
         if keep_v_table:
             try:
-                self.v_table = dict()
+                self.v_table = self.new_v_table()
                 self.import_v_table()
             except FileNotFoundError:
                 self.v_table = None
@@ -141,7 +153,7 @@ class Puzzle_V_AI():
                 # generate a starting state by scrambling the solved state
                 start_state = self.SOLVED_STATE[:]
                 # scramble puzzle in-place
-                scramble(start_state, self.ACTIONS_DICT, max_moves=n_scramble_moves)
+                scramble(start_state, self.ACTIONS_DICT, max_moves=n_scramble_moves, move_algebra=self.move_algebra)
                 # play episode
                 state_hist, action_hist = self.play_episode(
                         start_state,
@@ -218,7 +230,20 @@ class Puzzle_V_AI():
             self.base_exploration_rate = base_exploration_rate
 
         if self.v_table == None or not keep_v_table: # V_table doesn't yet exist or is to be overwritten
-            self.v_table = dict()    # assign values to every visited state
+            self.v_table = self.new_v_table()    # assign values to every visited state
+        elif isinstance(self.v_table, Sorted_State_Table): # imported V-tables are read-only
+            self.v_table = self.v_table.to_hashed_table()
+
+
+    def new_v_table(self) -> Hashed_State_Table:
+        """
+        create an empty V-table storing states in packed form
+
+        returns:
+        --------
+            (Hashed_State_Table) - empty V-table for this puzzle
+        """
+        return Hashed_State_Table(len(self.SOLVED_STATE), self.N_COLORS)
 
 
     def get_new_scramble_moves(self,
@@ -384,31 +409,11 @@ class Puzzle_V_AI():
             # explore environment through random move
             return random.choice(self.ACTION_KEYS)
 
-        # exploit knowledge
-        # action_values = list()
-        best_actions = [str()]*self.N_ACTIONS
-        max_value = -float("inf")
-        best_action_len = 0
-        for action_key, action in self.ACTIONS_DICT.items():
-            next_state = state[:] # state is a (list) of (int) -> state[:] creates a deepcopy
-            perform_action(next_state, action) # perform action in-place
-            state_tuple = tuple(next_state)
-            try:
-                state_value = self.v_table[state_tuple]
-                if state_value > max_value:
-                    max_value = state_value
-                    best_actions[0] = action_key
-                    best_action_len = 1
-                elif state_value == max_value:
-                    best_actions[best_action_len] = action_key
-                    best_action_len += 1
-            except KeyError:
-                if 0 > max_value:
-                    self.v_table[state_tuple] = 0
-                    max_value = 0
-                    best_actions[0] = action_key
-                    best_action_len = 1
-        return random.choice(best_actions[:best_action_len])
+        # exploit knowledge: look up the values of all successor states at once. Unknown states have value 0.
+        next_states = self.permutation_engine.apply_all(np.asarray(state))
+        state_values = self.v_table.get_many(next_states, default=0)
+        best_actions = np.flatnonzero(state_values == state_values.max())
+        return self.ACTION_KEYS[random.choice(best_actions)]
 
 
     def get_state_value(self, state: tuple[int]) -> float:
@@ -424,35 +429,48 @@ class Puzzle_V_AI():
         return self.v_table.get(state, 0)
 
 
-    def export_v_table(self, filename="pickle_v_table"):
+    def get_state_values(self, states: np.ndarray) -> np.ndarray:
         """
-        write the given V-table into a file using pickle
+        Return the values of many states in the V-table at once.
+
+        Args:
+            states (np.ndarray): The states of the puzzle with shape (n_states, n_points).
+
+        Returns:
+            np.ndarray: The values of the given states in the V-table. Unknown states have value 0.
+        """
+        return self.v_table.get_many(states, default=0)
+
+
+    def export_v_table(self, filename="v_table"):
+        """
+        write the given V-table into files as sorted packed states and a float32 value column (see `State_Table.save`)
         """
         # create a folder for the given puzzle if it doesn't exist yet
         os.makedirs(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name), exist_ok=True)
-        if not filename.endswith(".pickle"):
-            filename += ".pickle"
-        with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename), "wb") as file:
-            pickle.dump(self.v_table, file, protocol=4)
+        self.v_table.save(os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename))
 
-    def import_v_table(self, filename="pickle_V_table"):
+    def import_v_table(self, filename="v_table"):
         """
-        import a V-table from a file. Try using pickle to load 'pickle_V_table'
+        import a V-table saved by `export_v_table`. The table is memory-mapped, so importing is instant and the table can be shared between processes.
+        If no such table exists, try using pickle to load a V-table saved in the old format ('pickle_V_table' or 'pickle_v_table.pickle') and convert it.
         """
-        path = os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename)
-        try:
-            with open(path, "rb") as file:
-                self.v_table = pickle.load(file)
-        except FileNotFoundError:
-            pass
-        if not filename.endswith(".pickle"):
-            filename += ".pickle"
-        path = os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name, filename)
-        try:
-            with open(path, "rb") as file:
-                self.v_table = pickle.load(file)
-        except FileNotFoundError:
-            return f'File "{filename}" not found at {path}'
+        puzzle_path = os.path.join(os.path.dirname(__file__), "..", "puzzles", self.name)
+        if state_table_exists(os.path.join(puzzle_path, filename)):
+            self.v_table = Sorted_State_Table(os.path.join(puzzle_path, filename))
+            return
+        for pickle_filename in ("pickle_V_table", "pickle_V_table.pickle", "pickle_v_table.pickle"):
+            try:
+                with open(os.path.join(puzzle_path, pickle_filename), "rb") as file:
+                    v_table = pickle.load(file)
+                break
+            except FileNotFoundError:
+                pass
+        else:
+            return f'File "{filename}" not found at {puzzle_path}'
+        # convert V-tables saved in the old format
+        self.v_table = self.new_v_table()
+        self.v_table.update(v_table)
 
     def export_param_hist(self, training_data, filename=None):
         """
@@ -1,12 +1,25 @@
 """
 This module implements a class to store twisty puzzle algorithms along with some properties for comparing them.
+
+Algorithms are represented by index arrays (see `Permutation_Engine`). Their properties are calculated with numpy, sympy permutations are only created on demand.
 """
+# add src to path
+import os, sys, inspect
+if __name__ == "__main__":
+    currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+    parentdir = os.path.dirname(currentdir)
+    parent2dir = os.path.dirname(parentdir)
+    sys.path.insert(0,parent2dir)
 
-import itertools
 from collections import namedtuple, Counter
+from math import lcm
 
+import numpy as np
 from sympy.combinatorics import Permutation
 
+from src.ai_modules.move_sequence_cache import Move_Sequence_Cache
+from src.ai_modules.permutation_engine import index_array_to_cycles, to_index_array
+
 
 # cycle signature: (cycle_length, affected_pieces, piece_type)
 CYCLE_SIGNATURE = namedtuple(
@@ -29,9 +42,11 @@ class Twisty_Puzzle_Algorithm:
             puzzle: "Twisty_Puzzle",
             alg_name: str,
             sympy_moves: dict[str, Permutation] | None = None,
+            sequence_cache: Move_Sequence_Cache | None = None,
         ):
         """
         Initialize a new twisty puzzle algorithm based on a given move sequence that is repeated n times.
+        If a `sequence_cache` is given, the permutation of the base move sequence is composed using the cache.
         """
         # self.puzzle_name: str = puzzle_name
         self.name: str = alg_name
@@ -40,15 +55,19 @@ class Twisty_Puzzle_Algorithm:
             self.sympy_moves: dict[str, Permutation] = get_sympy_moves(puzzle)
         else:
             self.sympy_moves: dict[str, Permutation] = sympy_moves
+        self.sequence_cache: Move_Sequence_Cache | None = sequence_cache
         
         self.base_action_sequence: list[str] = base_action_sequence
         self.n_repetitions: int = n_repetitions
         self.full_action_sequence: list[str] = self.base_action_sequence*self.n_repetitions
 
-        self.sympy_permutation: Permutation = self._get_sympy_permutation(
-            move_sequence=self.full_action_sequence,
-            sympy_moves=self.sympy_moves,
+        # the algorithm as index array. This is the `array_form` of the sympy permutation.
+        self.permutation: np.ndarray = get_repeated_permutation(
+            move_sequence_to_index_array(self.base_action_sequence, self.sympy_moves, self.sequence_cache),
+            self.n_repetitions,
         )
+        self._cycles: list[list[int]] | None = None
+        self._sympy_permutation: Permutation | None = None
         self._calculate_properties(self.puzzle.pieces)
 
     def __str__(self) -> str:
@@ -77,9 +96,7 @@ class Twisty_Puzzle_Algorithm:
         Returns:
             bool: True if the permutations are equal, False otherwise
         """
-        if self.sympy_permutation == other.sympy_permutation:
-            return True
-        return False
+        return np.array_equal(self.permutation, other.permutation)
 
     def equal_up_to_symmetry(self, other: "Twisty_Puzzle_Algorithm") -> bool:
         if not hasattr(self, "symmetric_perms"):
@@ -121,6 +138,7 @@ class Twisty_Puzzle_Algorithm:
             puzzle=self.puzzle,
             alg_name=inv_name,
             sympy_moves=self.sympy_moves,
+            sequence_cache=self.sequence_cache,
         )
 
     def compact_moves(self) -> str:
@@ -150,16 +168,25 @@ class Twisty_Puzzle_Algorithm:
         for cycle_signature in self.algorithm_signature[1]:
             print(f"    {cycle_signature.num} cycles of length {cycle_signature.cycle_signature.cycle_length} affecting {cycle_signature.cycle_signature.n_affected_pieces} pieces of type {cycle_signature.cycle_signature.piece_type}.")
 
-    def _get_sympy_permutation(self,
-            move_sequence: list[str],
-            sympy_moves: dict[str, Permutation],
-        ) -> Permutation:
+    @property
+    def cycles(self) -> list[list[int]]:
         """
-        Get the algorithm as a sympy permutation
+        Returns:
+            list[list[int]]: the algorithm in cyclic form (like sympy's `cyclic_form`). Calculated on first access.
         """
-        if hasattr(self, "_sympy_permutation"):
-            return self.sympy_permutation
-        return moves_list_to_sympy_permutation(move_sequence, sympy_moves)
+        if self._cycles is None:
+            self._cycles = index_array_to_cycles(self.permutation)
+        return self._cycles
+
+    @property
+    def sympy_permutation(self) -> Permutation:
+        """
+        Returns:
+            Permutation: the algorithm as sympy permutation. Created on first access.
+        """
+        if self._sympy_permutation is None:
+            self._sympy_permutation = Permutation(self.permutation.tolist())
+        return self._sympy_permutation
 
     def calc_symmetric_perms(self, rotation_perms: list[Permutation]):
         """
@@ -179,24 +206,72 @@ class Twisty_Puzzle_Algorithm:
             - number of affected pieces
             - number of affected points
         """
-        self.order: int = self.sympy_permutation.order()
-        # calculate affected pieces
-        self.affected_pieces: list[set[int]] = get_affected_pieces(
-                perm=self.sympy_permutation,
-                pieces=pieces,
-                )
+        self.order: int = lcm(1, *[len(cycle) for cycle in self.cycles])
+        # calculate affected pieces using the piece index of each point
+        point_pieces: np.ndarray = get_point_piece_indices(pieces, len(self.permutation))
+        affected_points: np.ndarray = get_affected_point_indices(self.permutation)
+        self.affected_pieces: list[set[int]] = [pieces[i] for i in get_affected_piece_indices(affected_points, point_pieces)]
         self.n_affected_pieces: int = len(self.affected_pieces)
         
-        self.affected_points: set[int] = get_affected_points(self.sympy_permutation)
+        self.affected_points: set[int] = set(affected_points.tolist())
         
-        self.algorithm_signature: tuple[tuple[PIECES_SIGNATURE], tuple[CYCLES_SIGNATURE]] = get_algorithm_signature(self.sympy_permutation, pieces)
+        self.algorithm_signature: tuple[tuple[PIECES_SIGNATURE], tuple[CYCLES_SIGNATURE]] = get_signature_from_cycles(
+            self.cycles, self.affected_pieces, pieces, point_pieces)
+
+def get_point_piece_indices(pieces: list[set[int]], n_points: int) -> np.ndarray:
+    """
+    Get an array mapping each point to the index of the piece it belongs to. The array of the most recently used list of pieces is cached.
+
+    Args:
+        pieces (list[set[int]]): list of all pieces in the puzzle
+            each piece is represented as a set of point indices
+        n_points (int): number of points of the puzzle
+
+    Returns:
+        np.ndarray: piece index of each point. -1 for points that do not belong to any piece.
+    """
+    global _POINT_PIECE_INDICES
+    cached_pieces, point_pieces = _POINT_PIECE_INDICES
+    if cached_pieces is pieces and len(point_pieces) == n_points:
+        return point_pieces
+    point_pieces: np.ndarray = np.full(n_points, -1, dtype=np.int32)
+    for piece_index, piece in enumerate(pieces):
+        point_pieces[list(piece)] = piece_index
+    # single-entry cache, so only the pieces of one puzzle are kept alive
+    _POINT_PIECE_INDICES = (pieces, point_pieces)
+    return point_pieces
+
+# (list of pieces, piece index of each point) of the most recently used pieces
+_POINT_PIECE_INDICES: tuple[list[set[int]] | None, np.ndarray | None] = (None, None)
+
+def get_affected_point_indices(permutation: np.ndarray) -> np.ndarray:
+    """
+    Args:
+        permutation (np.ndarray): a permutation as index array
+
+    Returns:
+        np.ndarray: sorted indices of all points moved by the permutation
+    """
+    return np.flatnonzero(permutation != np.arange(len(permutation)))
+
+def get_affected_piece_indices(affected_points: np.ndarray, point_pieces: np.ndarray) -> list[int]:
+    """
+    Args:
+        affected_points (np.ndarray): indices of all points moved by a permutation
+        point_pieces (np.ndarray): piece index of each point (see `get_point_piece_indices`)
+
+    Returns:
+        list[int]: sorted indices of all pieces containing at least one affected point
+    """
+    piece_indices: np.ndarray = np.unique(point_pieces[affected_points])
+    return piece_indices[piece_indices >= 0].tolist()
 
 def get_affected_pieces(perm: Permutation, pieces: list[set[int]]) -> list[set[int]]:
     """
     get a list of all pieces moved by the given permutation
 
     Args:
-        perm (sympy.combinatorics.Permutation): a sympy permutation for analysis
+        perm (sympy.combinatorics.Permutation | np.ndarray): a sympy permutation or index array for analysis
         pieces (list[set[int]]): list of all pieces in the puzzle
             each piece is represented as a set of point indices
 
@@ -204,25 +279,21 @@ def get_affected_pieces(perm: Permutation, pieces: list[set[int]]) -> list[set[i
         list[set[int]]: list of pieces affected by the permutation.
             each piece is represented as a set of point indices
     """
-    # flatten the cyclic form of the permutation into the set of all affected points
-    affected_points: set[int] = get_affected_points(perm)
-    affected_pieces: list[set[int]] = list()
-    for piece in pieces:
-        if affected_points & piece != set(): # if piece is affected by algorithm: append piece
-            affected_pieces.append(piece)
-    return affected_pieces
+    permutation: np.ndarray = to_index_array(perm, perm.size)
+    point_pieces: np.ndarray = get_point_piece_indices(pieces, len(permutation))
+    return [pieces[i] for i in get_affected_piece_indices(get_affected_point_indices(permutation), point_pieces)]
 
 def get_affected_points(perm: Permutation) -> set[int]:
     """
     From a given sympy permutation, get the set of all affected points
     
     Args:
-        perm (sympy.combinatorics.Permutation): a sympy permutation for analysis
+        perm (sympy.combinatorics.Permutation | np.ndarray): a sympy permutation or index array for analysis
 
     Returns:
         set[int]: set of all affected points given by their indices
     """
-    return set(itertools.chain(*perm.cyclic_form))
+    return set(get_affected_point_indices(to_index_array(perm, perm.size)).tolist())
 
 def get_cycle_signatures(perm: Permutation, pieces: list[set[int]]) -> list[CYCLE_SIGNATURE]:
     """
@@ -233,31 +304,48 @@ def get_cycle_signatures(perm: Permutation, pieces: list[set[int]]) -> list[CYCL
             - type of pieces affected by the cycle
 
     Args:
-        perm (sympy.combinatorics.Permutation): a sympy permutation for analysis
+        perm (sympy.combinatorics.Permutation | np.ndarray): a sympy permutation or index array for analysis
         pieces (list[set[int]]): list of all pieces in the puzzle
             each piece is represented as a set of point indices
 
+    Returns:
+        list[CYCLE_SIGNATURE]: list of named tuples containing the cycle signature
+    """
+    permutation: np.ndarray = to_index_array(perm, perm.size)
+    return get_cycle_signatures_from_cycles(
+        index_array_to_cycles(permutation),
+        pieces,
+        get_point_piece_indices(pieces, len(permutation)))
+
+def get_cycle_signatures_from_cycles(
+        cycles: list[list[int]],
+        pieces: list[set[int]],
+        point_pieces: np.ndarray,
+        ) -> list[CYCLE_SIGNATURE]:
+    """
+    Get the cycle signature (see `get_cycle_signatures`) of a permutation given in cyclic form.
+
+    Args:
+        cycles (list[list[int]]): the permutation in cyclic form
+        pieces (list[set[int]]): list of all pieces in the puzzle
+        point_pieces (np.ndarray): piece index of each point (see `get_point_piece_indices`)
+
     Returns:
         list[CYCLE_SIGNATURE]: list of named tuples containing the cycle signature
     """
     cycle_signatures = list()
-    for cycle in perm.cyclic_form:
-        cycle_length = len(cycle)
-        affected_points: set[int] = set(cycle)
-        empty_set: set = set()
+    for cycle in cycles:
+        affected_piece_indices: set[int] = set(point_pieces[cycle].tolist()) - {-1}
         # get the number of points in each affected piece
-        affected_piece_types = [
-            len(piece)
-                for piece in pieces
-                if affected_points & piece != empty_set]
-        if len(set(affected_piece_types)) > 1:
+        affected_piece_types: set[int] = set(len(pieces[i]) for i in affected_piece_indices)
+        if len(affected_piece_types) > 1:
             raise ValueError("Cycle affects multiple piece types. This is not unexpected!")
         
         cycle_signatures.append(
             CYCLE_SIGNATURE(
-                cycle_length,
-                len(affected_piece_types),
-                affected_piece_types[0],
+                len(cycle),
+                len(affected_piece_indices),
+                affected_piece_types.pop(),
             )
         )
     return cycle_signatures
@@ -269,14 +357,39 @@ def get_algorithm_signature(perm: Permutation, pieces: list[set[int]]) -> tuple[
         - a tuple of cycle signatures and how many cycles with this signature appear in the algorithm
 
     Args:
-        perm (sympy.combinatorics.Permutation): a sympy permutation for analysis
+        perm (sympy.combinatorics.Permutation | np.ndarray): a sympy permutation or index array for analysis
         pieces (list[set[int]]): list of all pieces in the puzzle
             each piece is represented as a set of point indices
     
     Returns:
         tuple[tuple[PIECES_SIGNATURE], tuple[CYCLES_SIGNATURE]]: the algorithm signature
     """
-    cycle_signatures = get_cycle_signatures(perm, pieces)
+    permutation: np.ndarray = to_index_array(perm, perm.size)
+    return get_signature_from_cycles(
+        index_array_to_cycles(permutation),
+        get_affected_pieces(permutation, pieces),
+        pieces,
+        get_point_piece_indices(pieces, len(permutation)))
+
+def get_signature_from_cycles(
+        cycles: list[list[int]],
+        affected_pieces: list[set[int]],
+        pieces: list[set[int]],
+        point_pieces: np.ndarray,
+        ) -> tuple[tuple[PIECES_SIGNATURE], tuple[CYCLES_SIGNATURE]]:
+    """
+    Calculate the algorithm signature (see `get_algorithm_signature`) of a permutation given in cyclic form.
+
+    Args:
+        cycles (list[list[int]]): the permutation in cyclic form
+        affected_pieces (list[set[int]]): list of pieces affected by the permutation
+        pieces (list[set[int]]): list of all pieces in the puzzle
+        point_pieces (np.ndarray): piece index of each point (see `get_point_piece_indices`)
+
+    Returns:
+        tuple[tuple[PIECES_SIGNATURE], tuple[CYCLES_SIGNATURE]]: the algorithm signature
+    """
+    cycle_signatures = get_cycle_signatures_from_cycles(cycles, pieces, point_pieces)
     # 1. count how often each cycle signature appears in the cycle signatures
     # Count how often each cycle signature appears
     cycle_signature_counter = Counter(cycle_signatures)
@@ -286,7 +399,6 @@ def get_algorithm_signature(perm: Permutation, pieces: list[set[int]]) -> tuple[
         for cycle_signature, count in cycle_signature_counter.items()
     )
     # 2. count how many pieces of each type are affected by the algorithm
-    affected_pieces: list[set[int]] = get_affected_pieces(perm, pieces)
     piece_type_counter = Counter(len(piece) for piece in affected_pieces)
     # Generate the PIECES_SIGNATURE tuple
     pieces_signature: tuple[PIECES_SIGNATURE] = tuple(
@@ -311,32 +423,89 @@ def get_sympy_moves(puzzle: "Twisty_Puzzle") -> dict[str, Permutation]:
             keys are the same as in `puzzle move_dict`
             values are the same permutations as sympy permutations
     """
+    analysis_cache = getattr(puzzle, "analysis_cache", None)
+    if analysis_cache is not None:
+        # build permutations from cached index arrays
+        move_arrays: np.ndarray = analysis_cache.get_move_arrays(puzzle.moves, len(puzzle.SOLVED_STATE))
+        return {name: Permutation(move_array.tolist()) for name, move_array in zip(puzzle.moves, move_arrays)}
     sympy_moves = dict()
     for name, move_perm in puzzle.moves.items():
         sympy_moves[name] = Permutation(move_perm, size=len(puzzle.SOLVED_STATE))
     return sympy_moves
 
-def moves_list_to_sympy_permutation(move_sequence: list[str], sympy_moves: dict[str, Permutation]) -> Permutation:
+def moves_list_to_sympy_permutation(
+        move_sequence: list[str],
+        sympy_moves: dict[str, Permutation],
+        sequence_cache: Move_Sequence_Cache | None = None,
+        ) -> Permutation:
     """
     Generate a sympy permutation from a given move sequence.
 
     Args:
         move_sequence (list[str]): a list of move names
         sympy_moves (dict[str, Permutation]): dictionary mapping move names to sympy permutations
+        sequence_cache (Move_Sequence_Cache, optional): cache of composed move sequences. If given, the permutation is composed from a cached index array instead of multiplying sympy permutations. Defaults to None.
 
     Returns:
         Permutation: the permutation generated by the given move sequence
     """
+    if sequence_cache is not None:
+        # the cached index array is the array form of the sympy permutation
+        return Permutation(sequence_cache.get_permutation(move_sequence).tolist())
     # generate self.sympy_permutation from action_sequence and puzzle moves
     sympy_permutation = sympy_moves[move_sequence[-1]]
     for move in reversed(move_sequence[:-1]):
         sympy_permutation *= sympy_moves[move]
     return sympy_permutation
 
+def move_sequence_to_index_array(
+        move_sequence: list[str],
+        sympy_moves: dict[str, Permutation],
+        sequence_cache: Move_Sequence_Cache | None = None,
+        ) -> np.ndarray:
+    """
+    Generate the index array of a given move sequence. This is the `array_form` of `moves_list_to_sympy_permutation(move_sequence, sympy_moves)`.
+
+    Args:
+        move_sequence (list[str]): a list of move names
+        sympy_moves (dict[str, Permutation]): dictionary mapping move names to sympy permutations
+        sequence_cache (Move_Sequence_Cache, optional): cache of composed move sequences. Defaults to None.
+
+    Returns:
+        np.ndarray: the permutation generated by the given move sequence as index array
+    """
+    if sequence_cache is None:
+        n_points: int = max(perm.size for perm in sympy_moves.values())
+        sequence_cache = Move_Sequence_Cache(sympy_moves, n_points)
+    return sequence_cache.get_permutation(move_sequence)
+
+def get_repeated_permutation(permutation: np.ndarray, n_repetitions: int) -> np.ndarray:
+    """
+    Calculate the permutation of applying the given permutation `n_repetitions` times.
+
+    Args:
+        permutation (np.ndarray): permutation as index array
+        n_repetitions (int): number of repetitions
+
+    Returns:
+        np.ndarray: the repeated permutation as index array
+    """
+    result: np.ndarray = np.arange(len(permutation), dtype=permutation.dtype)
+    power: np.ndarray = permutation
+    # exponentiation by squaring. All powers of a permutation commute.
+    while n_repetitions > 0:
+        if n_repetitions & 1:
+            result = result[power]
+        power = power[power]
+        n_repetitions >>= 1
+    return result
+
 def get_move_sequence_info(
         move_sequence: list[str],
         sympy_moves: dict[str, Permutation],
-        pieces: list[set[int]]) -> dict[str, int | list[int] | list[set[int]] | list[list[int]] | Permutation]:
+        pieces: list[set[int]],
+        sequence_cache: Move_Sequence_Cache | None = None,
+        ) -> dict[str, int | list[set[int]] | set[int] | list[list[int]] | np.ndarray]:
     """
     Get the properties of a given move sequence:
         - order of the move sequence
@@ -344,15 +513,20 @@ def get_move_sequence_info(
         - number of affected points
     
     Returns:
+        dict: dictionary with keys "order", "affected_pieces", "n_affected_pieces", "affected_points", "cycles" and "perm" (index array)
     """
-    perm: Permutation = moves_list_to_sympy_permutation(move_sequence, sympy_moves)
-    move_sequence_info: dict[str, int | list[int] | list[set[int]] | list[list[int]] | Permutation] = {
-        "order": perm.order(), # int
-        "affected_pieces": get_affected_pieces(perm, pieces), # list[set[int]]
-        "n_affected_pieces": len(get_affected_pieces(perm, pieces)), # int
-        "affected_points": get_affected_points(perm), # set[int]
-        "cycles": perm.cyclic_form, # list[list[int]]
-        "perm": perm, # Permutation
+    permutation: np.ndarray = move_sequence_to_index_array(move_sequence, sympy_moves, sequence_cache)
+    cycles: list[list[int]] = index_array_to_cycles(permutation)
+    affected_points: np.ndarray = get_affected_point_indices(permutation)
+    point_pieces: np.ndarray = get_point_piece_indices(pieces, len(permutation))
+    affected_pieces: list[set[int]] = [pieces[i] for i in get_affected_piece_indices(affected_points, point_pieces)]
+    move_sequence_info: dict[str, int | list[set[int]] | set[int] | list[list[int]] | np.ndarray] = {
+        "order": lcm(1, *[len(cycle) for cycle in cycles]), # int
+        "affected_pieces": affected_pieces, # list[set[int]]
+        "n_affected_pieces": len(affected_pieces), # int
+        "affected_points": set(affected_points.tolist()), # set[int]
+        "cycles": cycles, # list[list[int]]
+        "perm": permutation, # np.ndarray
     }
     return move_sequence_info
 
@@ -451,8 +625,8 @@ def main(puzzle_name="rubiks_3x3"):
             inv_algorithm: Twisty_Puzzle_Algorithm = algorithm.get_inverse(inverse_moves_dict)
             print(f"Move sequence:         {algorithm.compact_moves()}")
             print(f"Inverse move sequence: {inv_algorithm.compact_moves()}")
-            print(f"Permutation:           {algorithm.sympy_permutation.cyclic_form}")
-            print(f"Inv Permutation:       {inv_algorithm.sympy_permutation.cyclic_form}")
+            print(f"Permutation:           {algorithm.cycles}")
+            print(f"Inv Permutation:       {inv_algorithm.cycles}")
     os._exit(0)
 
 if __name__ == "__main__":
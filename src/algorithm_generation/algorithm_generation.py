@@ -7,16 +7,25 @@ parentdir = os.path.dirname(currentdir)
 parent2dir = os.path.dirname(parentdir)
 sys.path.insert(0,parent2dir)
 
+import multiprocessing
+import queue
 import random
 import time
+from math import gcd
 
+import numpy as np
 from sympy.combinatorics import Permutation
-from sympy.combinatorics.perm_groups import PermutationGroup
 
-from src.smart_scramble import smart_scramble
+from src.smart_scramble import smart_scramble, scramble_n, get_action_orders
+from src.ai_modules.move_algebra import Move_Algebra
+from src.ai_modules.move_sequence_cache import Move_Sequence_Cache
 from src.algorithm_generation.algorithm_analysis import Twisty_Puzzle_Algorithm, get_move_sequence_info, get_inverse_moves_dict, get_inverse_name
 from src.interaction_modules.colored_text import colored_text
 from src.algorithm_generation.orbit_calculation import calculate_point_orbits
+from src.algorithm_generation.stabilizer_chain import Group_Order_Tracker
+from src.algorithm_generation.algorithm_index import Algorithm_Index
+from src.algorithm_generation.algorithm_library import Algorithm_Library
+from src.ai_modules.permutation_engine import move_to_index_array, invert_index_array
 
 DEBUG: bool = False
 
@@ -35,6 +44,8 @@ def generate_algorithms(
         max_algorithm_order: int = 6,
         max_pieces_affected: int | None = None, # automatic
         recursive: bool = False,
+        n_workers: int = 1,
+        algorithm_library: Algorithm_Library | None = None,
         verbosity: int = 2,
     ):
     """
@@ -48,6 +59,8 @@ def generate_algorithms(
         - time runs out or
         - maximum number of algorithms is reached
         - algorithms with rotations generate entire puzzle group
+    
+    If `n_workers > 1`, steps 1 and 2 run in `n_workers` worker processes that stream their candidates to this process (see `generate_candidates_parallel`). Steps 3 and 4 always run serially here.
         
     Args:
         puzzle (Twisty_Puzzle): object describing the puzzle (points, moves, etc.)
@@ -64,14 +77,18 @@ def generate_algorithms(
         max_algorithm_order (int): maximum order of an algorithm
         max_pieces_affected (int): maximum number of pieces affected by an algorithm
         recursive (bool): whether to allow algorithms in base sequences (can improve the found algorithms, but takes longer). Default: False
+        n_workers (int): number of worker processes generating base sequences. 1 to generate them in this process. Default: 1
+        algorithm_library (Algorithm_Library, optional): library of algorithms found in previous runs. Its algorithms are checked before generating new ones and all accepted algorithms are added to it. Default: None
         verbosity (int): verbosity level
     """
     if max_pieces_affected is None:
         raise NotImplementedError("Automatic calculation of max_pieces_affected is not implemented yet.\n" + 
                                   "This setting will eventually calculate the max number of pieces as the minimum/ median/ average/ maximum number of pieces affected by base moves.")
+    if n_workers > 1 and recursive:
+        raise ValueError("Recursive algorithm generation cannot be combined with multiple workers, since workers do not know the algorithms found so far.")
 
     end_time: float = time.time() + max_time
-    found_algorithms: list[Twisty_Puzzle_Algorithm] = [] # TODO: initialize with existing algorithms
+    found_algorithms: list[Twisty_Puzzle_Algorithm] = []
     # found_algorithms: list[Twisty_Puzzle_Algorithm] = puzzle.algorithms
     iterations_since_new_algorithm: int = 0
     num_base_sequences: int = 0
@@ -82,33 +99,82 @@ def generate_algorithms(
     #     n_points=n_points,
     #     moves=list(sympy_base_moves.values()),
     # )
-    inverse_moves_dict: dict[str, str] = get_inverse_moves_dict(puzzle.moves)
+    if getattr(puzzle, "analysis_cache", None) is not None:
+        inverse_moves_dict: dict[str, str] = puzzle.analysis_cache.get_inverse_moves_dict(puzzle.moves)
+    else:
+        inverse_moves_dict: dict[str, str] = get_inverse_moves_dict(puzzle.moves)
+    # compose base sequences and their repetitions from cached index arrays instead of multiplying sympy permutations
+    sequence_cache: Move_Sequence_Cache = Move_Sequence_Cache(sympy_base_moves, n_points)
+    # stabilizer chains of the group generated by the found algorithms and their rotations, updated incrementally
+    group_tracker: Group_Order_Tracker = Group_Order_Tracker(n_points)
+    # hash lookups of similar algorithms and algorithms equal up to rotation
+    algorithm_index: Algorithm_Index = Algorithm_Index(sympy_rotations, n_points)
     algs_generate_full_group: bool = False
     num_unique_algorithms: int = 1
     trimmed: bool = False
+    # algorithms of previous runs are checked first (shortest first). Algorithms that no longer achieve their stored permutation are skipped.
+    library_candidates: list[tuple[list[str], int]] = []
+    if algorithm_library is not None:
+        library_candidates = [
+            (algorithm.base_action_sequence, algorithm.n_repetitions)
+            for algorithm in reversed(algorithm_library.load_algorithms(puzzle, sympy_base_moves, sequence_cache))
+            if len(algorithm.base_action_sequence) <= max_base_sequence_length]
+        if verbosity:
+            print(f"Loaded {len(library_candidates)} algorithms from the algorithm library.")
+    candidate_stream = None
+    if n_workers > 1:
+        candidate_stream = generate_candidates_parallel(
+            SOLVED_STATE=puzzle.SOLVED_STATE,
+            moves=current_moves,
+            sympy_moves=sympy_base_moves,
+            pieces=puzzle.pieces,
+            n_workers=n_workers,
+            end_time=end_time,
+            max_base_sequence_length=max_base_sequence_length,
+            max_algorithm_moves=max_algorithm_moves,
+            max_algorithm_order=max_algorithm_order,
+        )
     while len(found_algorithms) < max_number_of_algorithms \
             and time.time() < end_time \
             and iterations_since_new_algorithm < max_iterations_without_new_algorithm:
-        # generate efficient base sequence for algorithms
-        sequence_length: int = random.randint(2, max_base_sequence_length)
-        base_sequence: list[str] = smart_scramble(
-            puzzle.SOLVED_STATE,
-            current_moves,
-            sequence_length)
+        if library_candidates:
+            # reuse an algorithm found in a previous run if it meets the current requirements
+            base_sequence, n_reps = library_candidates.pop()
+            base_sequence_order: int = get_move_sequence_info(
+                base_sequence, sympy_base_moves, puzzle.pieces, sequence_cache)["order"]
+            algorithm_order: int = base_sequence_order // gcd(base_sequence_order, n_reps)
+            repetitions_candidates: set[int] = set()
+            if algorithm_order <= max_algorithm_order and n_reps * len(base_sequence) <= max_algorithm_moves:
+                repetitions_candidates.add(n_reps)
+        elif candidate_stream is None:
+            # generate efficient base sequence for algorithms
+            sequence_length: int = random.randint(2, max_base_sequence_length)
+            base_sequence: list[str] = smart_scramble(
+                puzzle.SOLVED_STATE,
+                current_moves,
+                sequence_length)
+            if recursive:
+                base_sequence = [found_algorithms[move_name].full_action_sequence if move_name in found_algorithms else [move_name] for move_name in base_sequence]
+                base_sequence = [move for sublist in base_sequence for move in sublist]
+                print(f"Replaced algorithms to get base sequence: {' '.join(base_sequence)}")
+            # get cycles of base sequence
+            repetitions_candidates, base_sequence_info = get_repetition_candidates(
+                sympy_moves=sympy_base_moves,
+                base_sequence=base_sequence,
+                pieces=puzzle.pieces,
+                max_algorithm_moves=max_algorithm_moves,
+                max_algorithm_order=max_algorithm_order,
+                sequence_cache=sequence_cache)
+            base_sequence_order: int = base_sequence_info["order"]
+        else:
+            # receive the next base sequence evaluated by a worker process
+            candidate: tuple[list[str], int, set[int]] | None = next(candidate_stream, None)
+            if candidate is None: # time ran out while waiting for the workers
+                break
+            base_sequence, base_sequence_order, repetitions_candidates = candidate
         num_base_sequences += 1
-        if recursive:
-            base_sequence = [found_algorithms[move_name].full_action_sequence if move_name in found_algorithms else [move_name] for move_name in base_sequence]
-            base_sequence = [move for sublist in base_sequence for move in sublist]
-            print(f"Replaced algorithms to get base sequence: {' '.join(base_sequence)}")
-        # get cycles of base sequence
-        repetitions_candidates, base_sequence_info = get_repetition_candidates(
-            sympy_moves=sympy_base_moves,
-            base_sequence=base_sequence,
-            pieces=puzzle.pieces,
-            max_algorithm_moves=max_algorithm_moves,
-            max_algorithm_order=max_algorithm_order)
         # check if base sequence has too high order
-        if base_sequence_info["order"] > max_move_sequence_order:
+        if base_sequence_order > max_move_sequence_order:
             continue
         # check repetitions for useful algorithms
         for n_reps in repetitions_candidates:
@@ -120,6 +186,7 @@ def generate_algorithms(
                 puzzle=puzzle,
                 alg_name=f"alg_{num_unique_algorithms}",
                 sympy_moves=sympy_base_moves,
+                sequence_cache=sequence_cache,
             )
             # add algorithm if it meets the requirements
             iteration = num_base_sequences if verbosity else -1
@@ -130,13 +197,16 @@ def generate_algorithms(
                 max_pieces_affected=max_pieces_affected,
                 iteration=iteration,
                 add_similar_signatures=not trimmed,
+                algorithm_index=algorithm_index,
                 )
             if reason == "similar_signature" and algs_generate_full_group:
                 added_algorithms_step = False # once full group is reached, only add algorithms with new signatures
             # keep track of whether a new algorithm was added
             if added_algorithms_step:
+                if algorithm_library is not None:
+                    algorithm_library.add(algorithm)
                 if recursive:
-                    current_moves[algorithm.name] = algorithm.sympy_permutation.cyclic_form
+                    current_moves[algorithm.name] = algorithm.cycles
                     sympy_base_moves[algorithm.name] = algorithm.sympy_permutation
                 num_unique_algorithms += 1
                 # add inverse of new algorithm
@@ -149,11 +219,14 @@ def generate_algorithms(
                         max_pieces_affected=max_pieces_affected,
                         iteration=iteration,
                         ignore_match_with=algorithm.name,
+                        algorithm_index=algorithm_index,
                     )
                     
                     if added_algorithms_step_inv:
+                        if algorithm_library is not None:
+                            algorithm_library.add(inverse_algorithm)
                         if recursive:
-                            current_moves[inverse_algorithm.name] = inverse_algorithm.sympy_permutation.cyclic_form
+                            current_moves[inverse_algorithm.name] = inverse_algorithm.cycles
                             sympy_base_moves[inverse_algorithm.name] = inverse_algorithm.sympy_permutation
                             inverse_moves_dict[inverse_algorithm.name] = algorithm.name
                             inverse_moves_dict[algorithm.name] = inverse_algorithm.name
@@ -165,7 +238,7 @@ def generate_algorithms(
                         inverse_moves_dict[algorithm.name] = algorithm.name # algorithm is self-inverse under rotation
                 else:
                     inverse_moves_dict[algorithm.name] = algorithm.name # algorithm is self-inverse
-                algs_generate_full_group, current_group_order = full_group_reached(puzzle, found_algorithms, sympy_rotations)
+                algs_generate_full_group, current_group_order = full_group_reached(puzzle, found_algorithms, sympy_rotations, group_tracker)
                 # if algs_generate_full_group:
                 #     break
                 if not algs_generate_full_group:
@@ -179,12 +252,17 @@ def generate_algorithms(
                         target_group_order=current_group_order,
                         found_algorithms=found_algorithms,
                         sympy_rotations=sympy_rotations,
+                        group_tracker=group_tracker,
                     )
+                    algorithm_index.reset(found_algorithms)
                     trimmed: bool = True
         else:
             iterations_since_new_algorithm += 1
             continue
         # break
+    if candidate_stream is not None:
+        # stop the worker processes
+        candidate_stream.close()
     # print end condition
     if verbosity:
         print(f"Stopped after finding {len(found_algorithms)}/{max_number_of_algorithms} algorithms before trimming.")
@@ -219,15 +297,136 @@ def generate_algorithms(
             target_group_order=current_group_order,
             found_algorithms=found_algorithms,
             sympy_rotations=sympy_rotations,
+            group_tracker=group_tracker,
         )
     return found_algorithms
 
+def generate_candidates_parallel(
+        SOLVED_STATE: list[int],
+        moves: dict[str, list[list[int]]],
+        sympy_moves: dict[str, Permutation],
+        pieces: list[set[int]],
+        n_workers: int,
+        end_time: float,
+        max_base_sequence_length: int = 16,
+        max_algorithm_moves: int = float("inf"),
+        max_algorithm_order: int = float("inf"),
+        max_queue_size: int = 1000,
+    ):
+    """
+    Generate random base sequences and their repetition candidates in `n_workers` worker processes and yield them as they arrive.
+    Workers stop once the generator is closed or `end_time` is reached. The queue is bounded by `max_queue_size`, so workers pause if the consumer falls behind.
+
+    Args:
+        SOLVED_STATE (list[int]): solved state of the puzzle
+        moves (dict[str, list[list[int]]]): moves used for base sequences in cyclic form
+        sympy_moves (dict[str, Permutation]): the same moves as sympy permutations
+        pieces (list[set[int]]): list of all pieces in the puzzle
+        n_workers (int): number of worker processes
+        end_time (float): time (as given by `time.time()`) after which no more candidates are yielded
+        max_base_sequence_length (int): maximum number of moves in base sequence
+        max_algorithm_moves (int): maximum number of moves in an algorithm
+        max_algorithm_order (int): maximum order of an algorithm
+        max_queue_size (int): maximum number of candidates waiting to be consumed. Defaults to 1000.
+
+    Yields:
+        (list[str]): base sequence
+        (int): order of the base sequence
+        (set[int]): repetition candidates of the base sequence (see `get_repetition_candidates`)
+    """
+    context = multiprocessing.get_context()
+    candidate_queue = context.Queue(maxsize=max_queue_size)
+    stop_event = context.Event()
+    workers: list[multiprocessing.Process] = [
+        context.Process(
+            target=_candidate_worker,
+            args=(
+                candidate_queue,
+                stop_event,
+                SOLVED_STATE,
+                moves,
+                sympy_moves,
+                pieces,
+                max_base_sequence_length,
+                max_algorithm_moves,
+                max_algorithm_order,
+                random.randrange(2**32), # forked workers would otherwise share the random state
+            ),
+            daemon=True,
+        )
+        for _ in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        while (remaining_time := end_time - time.time()) > 0:
+            try:
+                candidate: tuple[list[str], int, set[int]] = candidate_queue.get(timeout=remaining_time)
+            except queue.Empty:
+                return
+            yield candidate
+    finally:
+        stop_event.set()
+        # empty the queue, so workers waiting to put candidates can exit
+        while any(worker.is_alive() for worker in workers):
+            try:
+                candidate_queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        for worker in workers:
+            worker.join()
+
+def _candidate_worker(
+        candidate_queue: multiprocessing.Queue,
+        stop_event: multiprocessing.Event,
+        SOLVED_STATE: list[int],
+        moves: dict[str, list[list[int]]],
+        sympy_moves: dict[str, Permutation],
+        pieces: list[set[int]],
+        max_base_sequence_length: int,
+        max_algorithm_moves: int,
+        max_algorithm_order: int,
+        seed: int,
+    ):
+    """
+    Worker process of `generate_candidates_parallel`: put base sequences, their order and repetition candidates into `candidate_queue` until `stop_event` is set.
+    Base sequences are generated like in `smart_scramble`, but the move algebra is only calculated once.
+    """
+    random.seed(seed)
+    n_points: int = len(SOLVED_STATE)
+    action_orders: dict[str, int] = get_action_orders(moves)
+    move_algebra: Move_Algebra = Move_Algebra.from_actions_dict(moves, n_points)
+    sequence_cache: Move_Sequence_Cache = Move_Sequence_Cache(sympy_moves, n_points)
+    while not stop_event.is_set():
+        sequence_length: int = random.randint(2, max_base_sequence_length)
+        base_sequence: list[str] = scramble_n(
+            SOLVED_STATE,
+            moves,
+            sequence_length,
+            action_orders,
+            move_algebra=move_algebra)
+        repetitions_candidates, base_sequence_info = get_repetition_candidates(
+            sympy_moves=sympy_moves,
+            base_sequence=base_sequence,
+            pieces=pieces,
+            max_algorithm_moves=max_algorithm_moves,
+            max_algorithm_order=max_algorithm_order,
+            sequence_cache=sequence_cache)
+        candidate: tuple[list[str], int, set[int]] = (base_sequence, int(base_sequence_info["order"]), repetitions_candidates)
+        while not stop_event.is_set():
+            try:
+                candidate_queue.put(candidate, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
 def get_repetition_candidates(
         sympy_moves: dict[str, Permutation],
         base_sequence: list[str],
         pieces: list[set[int]],
         max_algorithm_moves: int = float("inf"),
         max_algorithm_order: int = float("inf"),
+        sequence_cache: Move_Sequence_Cache | None = None,
         ) -> tuple[set[int], dict[str, any]]:
     """
     Get all number repetitions of a given base sequence that could yield a useful algorithm.
@@ -238,6 +437,7 @@ def get_repetition_candidates(
         base_sequence (list[str]): a list of move names
         max_algorithm_moves (int): maximum number of moves an algorithm can have
         max_algorithm_order (int): maximum order of an algorithm
+        sequence_cache (Move_Sequence_Cache, optional): cache of composed move sequences. Defaults to None.
 
     Returns:
         (set[int]): set of repetition candidates
@@ -247,6 +447,7 @@ def get_repetition_candidates(
             move_sequence=base_sequence,
             sympy_moves=sympy_moves,
             pieces=pieces,
+            sequence_cache=sequence_cache,
     )
     repetitions_candidates: set[int] = set()
     for cycle in base_sequence_info["cycles"]:
@@ -275,6 +476,7 @@ def filter_and_add_algorithm(
         iteration: int = -1,
         ignore_match_with: str = "",
         add_similar_signatures: bool = True,
+        algorithm_index: Algorithm_Index | None = None,
         ) -> bool:
     """
     Add a newly found algorithm to the list of found algorithms if it is sufficiently different from existing ones or if it achieves the same permutation in fewer moves.
@@ -284,6 +486,7 @@ def filter_and_add_algorithm(
         found_algorithms (list[Twisty_Puzzle_Algorithm]): list of existing algorithms
         rotations (list[Permutation]): list of permutations that rotate the puzzle in 3D space
         max_pieces_affected (int): maximum number of pieces affected by the algorithm
+        algorithm_index (Algorithm_Index, optional): index of `found_algorithms`. Updated if `found_algorithms` changes. If None, a temporary index is built.
 
     Returns:
         (bool): True if the algorithm was added, False otherwise. None 
@@ -292,55 +495,32 @@ def filter_and_add_algorithm(
     if len(new_algorithm.affected_pieces) > max_pieces_affected:
         # algorithm affects too many pieces
         return False, "too many pieces affected"
+    if algorithm_index is None:
+        algorithm_index = Algorithm_Index(rotations, len(new_algorithm.puzzle.SOLVED_STATE), found_algorithms)
     accepted_new_algorithm: bool = False
-    potential_matches: list[Twisty_Puzzle_Algorithm] = []
+    # check if the new algorithm or any rotation of it exists in the found algorithms
+    for alg in algorithm_index.get_equivalent(new_algorithm):
+        rotated: bool = not algorithm_index.equal_permutations(new_algorithm, alg)
+        # ignore match with a given algorithm to avoid not adding inverses for algs that are self-inverse under rotation.
+        if rotated and alg.name == ignore_match_with:
+            continue
+        if len(new_algorithm.full_action_sequence) < len(alg.full_action_sequence):
+            if iteration >= 0:
+                print(f"iter {iteration}: Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
+            else:
+                print(f"Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
+            # rename new algorithm to old name
+            new_algorithm.name = alg.name
+            # replace old algorithm with new one in-place
+            found_algorithms[found_algorithms.index(alg)] = new_algorithm
+            algorithm_index.replace(alg, new_algorithm)
+            accepted_new_algorithm = True
+            return accepted_new_algorithm, "replaced with rotation" if rotated else "replaced without rotation"
+        if rotated:
+            return accepted_new_algorithm, f"not replaced due to similarity to {alg.name} under rotation"
+        return accepted_new_algorithm, f"not replaced due to similarity to {alg.name}"
     # compare algorithm signatures
-    for alg in found_algorithms:
-        if new_algorithm.is_similar(alg):
-            potential_matches.append(alg)
-    for alg in potential_matches:
-        if new_algorithm.sympy_permutation.cyclic_form == alg.sympy_permutation.cyclic_form:
-            if len(new_algorithm.full_action_sequence) < len(alg.full_action_sequence):
-                if iteration >= 0:
-                    print(f"iter {iteration}: Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
-                else:
-                    print(f"Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
-                # rename new algorithm to old name
-                new_algorithm.name = alg.name
-                # replace old algorithm with new one in-place
-                found_algorithms[found_algorithms.index(alg)] = new_algorithm
-                # found_algorithms.append(new_algorithm)
-                accepted_new_algorithm = True
-                return accepted_new_algorithm, "replaced without rotation"
-            return accepted_new_algorithm, f"not replaced due to similarity to {alg.name}"
-    # check if any rotation of the new algorithm exists in the found algorithms
-    for rotation_name, rotation_perm in rotations.items():
-        rotated_alg_perm: Permutation = rotation_perm * new_algorithm.sympy_permutation * rotation_perm**-1
-        for alg in potential_matches:
-            # ignore match with a given algorithm to avoid not adding inverses for algs that are self-inverse under rotation.
-            if alg.name == ignore_match_with:
-                continue
-            # if rotated_alg_perm.cyclic_form == alg.sympy_permutation.cyclic_form:
-            if rotated_alg_perm.cyclic_form == alg.sympy_permutation.cyclic_form:# \
-                # or new_algorithm.is_similar(alg):
-                # check if new algorithm is shorter
-                if len(new_algorithm.full_action_sequence) < len(alg.full_action_sequence):
-                    if iteration >= 0:
-                        print(f"iter {iteration}: Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
-                    else:
-                        print(f"Replacing old algorithm with new one:\n  old: {alg}\n  new: {new_algorithm}")
-                    # rename new algorithm to old name
-                    new_algorithm.name = alg.name
-                    # replace old algorithm with new one in-place
-                    found_algorithms[found_algorithms.index(alg)] = new_algorithm
-                    # found_algorithms.append(new_algorithm)
-                    accepted_new_algorithm = True
-                    return accepted_new_algorithm, "replaced with rotation"
-                return accepted_new_algorithm, f"not replaced due to similarity to {alg.name} under rotation {rotation_name}"
-        # # break out of both loops if a match is found
-        # else:
-        #     continue
-        # break
+    potential_matches: list[Twisty_Puzzle_Algorithm] = algorithm_index.get_similar(new_algorithm)
     if not potential_matches:
         # add new algorithm if no potential matches were found
         if iteration >= 0:
@@ -348,30 +528,18 @@ def filter_and_add_algorithm(
         else:
             print(f"Adding new algorithm:\n  {new_algorithm}")
         found_algorithms.append(new_algorithm)
+        algorithm_index.add(new_algorithm)
         accepted_new_algorithm = True
         reason: str = "new algorithm"
     elif add_similar_signatures: # similar algorithms exist, but no exact match
-    #     print("="*75) if DEBUG else None
-        suffix = " = " + colored_text(str(new_algorithm.sympy_permutation.cyclic_form), color="#5588ff") if DEBUG else ""
+        suffix = " = " + colored_text(str(new_algorithm.cycles), color="#5588ff") if DEBUG else ""
         if iteration >= 0:
             print(f"iter {iteration}: Adding new algorithm with similar signature to existing ones:\n  {new_algorithm}"
               + suffix)
         else:
             print(f"Adding new algorithm with similar signature to existing ones:\n  {new_algorithm}" + suffix)
-    #     if DEBUG:
-    #         # print cyclic forms and index in found_algorithms for all potential matches
-    #         print(f"Potential matches:")
-    #         cyclic_forms_of_matches = [alg.sympy_permutation.cyclic_form for alg in potential_matches]
-    #         for alg, cyclic_form in zip(potential_matches, cyclic_forms_of_matches):
-    #             # index = found_algorithms.index(alg)
-    #             print(f"  {alg.name:6} -> {colored_text(str(cyclic_form), color='#5588ff')}")
-    #         # print rotations of new algorithm
-    #         print(f"Rotations of new algorithm:")
-    #         for rot_name, rotation_perm in rotations.items():
-    #             rotated_alg_perm: Permutation = rotation_perm * new_algorithm.sympy_permutation * rotation_perm**-1
-    #             color = "#22dd22" if rotated_alg_perm.cyclic_form in cyclic_forms_of_matches else "#ff2222"
-    #             print(colored_text(f"  {rot_name:6} -> {rotated_alg_perm.cyclic_form}", color=color))
         found_algorithms.append(new_algorithm)
+        algorithm_index.add(new_algorithm)
         accepted_new_algorithm = True
         reason: str = "similar signature"
     else:
@@ -385,7 +553,24 @@ def trim_algorithms_to_current_group(
         found_algorithms: list[Twisty_Puzzle_Algorithm],
         sympy_rotations: list[Permutation],
         verbosity: int = 1,
+        group_tracker: Group_Order_Tracker | None = None,
     ) -> list[Twisty_Puzzle_Algorithm]:
+    """
+    Remove algorithms (and their inverses) that are not necessary to generate the group of the given order together with the rotations. Of each algorithm signature, at least one algorithm is kept.
+
+    Args:
+        puzzle (Twisty_Puzzle): the puzzle object
+        target_group_order (int): order of the group the remaining algorithms need to generate
+        found_algorithms (list[Twisty_Puzzle_Algorithm]): list of found algorithms. Sorted and trimmed in-place.
+        sympy_rotations (list[Permutation]): list of permutations that rotate the puzzle in 3D space
+        verbosity (int): verbosity level
+        group_tracker (Group_Order_Tracker, optional): group tracker to reuse stabilizer chains of previous calls. Defaults to None.
+
+    Returns:
+        list[Twisty_Puzzle_Algorithm]: the remaining algorithms
+    """
+    if group_tracker is None:
+        group_tracker = Group_Order_Tracker(len(puzzle.SOLVED_STATE))
     old_num_algs: int = len(found_algorithms)
     removed_algorithm: bool = True
     # sort algorithms by decreasing length.
@@ -402,6 +587,7 @@ def trim_algorithms_to_current_group(
     iteration_counter: int = 0
     while removed_algorithm:
         iteration_counter += 1
+        update_group_tracker(group_tracker, found_algorithms, sympy_rotations)
         # search for redundant algorithms
         for i, alg in enumerate(found_algorithms):
             # skip known necessary algorithms and their inverses
@@ -420,10 +606,7 @@ def trim_algorithms_to_current_group(
                 "" if verbosity < 2 else print(f"Keeping algorithm {str(alg):40} due to unique signature: {alg.algorithm_signature}.")
                 continue
             # Keep current algorithm, if removing would increasthe number of unreachable states with this set of algorithms
-            algs_generate_full_group, current_group_order = full_group_reached(
-                puzzle,
-                temp_shortened_algorithms,
-                sympy_rotations)
+            current_group_order: int = group_tracker.order_without(set(range(i, i + skip_algs)))
             if current_group_order == target_group_order:
                 # algorithm can be removed without losing group order
                 "" if verbosity < 2 else print(f"Removing algorithm {alg} due to group order.")
@@ -493,7 +676,8 @@ def full_group_reached(
         puzzle: "Twisty_Puzzle",
         found_algorithms: list[Twisty_Puzzle_Algorithm],
         rotations: list[Permutation],
-    ) -> tuple[bool, PermutationGroup]:
+        group_tracker: Group_Order_Tracker | None = None,
+    ) -> tuple[bool, int]:
     """
     Check if group generated by the found algorithms is the same as the one generated by the base moves. To calculate orbits of the found algorithms, we need to consider all possible rotations of the algorithms (i.e. all possible conjugates of the permutations).
     
@@ -501,19 +685,45 @@ def full_group_reached(
         puzzle (Twisty_Puzzle): the puzzle object
         found_algorithms (list[Twisty_Puzzle_Algorithm]): list of found algorithms
         rotations (list[Permutation]): list of permutations that rotate the puzzle in 3D space
+        group_tracker (Group_Order_Tracker, optional): group tracker of previous calls. Only algorithms that changed since then are added to the stabilizer chain. Defaults to None.
 
     Returns:
         (bool): True if the group generated by the algorithms is the same as the one generated by the base moves
-        (PermutationGroup): group generated by the algorithms
+        (int): order of the group generated by the algorithms
+    """
+    if group_tracker is None:
+        group_tracker = Group_Order_Tracker(len(puzzle.SOLVED_STATE))
+    update_group_tracker(group_tracker, found_algorithms, rotations)
+    algorithm_group_order: int = group_tracker.order()
+    return algorithm_group_order == puzzle.state_space_size, algorithm_group_order
+
+def update_group_tracker(
+        group_tracker: Group_Order_Tracker,
+        found_algorithms: list[Twisty_Puzzle_Algorithm],
+        rotations: list[Permutation],
+    ):
+    """
+    Update the group tracker to track the group generated by the found algorithms and their rotations. The generator sets of all algorithms after the first one that differs from the tracked algorithms are replaced.
+
+    Args:
+        group_tracker (Group_Order_Tracker): the group tracker to update
+        found_algorithms (list[Twisty_Puzzle_Algorithm]): list of found algorithms
+        rotations (list[Permutation]): list of permutations that rotate the puzzle in 3D space
     """
-    rotated_algorithms: list[Permutation] = [alg.sympy_permutation for alg in found_algorithms]
-    for rotation_perm in rotations.values():
-        rotated_algorithms += [rotation_perm * alg.sympy_permutation * rotation_perm**-1 for alg in found_algorithms]
-    # generate group from rotated algorithms
-    algorithm_group = PermutationGroup(rotated_algorithms)
-    if algorithm_group.order() == puzzle.state_space_size:
-        return True, algorithm_group.order()
-    return False, algorithm_group.order()
+    n_unchanged: int = 0
+    for tracked_algorithm, algorithm in zip(group_tracker.keys, found_algorithms):
+        if tracked_algorithm is not algorithm:
+            break
+        n_unchanged += 1
+    group_tracker.truncate(n_unchanged)
+    n_points: int = group_tracker.n_points
+    rotation_arrays: list[np.ndarray] = [move_to_index_array(rotation_perm, n_points) for rotation_perm in rotations.values()]
+    for algorithm in found_algorithms[n_unchanged:]:
+        algorithm_array: np.ndarray = algorithm.permutation
+        # conjugates `rotation * algorithm * rotation**-1` (sympy applies the left factor first)
+        group_tracker.append(
+            algorithm,
+            [algorithm_array] + [invert_index_array(rotation)[algorithm_array[rotation]] for rotation in rotation_arrays])
     # found_orbits: list[set[int]] = calculate_point_orbits(
     #     n_points=n_points,
     #     moves=rotated_algorithms,
@@ -533,13 +743,12 @@ def main(puzzle_name: str = "rubiks_3x3", rotations_prefix: str = "rot_") -> lis
     """
     Generate algorithms for the given puzzle.
     """
-    from src.puzzle_class import Twisty_Puzzle
+    from src.puzzle_model import Puzzle_Model
     from algorithm_analysis import get_sympy_moves
 
     print(f"Generating algorithms for {puzzle_name}...")
 
-    puzzle = Twisty_Puzzle()
-    puzzle.load_puzzle(puzzle_name)
+    puzzle = Puzzle_Model(puzzle_name)
 
     sympy_moves: dict[str, Permutation] = get_sympy_moves(puzzle)
     sympy_rotations: dict[str, Permutation] = {name: perm for name, perm in sympy_moves.items() if name.startswith(rotations_prefix)}
@@ -13,10 +13,11 @@ if __name__ == "__main__":
 
 from sympy.combinatorics import Permutation
 
-from src.puzzle_class import Twisty_Puzzle
+from src.puzzle_model import Puzzle_Model
 from src.interaction_modules.colored_text import colored_text
 from src.algorithm_generation.algorithm_analysis import Twisty_Puzzle_Algorithm, get_sympy_moves
 from src.algorithm_generation.algorithm_generation import generate_algorithms
+from src.algorithm_generation.algorithm_library import Algorithm_Library
 
 COMMAND_COLORS = {
     "command": "#ff8800",  # orange
@@ -24,6 +25,8 @@ COMMAND_COLORS = {
     "headline": "#22dd22",  # green
 }
 ALL_PUZZLES = [f for f in os.listdir(os.path.join("src", "puzzles")) if os.path.isdir(os.path.join("src", "puzzles", f))]
+# vpython views of headless puzzles, created when an algorithm is first shown (id of model -> view)
+_PUZZLE_VIEWS: dict[int, "Twisty_Puzzle"] = dict()
 
 def list_algorithms(user_input_algorithms: list[Twisty_Puzzle_Algorithm], alg_prefix="alg_"):
     print("=" * 75)
@@ -36,7 +39,7 @@ def list_algorithms(user_input_algorithms: list[Twisty_Puzzle_Algorithm], alg_pr
         print(f"order={int(alg.order):3}", end=", ")
         print(f"pieces={alg.n_affected_pieces:3}", end=", ")
         print(colored_text(f'{alg.compact_moves():55}', COMMAND_COLORS['arguments']), end=" -> ")
-        print(colored_text(alg.sympy_permutation.cyclic_form, COMMAND_COLORS['arguments']))
+        print(colored_text(alg.cycles, COMMAND_COLORS['arguments']))
     print("=" * 75)
 
 def print_algorithm(alg: Twisty_Puzzle_Algorithm, alg_number: int):
@@ -47,10 +50,29 @@ def print_algorithm(alg: Twisty_Puzzle_Algorithm, alg_number: int):
     print(alg)
     alg.print_signature()
 
-def show_algorithm_on_puzzle(puzzle: Twisty_Puzzle, alg: Twisty_Puzzle_Algorithm):
+def get_puzzle_view(puzzle: "Puzzle_Model | Twisty_Puzzle", anim_time: float = 0.1) -> "Twisty_Puzzle":
+    """
+    Get a vpython view of the given puzzle. For headless puzzles, the view (and the vpython server) is only created when it is first needed.
+
+    Args:
+        puzzle (Puzzle_Model | Twisty_Puzzle): the puzzle
+        anim_time (float, optional): Animation time of a newly created view. Defaults to 0.1.
+
+    Returns:
+        Twisty_Puzzle: view of the puzzle
+    """
+    if not isinstance(puzzle, Puzzle_Model):
+        return puzzle
+    if id(puzzle) not in _PUZZLE_VIEWS:
+        from src.puzzle_class import Twisty_Puzzle
+        _PUZZLE_VIEWS[id(puzzle)] = Twisty_Puzzle(puzzle)
+        _PUZZLE_VIEWS[id(puzzle)].animation_time = anim_time
+    return _PUZZLE_VIEWS[id(puzzle)]
+
+def show_algorithm_on_puzzle(puzzle: "Twisty_Puzzle", alg: Twisty_Puzzle_Algorithm):
     puzzle.animation_time = 1
     alg_name = alg.name
-    move_cycles = alg.sympy_permutation.cyclic_form
+    move_cycles = alg.cycles
     puzzle._add_move_direct(alg_name, move_cycles, verbose=0)
     puzzle.perform_move(alg_name)
     puzzle.del_move(alg_name)
@@ -77,12 +99,13 @@ def print_command_help():
     print("=" * 75)
 
 def user_test_algorithms(
-        puzzle: Twisty_Puzzle,
+        puzzle: "Puzzle_Model | Twisty_Puzzle",
         algorithms: list[Twisty_Puzzle_Algorithm],
-        saved_algs: dict[str, Twisty_Puzzle_Algorithm]
+        saved_algs: dict[str, Twisty_Puzzle_Algorithm],
+        anim_time: float = 0.1,
         ) -> tuple[str, dict[str, Twisty_Puzzle_Algorithm]]:
     """
-    Allow user to visualize the given algorithms on the puzzle.
+    Allow user to visualize the given algorithms on the puzzle. The vpython view of the puzzle is created when the first algorithm is shown.
     """
     list_algorithms(algorithms)
     names_to_algorithms: dict[str, Twisty_Puzzle_Algorithm] = {alg.name: alg for alg in algorithms}
@@ -105,7 +128,7 @@ def user_test_algorithms(
 
         if command == "reset":
             # reset puzzle
-            puzzle.reset_to_solved()
+            get_puzzle_view(puzzle, anim_time).reset_to_solved()
             print(f"{colored_text('Algorithms reset.', COMMAND_COLORS['headline'])}")
             continue
 
@@ -115,7 +138,7 @@ def user_test_algorithms(
                 alg_number = int(command.split()[1])
                 alg = algorithms[alg_number-1]
                 print_algorithm(alg, alg_number)
-                show_algorithm_on_puzzle(puzzle, alg)
+                show_algorithm_on_puzzle(get_puzzle_view(puzzle, anim_time), alg)
             except (IndexError, ValueError):
                 print(f"{colored_text('Invalid algorithm number.', COMMAND_COLORS['headline'])}")
             continue
@@ -125,7 +148,7 @@ def user_test_algorithms(
             # find algorithm by name
             alg: Twisty_Puzzle_Algorithm = names_to_algorithms[alg_name]
             print_algorithm(alg, alg_name)
-            show_algorithm_on_puzzle(puzzle, alg)
+            show_algorithm_on_puzzle(get_puzzle_view(puzzle, anim_time), alg)
             continue
         except ValueError:
             print(f"{colored_text('Invalid command.', COMMAND_COLORS['headline'])}")
@@ -134,7 +157,7 @@ def user_test_algorithms(
             print(f"{colored_text('Algorithm not found.', COMMAND_COLORS['headline'])}")
 
 def add_moves_to_puzzle(
-        puzzle: Twisty_Puzzle,
+        puzzle: "Puzzle_Model | Twisty_Puzzle",
         algorithms: dict[str, Twisty_Puzzle_Algorithm],
         new_moves: dict[str, list[int]],
         new_puzzle_name: str = "",
@@ -144,7 +167,7 @@ def add_moves_to_puzzle(
     Add moves to a puzzle and save it under a new name. If name already exists, a console interaction will ask if the existing puzzle should be overwritten and offer to enter a new name.
 
     Args:
-        puzzle (Twisty_Puzzle): Puzzle to add moves to.
+        puzzle (Puzzle_Model | Twisty_Puzzle): Puzzle to add moves to.
         algorithms (dict[str, Twisty_Puzzle_Algorithm]): Dictionary of current algorithms.
         new_moves (dict[str, Twisty_Puzzle_Algorithm]): Dictionary of moves to add to the puzzle.
         new_puzzle_name (str, optional): Name of the new puzzle. Defaults to "".
@@ -189,7 +212,7 @@ def add_moves_to_puzzle(
     return new_puzzle_name
 
 def generate_save_algorithms(
-        puzzle: Twisty_Puzzle,
+        puzzle: "Puzzle_Model | Twisty_Puzzle",
         anim_time: float = 0.1,
         rotations_prefix: str = "rot_",
         max_time: int = 300,
@@ -200,15 +223,19 @@ def generate_save_algorithms(
         max_pieces_affected: int = 4,
         max_number_of_algorithms: int = 48,
         max_iterations_without_new_algorithm: int = 5000,
+        n_workers: int = 1,
+        use_algorithm_library: bool = True,
         verbosity: int = 2
     ):
     """
     Automatically find algorithms (move sequences with low order, affecting few pieces) for the given puzzle and save them to the puzzle.
     
     Args:
-        puzzle (Twisty_Puzzle): Puzzle to find algorithms for.
-        anim_time (float, optional): Animation time for the puzzle. Defaults to 0.1.
+        puzzle (Puzzle_Model | Twisty_Puzzle): Puzzle to find algorithms for.
+        anim_time (float, optional): Animation time for the puzzle view. Defaults to 0.1.
         rotations_prefix (str, optional): Prefix for rotation moves. Defaults to "rot_".
+        n_workers (int, optional): Number of worker processes generating base sequences. Defaults to 1.
+        use_algorithm_library (bool, optional): Whether to start with the algorithms found in previous runs and store new ones in the puzzle's algorithm library. Defaults to True.
     """
     alg_generation_params: dict[str, int] = {
         "max_time": max_time,
@@ -219,6 +246,7 @@ def generate_save_algorithms(
         "max_pieces_affected": max_pieces_affected,
         "max_number_of_algorithms": max_number_of_algorithms,
         "max_iterations_without_new_algorithm": max_iterations_without_new_algorithm,
+        "n_workers": n_workers,
         # "verbosity": verbosity,
     }
     if verbosity > 1:
@@ -232,8 +260,10 @@ def generate_save_algorithms(
     sympy_base_moves = {name: perm for name, perm in sympy_moves.items() if not name in sympy_rotations}
 
     current_algorithms: dict[str, Twisty_Puzzle_Algorithm] = {}
-    old_anim_time = puzzle.animation_time
-    puzzle.animation_time = anim_time
+    algorithm_library: Algorithm_Library | None = Algorithm_Library(puzzle.PUZZLE_NAME) if use_algorithm_library else None
+    if not isinstance(puzzle, Puzzle_Model):
+        old_anim_time = puzzle.animation_time
+        puzzle.animation_time = anim_time
 
     while True:
         profile = cProfile.Profile()
@@ -250,6 +280,8 @@ def generate_save_algorithms(
             max_pieces_affected=max_pieces_affected,
             max_number_of_algorithms=max_number_of_algorithms,
             max_iterations_without_new_algorithm=max_iterations_without_new_algorithm,
+            n_workers=n_workers,
+            algorithm_library=algorithm_library,
             verbosity=verbosity,
         )
         if verbosity > 2:
@@ -257,16 +289,18 @@ def generate_save_algorithms(
             ps.sort_stats(("tottime"))
             ps.print_stats(20)
 
-        state, saved_algs = user_test_algorithms(puzzle, new_algorithms, current_algorithms)
+        state, saved_algs = user_test_algorithms(puzzle, new_algorithms, current_algorithms, anim_time=anim_time)
         current_algorithms = {alg.name: alg for alg in new_algorithms}
         if state == "exit":
             break
+    if algorithm_library is not None:
+        algorithm_library.close()
 
     # save puzzle with new algorithms
     new_puzzle_name = puzzle.PUZZLE_NAME
     if input("Do you want to save the puzzle with the new algorithms? (y/N): ").strip().lower() == "y":
         # TODO: save algorithm generation parameters.
-        algorithm_moves: dict[str, list[int]] = {name: alg.sympy_permutation.cyclic_form for name, alg in current_algorithms.items()}
+        algorithm_moves: dict[str, list[int]] = {name: alg.cycles for name, alg in current_algorithms.items()}
         new_puzzle_name = add_moves_to_puzzle(
             puzzle=puzzle,
             algorithms=current_algorithms,
@@ -278,18 +312,37 @@ def generate_save_algorithms(
             json.dump(alg_generation_params, file, indent=4)
         print(f"Saved algorithm generation parameters to {colored_text(alg_generation_params_file, COMMAND_COLORS['arguments'])}")
     # reset animation time
-    puzzle.animation_time = old_anim_time
+    if not isinstance(puzzle, Puzzle_Model):
+        puzzle.animation_time = old_anim_time
     return new_puzzle_name
 
 def main(move_text_color="#5588ff", rotations_prefix="rot_"):
-    puzzle, puzzle_name = load_twisty_puzzle()
+    puzzle, puzzle_name = load_puzzle_model()
     new_puzzle_name = generate_save_algorithms(
         puzzle,
         verbosity=3,
     )
     os._exit(0)
 
+def load_puzzle_model(puzzle_name: str = None) -> tuple[Puzzle_Model, str]:
+    """
+    Ask for a puzzle name (if none is given) and load the puzzle without visualization.
+    """
+    print(f"Available puzzles: {colored_text(', '.join(ALL_PUZZLES), COMMAND_COLORS['arguments'])}")
+    print(f"Enter {colored_text('exit', COMMAND_COLORS['command'])} to exit the program.")
+
+    if not puzzle_name:
+        puzzle_name = input("Enter a puzzle name: ").strip()
+    try:
+        puzzle = Puzzle_Model(puzzle_name)
+    except FileNotFoundError:
+        print(f"{colored_text('Puzzle not found.', COMMAND_COLORS['headline'])}")
+        os._exit(0)
+    puzzle.print_summary()
+    return puzzle, puzzle_name
+
 def load_twisty_puzzle(puzzle_name: str = None):
+    from src.puzzle_class import Twisty_Puzzle
     print(f"Available puzzles: {colored_text(', '.join(ALL_PUZZLES), COMMAND_COLORS['arguments'])}")
     print(f"Enter {colored_text('exit', COMMAND_COLORS['command'])} to exit the program.")
 
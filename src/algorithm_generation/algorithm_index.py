@@ -0,0 +1,158 @@
+"""
+This module implements an index of twisty puzzle algorithms for fast similarity and duplicate lookups.
+
+Two algorithms are
+    - similar, if they have the same order and algorithm signature (see `Twisty_Puzzle_Algorithm.is_similar`),
+    - equivalent, if one of them is a rotation of the other, i.e. their permutations are conjugate under the rotation group of the puzzle.
+Both relations are turned into hash lookups: similar algorithms share the key `(order, signature)`, equivalent algorithms share the same canonical permutation, the lexicographically smallest of all conjugates `rotation * algorithm * rotation**-1`.
+
+Author: Sebastian Jost
+"""
+import numpy as np
+from sympy.combinatorics import Permutation
+
+from src.ai_modules.permutation_engine import move_to_index_array, invert_index_array
+from src.algorithm_generation.algorithm_analysis import Twisty_Puzzle_Algorithm
+
+
+class Algorithm_Index:
+    """
+    Index of algorithms by their similarity key and their canonical permutation under rotations.
+
+    Args:
+        rotations (dict[str, Permutation]): permutations that rotate the puzzle in 3D space. The index uses the whole group generated by them.
+        n_points (int): number of points of the puzzle
+        algorithms (list[Twisty_Puzzle_Algorithm], optional): algorithms to add to the index. Defaults to None.
+    """
+    def __init__(self,
+            rotations: dict[str, Permutation],
+            n_points: int,
+            algorithms: list[Twisty_Puzzle_Algorithm] | None = None,
+            ):
+        self.n_points: int = n_points
+        self.rotation_group: np.ndarray = get_rotation_group_arrays(rotations, n_points)
+        self.inverse_rotation_group: np.ndarray = np.array(
+            [invert_index_array(rotation) for rotation in self.rotation_group])
+        self._similar: dict[tuple, list[Twisty_Puzzle_Algorithm]] = dict()
+        self._equivalent: dict[bytes, list[Twisty_Puzzle_Algorithm]] = dict()
+        # id of indexed algorithm -> (permutation as index array, canonical key)
+        self._algorithm_keys: dict[int, tuple[np.ndarray, bytes]] = dict()
+        self.reset(algorithms)
+
+    def __len__(self) -> int:
+        return len(self._algorithm_keys)
+
+    def reset(self, algorithms: list[Twisty_Puzzle_Algorithm] | None = None):
+        """
+        Remove all algorithms from the index, then add the given ones.
+
+        Args:
+            algorithms (list[Twisty_Puzzle_Algorithm], optional): algorithms to add to the index. Defaults to None.
+        """
+        self._similar.clear()
+        self._equivalent.clear()
+        self._algorithm_keys.clear()
+        for algorithm in algorithms or []:
+            self.add(algorithm)
+
+    def add(self, algorithm: Twisty_Puzzle_Algorithm):
+        """
+        Add an algorithm to the index.
+        """
+        permutation, canonical_key = self._get_keys(algorithm)
+        self._algorithm_keys[id(algorithm)] = (permutation, canonical_key)
+        self._similar.setdefault(get_similarity_key(algorithm), []).append(algorithm)
+        self._equivalent.setdefault(canonical_key, []).append(algorithm)
+
+    def remove(self, algorithm: Twisty_Puzzle_Algorithm):
+        """
+        Remove an algorithm from the index.
+        """
+        _, canonical_key = self._algorithm_keys.pop(id(algorithm))
+        _remove_by_identity(self._similar, get_similarity_key(algorithm), algorithm)
+        _remove_by_identity(self._equivalent, canonical_key, algorithm)
+
+    def replace(self, old_algorithm: Twisty_Puzzle_Algorithm, new_algorithm: Twisty_Puzzle_Algorithm):
+        """
+        Replace an indexed algorithm with a new one.
+        """
+        self.remove(old_algorithm)
+        self.add(new_algorithm)
+
+    def get_similar(self, algorithm: Twisty_Puzzle_Algorithm) -> list[Twisty_Puzzle_Algorithm]:
+        """
+        Returns:
+            list[Twisty_Puzzle_Algorithm]: all indexed algorithms with the same order and algorithm signature as `algorithm`
+        """
+        return list(self._similar.get(get_similarity_key(algorithm), []))
+
+    def get_equivalent(self, algorithm: Twisty_Puzzle_Algorithm) -> list[Twisty_Puzzle_Algorithm]:
+        """
+        Returns:
+            list[Twisty_Puzzle_Algorithm]: all indexed algorithms that achieve the same permutation as `algorithm` up to a rotation. Algorithms with exactly the same permutation come first.
+        """
+        permutation, canonical_key = self._get_keys(algorithm)
+        equivalent_algorithms: list[Twisty_Puzzle_Algorithm] = self._equivalent.get(canonical_key, [])
+        return sorted(
+            equivalent_algorithms,
+            key=lambda other: not np.array_equal(self._algorithm_keys[id(other)][0], permutation))
+
+    def equal_permutations(self, algorithm: Twisty_Puzzle_Algorithm, other: Twisty_Puzzle_Algorithm) -> bool:
+        """
+        Check whether two algorithms achieve exactly the same permutation (without rotation).
+        """
+        return np.array_equal(self._get_keys(algorithm)[0], self._get_keys(other)[0])
+
+    def _get_keys(self, algorithm: Twisty_Puzzle_Algorithm) -> tuple[np.ndarray, bytes]:
+        """
+        Get the permutation of an algorithm as index array and its canonical key under rotations.
+        """
+        if id(algorithm) in self._algorithm_keys:
+            return self._algorithm_keys[id(algorithm)]
+        permutation: np.ndarray = algorithm.permutation
+        # conjugates `rotation * permutation * rotation**-1` for all rotations (sympy applies the left factor first)
+        conjugates: np.ndarray = np.take_along_axis(
+            self.inverse_rotation_group, permutation[self.rotation_group], axis=1)
+        canonical_key: bytes = min(conjugate.tobytes() for conjugate in conjugates)
+        return permutation, canonical_key
+
+
+def get_similarity_key(algorithm: Twisty_Puzzle_Algorithm) -> tuple:
+    """
+    Get a hashable key that is equal for two algorithms if and only if `algorithm.is_similar(other)`.
+    """
+    pieces_signature, cycles_signature = algorithm.algorithm_signature
+    return (algorithm.order, tuple(pieces_signature), tuple(cycles_signature))
+
+def get_rotation_group_arrays(rotations: dict[str, Permutation], n_points: int) -> np.ndarray:
+    """
+    Calculate all elements of the group generated by the given rotations.
+
+    Args:
+        rotations (dict[str, Permutation]): permutations that rotate the puzzle in 3D space
+        n_points (int): number of points of the puzzle
+
+    Returns:
+        np.ndarray: all rotations as index arrays with shape (group_size, n_points), starting with the identity
+    """
+    generators: list[np.ndarray] = [move_to_index_array(rotation, n_points) for rotation in rotations.values()]
+    group_elements: list[np.ndarray] = [move_to_index_array([], n_points)]
+    known_elements: set[bytes] = {group_elements[0].tobytes()}
+    i: int = 0
+    while i < len(group_elements):
+        for generator in generators:
+            element: np.ndarray = generator[group_elements[i]]
+            if element.tobytes() not in known_elements:
+                known_elements.add(element.tobytes())
+                group_elements.append(element)
+        i += 1
+    return np.array(group_elements)
+
+def _remove_by_identity(buckets: dict, key, algorithm: Twisty_Puzzle_Algorithm):
+    """
+    Remove an algorithm from a bucket of the given dictionary, deleting the bucket if it becomes empty.
+    """
+    bucket: list[Twisty_Puzzle_Algorithm] = buckets[key]
+    bucket[:] = [other for other in bucket if other is not algorithm]
+    if not bucket:
+        del buckets[key]
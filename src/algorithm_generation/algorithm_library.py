@@ -0,0 +1,162 @@
+"""
+This module implements a persistent library of algorithms found for a puzzle.
+
+Generating algorithms is random, so different runs rediscover many of the same algorithms. The library stores every accepted algorithm in an SQLite database in the puzzle's folder (`src/puzzles/<puzzle_name>/algorithm_library.sqlite`), so later runs can start with all algorithms found before. For each algorithm, the base sequence, number of repetitions, permutation (index array), order, number of affected pieces and signature are saved. Algorithms are indexed by their signature and unique by their permutation; if the same permutation is found again with fewer moves, the stored move sequence is replaced.
+
+Author: Sebastian Jost
+"""
+import os
+import sqlite3
+
+import numpy as np
+from sympy.combinatorics import Permutation
+
+from src.ai_modules.move_sequence_cache import Move_Sequence_Cache
+from src.ai_modules.permutation_engine import INDEX_DTYPE
+from src.algorithm_generation.algorithm_analysis import Twisty_Puzzle_Algorithm
+
+
+ALGORITHM_LIBRARY_FILE_NAME: str = "algorithm_library.sqlite"
+
+
+class Algorithm_Library:
+    """
+    Persistent store of algorithms found for one puzzle.
+
+    Args:
+        puzzle_name (str): name of the puzzle. Determines the location of the database file.
+        file_path (str, optional): path of the database file. Defaults to None (use `get_algorithm_library_path(puzzle_name)`).
+    """
+    def __init__(self, puzzle_name: str, file_path: str | None = None):
+        self.puzzle_name: str = puzzle_name
+        self.file_path: str = get_algorithm_library_path(puzzle_name) if file_path is None else file_path
+        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)
+        self.connection: sqlite3.Connection = sqlite3.connect(self.file_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS algorithms (
+                id INTEGER PRIMARY KEY,
+                base_sequence TEXT NOT NULL,
+                n_repetitions INTEGER NOT NULL,
+                n_moves INTEGER NOT NULL,
+                permutation BLOB NOT NULL UNIQUE,
+                algorithm_order INTEGER NOT NULL,
+                n_affected_pieces INTEGER NOT NULL,
+                signature TEXT NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS signature_index ON algorithms (signature)")
+        self.connection.commit()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM algorithms").fetchone()[0]
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self.connection.close()
+
+    def add(self, algorithm: Twisty_Puzzle_Algorithm) -> bool:
+        """
+        Add an algorithm to the library. If an algorithm with the same permutation is already stored, keep the one with fewer moves.
+
+        Args:
+            algorithm (Twisty_Puzzle_Algorithm): the algorithm to add
+
+        Returns:
+            bool: True if the library changed, False if an algorithm with the same permutation and at most as many moves was stored already
+        """
+        cursor: sqlite3.Cursor = self.connection.execute("""
+            INSERT INTO algorithms (base_sequence, n_repetitions, n_moves, permutation, algorithm_order, n_affected_pieces, signature)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (permutation) DO UPDATE SET
+                base_sequence = excluded.base_sequence,
+                n_repetitions = excluded.n_repetitions,
+                n_moves = excluded.n_moves
+            WHERE excluded.n_moves < algorithms.n_moves""",
+            (
+                " ".join(algorithm.base_action_sequence),
+                algorithm.n_repetitions,
+                len(algorithm.full_action_sequence),
+                get_permutation_key(algorithm.permutation),
+                int(algorithm.order),
+                algorithm.n_affected_pieces,
+                get_signature_key(algorithm),
+            ))
+        self.connection.commit()
+        return cursor.rowcount > 0
+
+    def get_move_sequences(self, signature: str | None = None) -> list[tuple[list[str], int, bytes]]:
+        """
+        Get the stored algorithms as move sequences, sorted by number of moves.
+
+        Args:
+            signature (str, optional): only return algorithms with this signature (see `get_signature_key`). Defaults to None (return all algorithms).
+
+        Returns:
+            list[tuple[list[str], int, bytes]]: base sequence, number of repetitions and permutation (see `get_permutation_key`) of each algorithm
+        """
+        query: str = "SELECT base_sequence, n_repetitions, permutation FROM algorithms"
+        parameters: tuple = ()
+        if signature is not None:
+            query += " WHERE signature = ?"
+            parameters = (signature,)
+        rows: list[tuple[str, int, bytes]] = self.connection.execute(query + " ORDER BY n_moves, id", parameters).fetchall()
+        return [(base_sequence.split(" "), n_repetitions, permutation) for base_sequence, n_repetitions, permutation in rows]
+
+    def load_algorithms(
+            self,
+            puzzle: "Twisty_Puzzle",
+            sympy_moves: dict[str, Permutation],
+            sequence_cache: Move_Sequence_Cache | None = None,
+            signature: str | None = None,
+            ) -> list[Twisty_Puzzle_Algorithm]:
+        """
+        Load the stored algorithms. Algorithms that use unknown moves or no longer achieve the stored permutation (e.g. because the puzzle definition changed) are skipped.
+
+        Args:
+            puzzle (Twisty_Puzzle): the puzzle the algorithms belong to
+            sympy_moves (dict[str, Permutation]): moves the algorithms may use as sympy permutations
+            sequence_cache (Move_Sequence_Cache, optional): cache of composed move sequences. Defaults to None.
+            signature (str, optional): only load algorithms with this signature. Defaults to None (load all algorithms).
+
+        Returns:
+            list[Twisty_Puzzle_Algorithm]: the stored algorithms, sorted by number of moves and named `lib_1`, `lib_2`, ...
+        """
+        algorithms: list[Twisty_Puzzle_Algorithm] = []
+        for base_sequence, n_repetitions, permutation_key in self.get_move_sequences(signature):
+            if not all(move in sympy_moves for move in base_sequence):
+                continue
+            algorithm: Twisty_Puzzle_Algorithm = Twisty_Puzzle_Algorithm(
+                base_action_sequence=base_sequence,
+                n_repetitions=n_repetitions,
+                puzzle=puzzle,
+                alg_name=f"lib_{len(algorithms) + 1}",
+                sympy_moves=sympy_moves,
+                sequence_cache=sequence_cache,
+            )
+            if get_permutation_key(algorithm.permutation) != permutation_key:
+                continue
+            algorithms.append(algorithm)
+        return algorithms
+
+
+def get_algorithm_library_path(puzzle_name: str) -> str:
+    """
+    Returns:
+        str: path of the algorithm library file of the given puzzle
+    """
+    return os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, ALGORITHM_LIBRARY_FILE_NAME)
+
+def get_permutation_key(permutation: np.ndarray) -> bytes:
+    """
+    Returns:
+        bytes: the permutation as bytes of an index array with dtype `INDEX_DTYPE`
+    """
+    return np.asarray(permutation, dtype=INDEX_DTYPE).tobytes()
+
+def get_signature_key(algorithm: Twisty_Puzzle_Algorithm) -> str:
+    """
+    Returns:
+        str: order and signature of the algorithm as string. Equal for two algorithms if and only if they are similar (see `Twisty_Puzzle_Algorithm.is_similar`).
+    """
+    return f"{algorithm.order}: {algorithm.algorithm_signature}"
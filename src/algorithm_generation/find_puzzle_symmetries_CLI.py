@@ -4,7 +4,6 @@ This module uses `rotational_symmetry_detection.py` to add symmetry moves to a g
 import os
 
 import numpy as np
-import vpython as vpy
 from sympy.combinatorics import Permutation
 from scipy.spatial.transform import Rotation
 
@@ -15,7 +14,7 @@ if __name__ == "__main__":
     parent2dir = os.path.dirname(parentdir)
     sys.path.insert(0,parent2dir)
 from src.algorithm_generation.rotational_symmetry_detection import find_rotational_symmetries
-from src.algorithm_generation.algorithm_generation_CLI import add_moves_to_puzzle, load_twisty_puzzle
+from src.algorithm_generation.algorithm_generation_CLI import add_moves_to_puzzle, load_puzzle_model
 from src.algorithm_generation.algorithm_analysis import get_sympy_moves
 
 def rotations_to_moves(X: np.ndarray, rotations: list[tuple[float, np.ndarray, np.ndarray]]) -> dict[str, list[int]]:
@@ -131,9 +130,10 @@ def filter_rotations(
 
 
 def add_rotation_moves_to_puzzle(
-        puzzle: "Twisty_Puzzle",
+        puzzle: "Puzzle_Model | Twisty_Puzzle",
         new_puzzle_name: str = "",
         suffix: str = "_sym",
+        n_workers: int = os.cpu_count(),
         verbosity: int = 1,
     ) -> None:
     """
@@ -141,24 +141,33 @@ def add_rotation_moves_to_puzzle(
     The new puzzle (with rotation moves) is saved as `new_puzzle_name` or `puzzle.name + suffix`.
     
     Args:
-        puzzle (Twisty_Puzzle): puzzle to add rotational symmetries to
+        puzzle (Puzzle_Model | Twisty_Puzzle): puzzle to add rotational symmetries to
         new_puzzle_name (str): name of the new puzzle
         suffix (str): suffix to add to the puzzle's name (ignored if `new_puzzle_name` is given)
+        n_workers (int): number of processes used to refine rotational symmetries
         verbosity (int): verbosity level
     """
     point_coordinates: np.ndarray = get_puzzle_points(puzzle)
     # reduce points to COMs for each move, ignoring inverse moves
     # point_coordinates: np.ndarray = reduce_to_coms(point_coordinates, puzzle)
     # calculate rotational symmetries
-    rotations: list[tuple[float, np.ndarray, np.ndarray]] = find_rotational_symmetries(
-        X=point_coordinates,
-        keep_n_best_planes = 20000, # number of candidate rotations to consider
-        plane_similarity_threshold = 0.05, # threshold for distance between planes to consider them equal
-        min_angle = np.pi / 12.5, # minimum rotation angle in radians (= 1/)
-        num_best_rotations = 1000, # number of best rotations to keep
-        epsilon_Q = 0.05, # parameter for quarternion similarity
-        epsilon_s = 0.05, # parameter for axis similarity
-        min_score_ratio=0.9, # minimum score ratio between best and other rotations
+    symmetry_detection_params: dict[str, float] = {
+        "keep_n_best_planes": 20000, # number of candidate rotations to consider
+        "plane_similarity_threshold": 0.05, # threshold for distance between planes to consider them equal
+        "min_angle": np.pi / 12.5, # minimum rotation angle in radians (= 1/)
+        "num_best_rotations": 1000, # number of best rotations to keep
+        "epsilon_Q": 0.05, # parameter for quarternion similarity
+        "epsilon_s": 0.05, # parameter for axis similarity
+        "min_score_ratio": 0.9, # minimum score ratio between best and other rotations
+    }
+    # detected symmetries are cached until the puzzle definition changes
+    rotations: list[tuple[float, np.ndarray, np.ndarray]] = puzzle.analysis_cache.get_rotational_symmetries(
+        inputs=(point_coordinates, symmetry_detection_params),
+        compute=lambda: find_rotational_symmetries(
+            X=point_coordinates,
+            n_workers=n_workers, # number of processes for refining the best rotations
+            **symmetry_detection_params,
+        ),
     )
     if verbosity >= 1:
         print(f"Found {len(rotations)} rotational symmetries.")
@@ -186,24 +195,22 @@ def add_rotation_moves_to_puzzle(
     os._exit(0)
     
 
-def get_puzzle_points(puzzle: "Twisty_Puzzle") -> np.ndarray:
+def get_puzzle_points(puzzle: "Puzzle_Model | Twisty_Puzzle") -> np.ndarray:
     """
-    Load the points and colors of a puzzle.
+    Load the points of a puzzle.
 
     Args:
-        puzzle_name (str): name of the puzzle
+        puzzle (Puzzle_Model | Twisty_Puzzle): the puzzle or its vpython view
 
     Returns:
         np.ndarray: 3D coordinates of all points of the puzzle
     """
-    point_dicts = puzzle.POINT_INFO_DICTS
-    points: list[vpy.vector] = [point["coords"] for point in point_dicts]
-    point_coordinates: np.ndarray = np.array([[p.x, p.y, p.z] for p in points])
-    return point_coordinates
+    puzzle_model: "Puzzle_Model" = getattr(puzzle, "model", puzzle)
+    return np.array(puzzle_model.point_coordinates)
 
 def main():
     # load puzzle
-    puzzle, puzzle_name = load_twisty_puzzle()
+    puzzle, puzzle_name = load_puzzle_model()
     
     add_rotation_moves_to_puzzle(
         puzzle=puzzle,
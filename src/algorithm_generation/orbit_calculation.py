@@ -1,69 +1,124 @@
 """
 This module provides methods to calculate orbits of points and pieces under a given action set.
+
+Orbits are calculated with a disjoint-set (union-find) structure stored in a NumPy array: every point points to a parent point, the roots represent the orbits. All unions of one step are done at once (hooking every root to the smallest connected root), followed by pointer jumping until every point points to its root. This takes near-linear time in the number of points and moves.
 """
+import numpy as np
 from sympy.combinatorics import Permutation
 
+from src.ai_modules.permutation_engine import to_index_array
+
 def calculate_point_orbits(
         n_points: int,
-        moves: list[Permutation],
+        moves: list[Permutation] | list[np.ndarray] | np.ndarray,
     ) -> list[set[int]]:
     """
     Calculate orbits of points under a given action set.
     1. start with all points as single-element sets.
-    2. for each move, join the sets of all points that are within the same cycle in the move.
-    3. repeat step 2 until no more sets can be joined. (We expect to always reach a fixed point after the first iteration.)
+    2. for each move, join the sets of every point `i` and its image `move[i]`.
+    3. repeat step 2 until no more sets can be joined (see `union_find_roots`).
 
     Args:
         n_points: The number of points to calculate orbits for.
-        moves: A list of permutations that represent the action set.
+        moves: A list of permutations that represent the action set, either as sympy permutations, in cyclic form or as index arrays.
 
     Returns:
-        list[set[int]]: A list of sets, where each set contains the indices of points in the same orbit.
+        list[set[int]]: A list of sets, where each set contains the indices of points in the same orbit. Sorted by the smallest point of each orbit.
     """
-    point_orbits: list[set[int]] = [set([point]) for point in range(n_points)]
-    for move in moves:
-        for cycle in move.cyclic_form:
-            # find the orbits containing each point in the cycle
-            orbits_to_join: list[set[int]] = [
-                i for i, orbit in enumerate(point_orbits) if not orbit.isdisjoint(cycle)]
-            # orbit indices are sorted in ascending order
-            if len(orbits_to_join) > 1:
-                # join the orbits
-                for orbit_index in orbits_to_join[-1:0:-1]: # iterate in reverse order to avoid index shifting
-                    point_orbits[orbits_to_join[0]] |= point_orbits.pop(orbit_index)
-    return point_orbits
+    move_arrays: list[np.ndarray] = [to_index_array(move, n_points) for move in moves]
+    points: np.ndarray = np.arange(n_points)
+    roots: np.ndarray = union_find_roots(
+        n_points,
+        np.concatenate([points] + [points for _ in move_arrays]),
+        np.concatenate([points] + [move_array.astype(np.int64) for move_array in move_arrays]),
+    )
+    return _group_by_roots(roots)
 
 def calculate_piece_orbits(
         pieces: list[set[int]],
         point_orbits: list[set[int]]
     ) -> list[list[set[int]]]:
+    """
+    Calculate orbits of pieces: two pieces are in the same orbit if they contain points of the same point orbit.
+    Uses a point -> piece map to join the pieces of all points in each point orbit with union-find.
 
-    # Initialize piece orbits: each piece starts in its own separate orbit
-    piece_orbits = [[piece] for piece in pieces]
+    Args:
+        pieces (list[set[int]]): pieces of the puzzle as sets of point indices
+        point_orbits (list[set[int]]): orbits of points (see `calculate_point_orbits`)
 
-    # Function to find and merge piece orbits affected by the same point orbit
-    def merge_piece_orbits(point_orbit: set[int]):
-        affected_orbits = []
+    Returns:
+        list[list[set[int]]]: list of piece orbits, each a list of pieces. Orbits are sorted by their first piece, pieces within an orbit keep the order of `pieces`.
+    """
+    n_points: int = max((max(piece) for piece in pieces if piece), default=-1) + 1
+    n_points = max(n_points, max((max(orbit) for orbit in point_orbits if orbit), default=-1) + 1)
+    # point -> index of the piece and of the point orbit it belongs to (-1 if none)
+    point_pieces: np.ndarray = _get_membership_array(pieces, n_points)
+    point_orbit_indices: np.ndarray = _get_membership_array(point_orbits, n_points)
+    valid_points: np.ndarray = (point_pieces >= 0) & (point_orbit_indices >= 0)
+    # join every piece with the first piece found for each point orbit
+    first_pieces: np.ndarray = np.full(len(point_orbits), -1, dtype=np.int64)
+    first_pieces[point_orbit_indices[valid_points][::-1]] = point_pieces[valid_points][::-1]
+    piece_roots: np.ndarray = union_find_roots(
+        len(pieces),
+        point_pieces[valid_points],
+        first_pieces[point_orbit_indices[valid_points]],
+    )
+    return [[pieces[i] for i in sorted(orbit)] for orbit in _group_by_roots(piece_roots)]
 
-        for orbit in piece_orbits:
-            for piece in orbit:
-                if not point_orbit.isdisjoint(piece):  # Check if point_orbit intersects with the piece
-                    affected_orbits.append(orbit)
-                    break
+def union_find_roots(n_elements: int, elements_1: np.ndarray, elements_2: np.ndarray) -> np.ndarray:
+    """
+    Join the sets of `elements_1[i]` and `elements_2[i]` for all i in a disjoint-set structure, starting with single-element sets.
 
-        if len(affected_orbits) > 1:
-            # Merge all affected orbits into the first one
-            primary_orbit = affected_orbits[0]
-            for orbit in affected_orbits[1:]:
-                primary_orbit.extend(orbit)
-                piece_orbits.remove(orbit)
+    Args:
+        n_elements (int): number of elements
+        elements_1 (np.ndarray): first elements of all pairs to join
+        elements_2 (np.ndarray): second elements of all pairs to join
 
-    # Iterate over all point orbits and merge affected piece orbits
-    for point_orbit in point_orbits:
-        merge_piece_orbits(point_orbit)
+    Returns:
+        np.ndarray: root of each element, the smallest element of its set
+    """
+    parents: np.ndarray = np.arange(n_elements)
+    elements_1 = np.asarray(elements_1, dtype=np.int64)
+    elements_2 = np.asarray(elements_2, dtype=np.int64)
+    while True:
+        roots_1: np.ndarray = parents[elements_1]
+        roots_2: np.ndarray = parents[elements_2]
+        unjoined: np.ndarray = roots_1 != roots_2
+        if not unjoined.any():
+            return parents
+        # hook the larger root of each pair onto the smaller one
+        larger_roots: np.ndarray = np.maximum(roots_1[unjoined], roots_2[unjoined])
+        smaller_roots: np.ndarray = np.minimum(roots_1[unjoined], roots_2[unjoined])
+        np.minimum.at(parents, larger_roots, smaller_roots)
+        # pointer jumping until every element points to its root
+        while True:
+            grandparents: np.ndarray = parents[parents]
+            if np.array_equal(grandparents, parents):
+                break
+            parents = grandparents
+
+def _group_by_roots(roots: np.ndarray) -> list[set[int]]:
+    """
+    Group elements by their root.
 
-    return piece_orbits
+    Returns:
+        list[set[int]]: sets of elements with the same root, sorted by their smallest element
+    """
+    sorted_elements: np.ndarray = np.argsort(roots, kind="stable")
+    split_indices: np.ndarray = np.flatnonzero(np.diff(roots[sorted_elements])) + 1
+    groups: list[set[int]] = [set(group.tolist()) for group in np.split(sorted_elements, split_indices) if len(group) > 0]
+    groups.sort(key=min)
+    return groups
 
+def _get_membership_array(sets: list[set[int]], n_points: int) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: index of the set each point belongs to, -1 for points in none of the sets
+    """
+    membership: np.ndarray = np.full(n_points, -1, dtype=np.int64)
+    for i, point_set in enumerate(sets):
+        membership[list(point_set)] = i
+    return membership
 
 if __name__ == "__main__":
     # add src to path
@@ -72,7 +127,7 @@ if __name__ == "__main__":
     parentdir = os.path.dirname(currentdir)
     parent2dir = os.path.dirname(parentdir)
     sys.path.insert(0,parent2dir)
-    from src.puzzle_class import Twisty_Puzzle
+    from src.puzzle_model import Puzzle_Model
     import algorithm_analysis as alg_ana
 
     # load puzzle
@@ -85,8 +140,7 @@ if __name__ == "__main__":
     # puzzle_name: str = "gear_cube"
     # puzzle_name: str = "geared_mixup"
     # puzzle_name: str = "skewb"
-    puzzle: Twisty_Puzzle = Twisty_Puzzle()
-    puzzle.load_puzzle(puzzle_name)
+    puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
 
     sympy_moves: dict[str, Permutation] = alg_ana.get_sympy_moves(puzzle)
 
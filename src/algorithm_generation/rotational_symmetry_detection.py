@@ -3,12 +3,16 @@
 This moidule implements rotational symmetry detection for a 3D point cloud as described in [Hruda et. al.](https://doi.org/10.1016/j.cagd.2022.102138) [1].
 author: Sebastian Jost
 """
+import multiprocessing
+
 import numpy as np
 from scipy.optimize import minimize
 from scipy.spatial.transform import Rotation as R
 from scipy.spatial.transform import Slerp
 
-from src.algorithm_generation.symmetry_plane_detection import find_symmetry_planes, dist_similarity_function, centroid
+from scipy.spatial import cKDTree
+
+from src.algorithm_generation.symmetry_plane_detection import find_symmetry_planes, dist_similarity_function, dist_similarity_derivative, centroid, batched_symmetry_measures, average_point_distance
 
 def find_plane_intersection(
         plane_1: np.ndarray,
@@ -68,7 +72,7 @@ def closest_point_on_line(ref_point, line_point, line_direction):
     closest_point = line_point + t * line_direction
     return closest_point
 
-def rotation_symmetry_measure(X: np.ndarray, rotation: tuple[float, np.ndarray], alpha: float) -> float:
+def rotation_symmetry_measure(X: np.ndarray, rotation: tuple[float, np.ndarray], alpha: float, tree: cKDTree | None = None) -> float:
     """
     Compute the symmetry measure for a set of points X rotated around an axis by a certain angle (in radians).
     Higher symmetry measure indicates higher symmetry.
@@ -77,22 +81,112 @@ def rotation_symmetry_measure(X: np.ndarray, rotation: tuple[float, np.ndarray],
         X (np.ndarray): set of points
         rotation (tuple[float, np.ndarray]): rotation defined by an angle and an axis
         alpha (float): parameter to control the similarity function
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
         
     Returns:
         float: symmetry measure in range [0, inf) (see (Hruda et. al.) Eq. (3))
     """
-    # TODO: Optimize by exploiting the locality of the symmetry measure (use cell-list or similar data structure)
-    n: int = X.shape[0]  # number of points
-    transformed_X = rotate_points(X, rotation[0], rotation[1])
-    
-    pairwise_distances = np.linalg.norm(transformed_X[:, np.newaxis] - X, axis=2)
-    # Apply the distance similarity function to all distances
-    similarity_measures = dist_similarity_function(pairwise_distances, alpha)
-    # Sum all the similarity measures
-    similarity_measure = np.sum(similarity_measures)
+    return rotation_symmetry_measures(X, [rotation[0]], [rotation[1]], alpha, tree=tree)[0]
+
+def rotation_symmetry_measures(
+        X: np.ndarray,
+        angles: list[float] | np.ndarray,
+        axes: list[np.ndarray] | np.ndarray,
+        alpha: float,
+        axis_supports: list[np.ndarray] | np.ndarray | None = None,
+        tree: cKDTree | None = None,
+        batch_size: int = 256,
+    ) -> np.ndarray:
+    """
+    Compute the symmetry measures (see `rotation_symmetry_measure`) of many rotations at once.
+
+    Args:
+        X (np.ndarray): set of points
+        angles (list[float] | np.ndarray): rotation angles in radians
+        axes (list[np.ndarray] | np.ndarray): rotation axes (not necessarily normalized)
+        alpha (float): parameter to control the similarity function
+        axis_supports (list[np.ndarray] | np.ndarray, optional): points on the rotation axes. Defaults to None (all axes go through the origin).
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
+        batch_size (int): number of rotations to evaluate in one KD-tree query
+
+    Returns:
+        np.ndarray: symmetry measure of each rotation
+    """
+    angles: np.ndarray = np.asarray(angles, dtype=float).reshape(-1)
+    axes: np.ndarray = np.asarray(axes, dtype=float).reshape(-1, 3)
+    # always normalize axes, same as `rotation_symmetry_measure_gradient`
+    norms: np.ndarray = np.linalg.norm(axes, axis=1)
+    axes = np.divide(axes, norms[:, np.newaxis], out=np.zeros_like(axes), where=norms[:, np.newaxis] > 0)
+    if axis_supports is None:
+        axis_supports = np.zeros_like(axes)
+    axis_supports: np.ndarray = np.asarray(axis_supports, dtype=float).reshape(-1, 3)
+    # parameters of each rotation: rotation matrix (9 entries) and axis support (3 entries)
+    rotation_matrices: np.ndarray = R.from_rotvec(angles[:, np.newaxis] * axes).as_matrix() if len(angles) else np.zeros((0, 3, 3))
+    parameters: np.ndarray = np.hstack((rotation_matrices.reshape(-1, 9), axis_supports))
+    def rotate(parameter_batch: np.ndarray) -> np.ndarray:
+        matrices: np.ndarray = parameter_batch[:, :9].reshape(-1, 3, 3)
+        supports: np.ndarray = parameter_batch[:, np.newaxis, 9:]
+        return np.einsum("mij,mnj->mni", matrices, X - supports) + supports
+    scores: np.ndarray = batched_symmetry_measures(X, rotate, parameters, alpha, tree=tree, batch_size=batch_size)
     # small angle penalization
-    similarity_measure *= penalty(rotation[0])
-    return similarity_measure
+    return scores * np.array([penalty(angle) for angle in angles])
+
+def rotation_symmetry_measure_gradient(
+        X: np.ndarray,
+        angle: float,
+        axis: np.ndarray,
+        alpha: float,
+        tree: cKDTree | None = None,
+    ) -> tuple[float, np.ndarray]:
+    """
+    Compute the symmetry measure of a rotation around an axis through the origin (see `rotation_symmetry_measure`) and its gradient with respect to the angle and the axis.
+    The axis is always normalized, so the gradient with respect to the axis is orthogonal to it.
+
+    Args:
+        X (np.ndarray): set of points
+        angle (float): rotation angle in radians
+        axis (np.ndarray): rotation axis (not necessarily normalized)
+        alpha (float): parameter to control the similarity function
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
+
+    Returns:
+        float: symmetry measure of the rotation
+        np.ndarray: gradient of the symmetry measure with respect to (angle, *axis)
+    """
+    if tree is None:
+        tree = cKDTree(X)
+    axis_norm: float = np.linalg.norm(axis)
+    k: np.ndarray = axis / axis_norm
+    cos, sin = np.cos(angle), np.sin(angle)
+    # Rodrigues' rotation formula: y = x cos + (k x x) sin + k <k, x> (1 - cos)
+    k_cross_X: np.ndarray = np.cross(k, X)
+    k_dot_X: np.ndarray = X @ k
+    Y: np.ndarray = X * cos + k_cross_X * sin + np.outer(k_dot_X, k) * (1 - cos)
+    neighbour_dists = cKDTree(Y).sparse_distance_matrix(tree, 2.6 / alpha, output_type="coo_matrix")
+    score: float = np.sum(dist_similarity_function(neighbour_dists.data, alpha))
+    # gradient of the score with respect to each rotated point: sum over neighbours of phi'(d) * (y_i - x_j) / d
+    weights: np.ndarray = np.divide(
+        dist_similarity_derivative(neighbour_dists.data, alpha),
+        neighbour_dists.data,
+        out=np.zeros_like(neighbour_dists.data),
+        where=neighbour_dists.data > 0)
+    weighted_diffs: np.ndarray = weights[:, np.newaxis] * (Y[neighbour_dists.row] - X[neighbour_dists.col])
+    point_gradients: np.ndarray = np.zeros_like(X)
+    np.add.at(point_gradients, neighbour_dists.row, weighted_diffs)
+    # chain rule through Rodrigues' formula
+    dY_dangle: np.ndarray = -X * sin + k_cross_X * cos + np.outer(k_dot_X, k) * sin
+    angle_gradient: float = np.sum(point_gradients * dY_dangle)
+    k_gradient: np.ndarray = np.sum(
+        sin * np.cross(X, point_gradients)
+        + (1 - cos) * (k_dot_X[:, np.newaxis] * point_gradients + X * (point_gradients @ k)[:, np.newaxis]),
+        axis=0)
+    axis_gradient: np.ndarray = (k_gradient - k * np.dot(k, k_gradient)) / axis_norm
+    # small angle penalization
+    angle_penalty: float = penalty(angle)
+    gradient: np.ndarray = np.array([
+        penalty_derivative(angle) * score + angle_penalty * angle_gradient,
+        *(angle_penalty * axis_gradient)])
+    return angle_penalty * score, gradient
 
 def find_rotational_symmetries(
         X: np.ndarray,
@@ -103,7 +197,8 @@ def find_rotational_symmetries(
         epsilon_Q: float = 0.05,
         epsilon_s: float = 0.05, # will be multiplied with d_avg
         min_score_ratio: float = 0.7,
-        similar_axis_tol: float = 0.05
+        similar_axis_tol: float = 0.05,
+        n_workers: int = 1,
     ) -> list[tuple[np.ndarray, float]]:
     """
     Detect rotational symmetries in a 3D point cloud.
@@ -118,11 +213,13 @@ def find_rotational_symmetries(
         epsilon_Q (float): tolerance for quaternion similarity
         epsilon_s (float): tolerance for axis support similarity, will be multiplied with d_avg
         min_score_ratio (float): minimum score relative to the best score to keep a rotation
+        similar_axis_tol (float): tolerance for the distance between normalized axes to consider two rotations equal
+        n_workers (int): number of processes used to refine the best rotations (see `refine_rotations`)
     Returns:
         list[tuple[np.ndarray, float]]: list of rotational symmetries (axis, angle) detected
     """
     # calculate alpha = 20/average distance between points
-    d_avg: float = np.mean(np.linalg.norm(X[:, np.newaxis] - X, axis=2))
+    d_avg: float = average_point_distance(X)
     epsilon_s *= d_avg
     alpha: float = 20 / d_avg
     # Step 0: center point cloud around origin
@@ -142,17 +239,13 @@ def find_rotational_symmetries(
     #   2.2 prune candidates that are too similar to existing ones
     pruned_candidates = init_rotation_candidates(X, min_angle, epsilon_Q, epsilon_s, planes)
     # Step 3: Evaluate candidate rotations with score < best_score * min_score_ratio. Keep at most about num_best_rotations
-    best_rotations = []
-    best_scores = []
-    symmetry_measures: list[float] = [0] * len(pruned_candidates)
-    for index, (Q, axis_support, _) in enumerate(pruned_candidates): # weights (w(Q, s)) are no longer needed
-        axis = R.from_quat(Q)
-        axis = axis.as_rotvec()
-        rotation_angle = np.linalg.norm(axis)
-        axis /= rotation_angle
-        X_translated = X - axis_support
-        score = rotation_symmetry_measure(X_translated, rotation=(rotation_angle, axis), alpha=alpha)
-        pruned_candidates[index] = (score, rotation_angle, axis, axis_support)
+    tree: cKDTree = cKDTree(X)
+    rotation_vectors: np.ndarray = np.array([R.from_quat(Q).as_rotvec() for Q, _, _ in pruned_candidates]) # weights (w(Q, s)) are no longer needed
+    rotation_angles: np.ndarray = np.linalg.norm(rotation_vectors, axis=1)
+    axes: np.ndarray = rotation_vectors / rotation_angles[:, np.newaxis]
+    axis_supports: list[np.ndarray] = [axis_support for _, axis_support, _ in pruned_candidates]
+    scores: np.ndarray = rotation_symmetry_measures(X, rotation_angles, axes, alpha, axis_supports=axis_supports, tree=tree)
+    pruned_candidates = list(zip(scores, rotation_angles, axes, axis_supports))
     sorted_candidates: list[tuple[float, float, np.ndarray, np.ndarray]] = sorted(pruned_candidates, key=lambda x: x[0], reverse=True)
     score_threshold: float = sorted_candidates[min(num_best_rotations, len(sorted_candidates)-1)][0]
     best_score: float = sorted_candidates[0][0]
@@ -162,37 +255,15 @@ def find_rotational_symmetries(
     ]
 
     # Step 4: Refine the best rotations by maximizing the symmetry measure individually
-    def objective(rotation_components):
-        angle: float = rotation_components[0]
-        axis: np.ndarray = rotation_components[1:4]
-        # axis_support: np.ndarray = rotation_components[4:]
-        X_translated: np.ndarray = X
-        return -rotation_symmetry_measure(X_translated, (angle, axis), alpha)
-    def concat_rotation(rotation):
-        # return np.array([rotation[0], *rotation[1], *rotation[2]])
-        return np.array([rotation[0], *rotation[1]])
-    symmetry_rotations = []
-    for rotation in best_rotations:
-        result = minimize(objective, concat_rotation(rotation), method="BFGS") # maximize symmetry measure
-        # symmetry_rotations.append((result.x[0], result.x[1:4], result.x[4:]))
-        angle = result.x[0]
-        axis = result.x[1:4]
-        axis /= np.linalg.norm(axis) # normalize axis
-        axis_support = np.zeros(3)
-        symmetry_rotations.append((angle, axis, axis_support))
     # Step 5: Prune rotations that are too similar to existing ones
-    # note that angles are always between 0 and pi, inverses have an inverted axis
-    print(f"Found {len(symmetry_rotations)} symmetry rotations.\nPruning rotations with similar axis and angle...")
-    pruned_rotations = []
-    for rotation in symmetry_rotations:
-        for i, (angle, axis, _) in enumerate(pruned_rotations):
-            # check if the axis AND angle are similar to an existing one 
-            if np.linalg.norm(rotation[1] - axis) < similar_axis_tol and abs(rotation[0] - angle) < min_angle:
-                print(f"Pruned rotation with angle {rotation[0]*360/(2*np.pi):.2f}° and axis {rotation[1].round(3)} due to similarity to rotation {i}")
-                break
-        else:
-            print(f"Added rotation {len(pruned_rotations)} with angle {rotation[0]*360/(2*np.pi):.2f}° and axis {rotation[1].round(3)}")
-            pruned_rotations.append(rotation)
+    pruned_rotations: list[tuple[float, np.ndarray, np.ndarray]] = refine_rotations(
+        X=X,
+        rotations=best_rotations,
+        alpha=alpha,
+        min_angle=min_angle,
+        similar_axis_tol=similar_axis_tol,
+        n_workers=n_workers,
+    )
     # Step 6: Find all possible rotation angles for each axis
     
     # Step 7: Shift back to original coordinates
@@ -203,6 +274,148 @@ def find_rotational_symmetries(
     #     print(f"Symmetry measure: {rotation_symmetry_measure(X, rotation, alpha)}")
     return symmetry_rotations
 
+def refine_rotations(
+        X: np.ndarray,
+        rotations: list[tuple[float, np.ndarray, np.ndarray]],
+        alpha: float,
+        min_angle: float = np.pi / 12.5,
+        similar_axis_tol: float = 0.05,
+        n_workers: int = 1,
+    ) -> list[tuple[float, np.ndarray, np.ndarray]]:
+    """
+    Refine rotations by maximizing their symmetry measure with BFGS, using the analytic gradient from `rotation_symmetry_measure_gradient`. Only keep rotations that are not too similar to a better one.
+    Rotations are refined in batches of `n_workers` in a process pool, in the given order. Each optimization stops early once its rotation becomes similar to a rotation accepted in an earlier batch, since it would be pruned anyway.
+
+    Args:
+        X (np.ndarray): set of points, centered around the origin
+        rotations (list[tuple[float, np.ndarray, np.ndarray]]): initial rotations (angle, axis, axis_support), sorted by decreasing symmetry measure. Axis supports are ignored, all refined axes go through the origin.
+        alpha (float): parameter to control the similarity function
+        min_angle (float): maximum angle difference between two similar rotations in radians
+        similar_axis_tol (float): maximum distance between the normalized axes of two similar rotations
+        n_workers (int): number of processes to use. If 1, refine all rotations in the current process.
+
+    Returns:
+        list[tuple[float, np.ndarray, np.ndarray]]: refined rotations (angle, normalized axis, axis_support) with angles in [0, pi]
+    """
+    accepted_rotations: list[tuple[float, np.ndarray, np.ndarray]] = []
+    def accept_rotations(refined_rotations: list[tuple[float, np.ndarray] | None]):
+        for rotation in refined_rotations:
+            if rotation is None:
+                continue
+            if (similar_index := find_similar_rotation(rotation, accepted_rotations, min_angle, similar_axis_tol)) is not None:
+                print(f"Pruned rotation with angle {rotation[0]*360/(2*np.pi):.2f}° and axis {rotation[1].round(3)} due to similarity to rotation {similar_index}")
+                continue
+            print(f"Added rotation {len(accepted_rotations)} with angle {rotation[0]*360/(2*np.pi):.2f}° and axis {rotation[1].round(3)}")
+            accepted_rotations.append((*rotation, np.zeros(3)))
+    initial_rotations: list[tuple[float, np.ndarray]] = [(angle, axis) for angle, axis, _ in rotations]
+    if n_workers <= 1:
+        _init_refinement_worker(X, alpha, min_angle, similar_axis_tol)
+        for rotation in initial_rotations:
+            accept_rotations([_refine_rotation(rotation, accepted_rotations)])
+    else:
+        context = multiprocessing.get_context()
+        with context.Pool(n_workers, initializer=_init_refinement_worker, initargs=(X, alpha, min_angle, similar_axis_tol)) as pool:
+            for batch_start in range(0, len(initial_rotations), n_workers):
+                batch: list[tuple[float, np.ndarray]] = initial_rotations[batch_start:batch_start + n_workers]
+                accept_rotations(pool.starmap(
+                    _refine_rotation,
+                    [(rotation, accepted_rotations) for rotation in batch]))
+    print(f"Refined {len(rotations)} rotations, kept {len(accepted_rotations)} distinct rotations.")
+    return accepted_rotations
+
+# data shared by all rotation refinements of one worker process
+_REFINEMENT_DATA: dict = dict()
+
+def _init_refinement_worker(X: np.ndarray, alpha: float, min_angle: float, similar_axis_tol: float):
+    """
+    Store the data needed to refine rotations in the current process.
+    """
+    _REFINEMENT_DATA.update(
+        X=X,
+        tree=cKDTree(X),
+        alpha=alpha,
+        min_angle=min_angle,
+        similar_axis_tol=similar_axis_tol,
+    )
+
+def _refine_rotation(
+        rotation: tuple[float, np.ndarray],
+        accepted_rotations: list[tuple[float, np.ndarray, np.ndarray]],
+    ) -> tuple[float, np.ndarray] | None:
+    """
+    Maximize the symmetry measure of a rotation with BFGS. Requires `_init_refinement_worker` to be called first.
+
+    Args:
+        rotation (tuple[float, np.ndarray]): initial rotation angle and axis
+        accepted_rotations (list[tuple[float, np.ndarray, np.ndarray]]): rotations that were already accepted
+
+    Returns:
+        tuple[float, np.ndarray] | None: refined rotation (angle, axis) or None if the rotation became similar to an accepted one
+    """
+    X: np.ndarray = _REFINEMENT_DATA["X"]
+    tree: cKDTree = _REFINEMENT_DATA["tree"]
+    alpha: float = _REFINEMENT_DATA["alpha"]
+    min_angle: float = _REFINEMENT_DATA["min_angle"]
+    similar_axis_tol: float = _REFINEMENT_DATA["similar_axis_tol"]
+    if find_similar_rotation(rotation, accepted_rotations, min_angle, similar_axis_tol) is not None:
+        return None
+    def objective(rotation_components: np.ndarray) -> tuple[float, np.ndarray]:
+        score, gradient = rotation_symmetry_measure_gradient(X, rotation_components[0], rotation_components[1:4], alpha, tree=tree)
+        return -score, -gradient # maximize symmetry measure
+    is_duplicate: bool = False
+    def callback(intermediate_result):
+        nonlocal is_duplicate
+        x: np.ndarray = intermediate_result.x
+        if find_similar_rotation((x[0], x[1:4]), accepted_rotations, min_angle, similar_axis_tol) is not None:
+            is_duplicate = True
+            raise StopIteration
+    result = minimize(objective, np.array([rotation[0], *rotation[1]]), method="BFGS", jac=True, callback=callback)
+    if is_duplicate:
+        return None
+    return canonical_rotation(result.x[0], result.x[1:4])
+
+def canonical_rotation(angle: float, axis: np.ndarray) -> tuple[float, np.ndarray]:
+    """
+    Normalize the axis of a rotation and map the angle to [0, pi], inverting the axis if necessary.
+
+    Args:
+        angle (float): rotation angle in radians
+        axis (np.ndarray): rotation axis
+
+    Returns:
+        tuple[float, np.ndarray]: the same rotation as (angle, normalized axis) with angle in [0, pi]
+    """
+    axis = axis / np.linalg.norm(axis)
+    angle = angle % (2*np.pi)
+    if angle > np.pi:
+        angle = 2*np.pi - angle
+        axis = -axis
+    return angle, axis
+
+def find_similar_rotation(
+        rotation: tuple[float, np.ndarray],
+        other_rotations: list[tuple[float, np.ndarray, np.ndarray]],
+        min_angle: float,
+        similar_axis_tol: float,
+    ) -> int | None:
+    """
+    Find a rotation with similar axis AND angle.
+
+    Args:
+        rotation (tuple[float, np.ndarray]): rotation angle and axis
+        other_rotations (list[tuple[float, np.ndarray, np.ndarray]]): rotations (angle, normalized axis, axis_support) with angles in [0, pi]
+        min_angle (float): maximum angle difference between two similar rotations in radians
+        similar_axis_tol (float): maximum distance between the normalized axes of two similar rotations
+
+    Returns:
+        int | None: index of the first similar rotation in `other_rotations` or None if there is none
+    """
+    angle, axis = canonical_rotation(*rotation)
+    for i, (other_angle, other_axis, _) in enumerate(other_rotations):
+        if np.linalg.norm(axis - other_axis) < similar_axis_tol and abs(angle - other_angle) < min_angle:
+            return i
+    return None
+
 def init_rotation_candidates(
         X: np.ndarray,
         min_angle: float,
@@ -355,6 +568,24 @@ def penalty(angle, min_angle=np.pi/25, max_angle=np.pi/13, alpha: float = 0.1):
     else:
         return dist_similarity_function(alpha * ((abs(angle) - max_angle) * 2.6 / (min_angle - max_angle)))
 
+def penalty_derivative(angle: float, min_angle=np.pi/25, max_angle=np.pi/13, alpha: float = 0.1) -> float:
+    """
+    Derivative of `penalty` with respect to the angle.
+
+    Args:
+        angle (float): angle to calculate the derivative for
+        min_angle (float, optional): minimum angle in the desired range. Defaults to np.pi/25.
+        max_angle (float, optional): maximum angle in the desired range. Defaults to np.pi/13.
+        alpha (float, optional): spread parameter to control the smoothness of the penalty function. Defaults to 0.1.
+    """
+    angle = angle % (2*np.pi)
+    if angle > np.pi:
+        angle -= 2*np.pi
+    if abs(angle) > max_angle:
+        return 0
+    inner_derivative: float = alpha * 2.6 / (min_angle - max_angle) * np.sign(angle)
+    return dist_similarity_derivative(alpha * ((abs(angle) - max_angle) * 2.6 / (min_angle - max_angle))) * inner_derivative
+
 def rotate_points(X: np.ndarray, angle: float, axis: np.ndarray, tol: float = 1e-15) -> np.ndarray:
     """
     Rotate a set of points around an axis by a certain angle (in radians).
@@ -0,0 +1,238 @@
+"""
+This module implements an incremental stabilizer chain (Schreier-Sims) for permutation groups given as index arrays.
+
+Building a sympy `PermutationGroup` from scratch and calling `.order()` every time a generator is added or removed is expensive for large puzzles. `Stabilizer_Chain` adds generators one at a time (Knuth's variant of the Schreier-Sims algorithm, see D. E. Knuth, "Efficient representation of perm groups", 1991), so the order of the current group is always available as the product of the orbit sizes of the chain.
+
+`Group_Order_Tracker` keeps the stabilizer chain after each added set of generators. This makes removing the last sets cheap and allows calculating the order of the group generated without some of the sets, starting from the chain of all sets before them.
+
+Permutations are index arrays like in `Permutation_Engine` and act on points as `point -> perm[point]`, so `g[h]` is the permutation applying `h` first, then `g`. The base of the chain is `0, 1, ..., n_points-1`; levels of points fixed by the group are skipped while sifting.
+
+Author: Sebastian Jost
+"""
+from math import prod
+
+import numpy as np
+
+from src.ai_modules.permutation_engine import INDEX_DTYPE, check_n_points, to_index_array, invert_index_array
+
+
+class Stabilizer_Chain:
+    """
+    Stabilizer chain of a permutation group that can be extended by new generators.
+
+    Level `k` of the chain stores a transversal of the orbit of point `k` under the stabilizer of the points `0, ..., k-1`: for every point `j` in that orbit, a group element mapping `k` to `j`. Levels missing in `transversals` only contain the identity.
+
+    Args:
+        n_points (int): number of points the permutations act on
+    """
+    def __init__(self, n_points: int):
+        check_n_points(n_points)
+        self.n_points: int = n_points
+        self.identity: np.ndarray = np.arange(n_points, dtype=INDEX_DTYPE)
+        # level -> {image of the level's base point -> group element}
+        self.transversals: dict[int, dict[int, np.ndarray]] = dict()
+        self.inverse_transversals: dict[int, dict[int, np.ndarray]] = dict()
+        # level -> generators of the stabilizer of all points before the level
+        self.level_generators: dict[int, list[np.ndarray]] = dict()
+
+    def order(self) -> int:
+        """
+        Returns:
+            int: order of the group generated by all added generators
+        """
+        return prod(len(transversal) for transversal in self.transversals.values())
+
+    def copy(self) -> "Stabilizer_Chain":
+        """
+        Copy the chain. The permutations are shared, since they are never modified in-place.
+
+        Returns:
+            Stabilizer_Chain: an independent copy of this chain
+        """
+        chain: Stabilizer_Chain = Stabilizer_Chain(self.n_points)
+        chain.transversals = {level: dict(transversal) for level, transversal in self.transversals.items()}
+        chain.inverse_transversals = {level: dict(transversal) for level, transversal in self.inverse_transversals.items()}
+        chain.level_generators = {level: list(generators) for level, generators in self.level_generators.items()}
+        return chain
+
+    def contains(self, permutation) -> bool:
+        """
+        Check whether a permutation is an element of the group.
+
+        Args:
+            permutation (np.ndarray | list[list[int]] | Permutation): the permutation as index array, in cyclic form or as sympy permutation
+
+        Returns:
+            bool: True if the permutation is an element of the group, False otherwise
+        """
+        return self._sift(to_index_array(permutation, self.n_points)) is None
+
+    def add_generator(self, permutation) -> bool:
+        """
+        Add a generator to the group and update the chain.
+
+        Args:
+            permutation (np.ndarray | list[list[int]] | Permutation): the new generator as index array, in cyclic form or as sympy permutation
+
+        Returns:
+            bool: True if the group grew, False if the generator already was an element of the group
+        """
+        permutation = to_index_array(permutation, self.n_points)
+        if self._sift(permutation) is None:
+            return False
+        # tasks of Knuth's algorithm:
+        #   (True, k, g): add g to the stabilizer of level k (if it is not an element of it already)
+        #   (False, k, g): make sure the coset of g at level k is represented, otherwise add a Schreier generator to level k+1
+        tasks: list[tuple[bool, int, np.ndarray]] = [(True, 0, permutation)]
+        while tasks:
+            add_to_level, level, permutation = tasks.pop()
+            if add_to_level:
+                if self._sift(permutation) is None:
+                    continue
+                self.level_generators.setdefault(level, []).append(permutation)
+                transversal: dict[int, np.ndarray] = self._get_transversal(level)
+                tasks.extend((False, level, permutation[representative]) for representative in transversal.values())
+                continue
+            transversal: dict[int, np.ndarray] = self._get_transversal(level)
+            image: int = int(permutation[level])
+            if image not in transversal:
+                # new point in the orbit of this level
+                transversal[image] = permutation
+                self.inverse_transversals[level][image] = invert_index_array(permutation)
+                tasks.extend((False, level, generator[permutation]) for generator in self.level_generators[level])
+            else:
+                # Schreier generator: fixes all points up to and including `level`
+                tasks.append((True, level + 1, self.inverse_transversals[level][image][permutation]))
+        return True
+
+    def _get_transversal(self, level: int) -> dict[int, np.ndarray]:
+        """
+        Get the transversal of the given level, initializing it with the identity if necessary.
+        """
+        if level not in self.transversals:
+            self.transversals[level] = {level: self.identity}
+            self.inverse_transversals[level] = {level: self.identity}
+        return self.transversals[level]
+
+    def _sift(self, permutation: np.ndarray) -> np.ndarray | None:
+        """
+        Sift a permutation through the chain.
+
+        Args:
+            permutation (np.ndarray): the permutation as index array
+
+        Returns:
+            np.ndarray | None: None if the permutation is an element of the group, otherwise the remainder that could not be sifted further
+        """
+        while True:
+            moved_points: np.ndarray = np.flatnonzero(permutation != self.identity)
+            if len(moved_points) == 0:
+                return None
+            level: int = int(moved_points[0])
+            inverse_representative: np.ndarray | None = \
+                self.inverse_transversals.get(level, {}).get(int(permutation[level]))
+            if inverse_representative is None:
+                return permutation
+            permutation = inverse_representative[permutation]
+
+
+class Group_Order_Tracker:
+    """
+    Track the group generated by a list of generator sets (e.g. an algorithm and its rotations).
+    The stabilizer chain of every prefix of the list is kept, so sets can be appended, the last sets removed and the order without some of the sets calculated without starting from scratch.
+
+    Args:
+        n_points (int): number of points the permutations act on
+    """
+    def __init__(self, n_points: int):
+        self.n_points: int = n_points
+        self.keys: list = []
+        self.generator_sets: list[list[np.ndarray]] = []
+        # self._prefix_chains[i] is the chain of the first i generator sets
+        self._prefix_chains: list[Stabilizer_Chain] = [Stabilizer_Chain(n_points)]
+        self._order_without_cache: dict[frozenset[int], int] = dict()
+
+    def __len__(self) -> int:
+        return len(self.generator_sets)
+
+    @property
+    def chain(self) -> Stabilizer_Chain:
+        """
+        Returns:
+            Stabilizer_Chain: stabilizer chain of the group generated by all generator sets
+        """
+        return self._prefix_chains[-1]
+
+    def order(self) -> int:
+        """
+        Returns:
+            int: order of the group generated by all generator sets
+        """
+        return self.chain.order()
+
+    def append(self, key, generators: list) -> int:
+        """
+        Add a set of generators.
+
+        Args:
+            key (any): object identifying the generator set, e.g. the algorithm the generators belong to
+            generators (list[np.ndarray | list[list[int]] | Permutation]): the generators
+
+        Returns:
+            int: order of the group generated by all generator sets
+        """
+        generator_arrays: list[np.ndarray] = [to_index_array(generator, self.n_points) for generator in generators]
+        chain: Stabilizer_Chain = self.chain.copy()
+        for generator in generator_arrays:
+            chain.add_generator(generator)
+        self.keys.append(key)
+        self.generator_sets.append(generator_arrays)
+        self._prefix_chains.append(chain)
+        self._order_without_cache.clear()
+        return chain.order()
+
+    def truncate(self, n_sets: int):
+        """
+        Remove all but the first `n_sets` generator sets.
+
+        Args:
+            n_sets (int): number of generator sets to keep
+        """
+        if n_sets >= len(self):
+            return
+        del self.keys[n_sets:]
+        del self.generator_sets[n_sets:]
+        del self._prefix_chains[n_sets + 1:]
+        self._order_without_cache.clear()
+
+    def order_without(self, indices: int | set[int]) -> int:
+        """
+        Calculate the order of the group generated by all generator sets except the ones with the given indices. Results are cached until the generator sets change.
+
+        Args:
+            indices (int | set[int]): index or indices of the generator sets to leave out
+
+        Returns:
+            int: order of the group generated by the remaining generator sets
+        """
+        indices: frozenset[int] = frozenset([indices]) if isinstance(indices, int) else frozenset(indices)
+        indices = frozenset(index for index in indices if 0 <= index < len(self))
+        if not indices:
+            return self.order()
+        if indices in self._order_without_cache:
+            return self._order_without_cache[indices]
+        full_order: int = self.order()
+        first_index: int = min(indices)
+        chain: Stabilizer_Chain = self._prefix_chains[first_index].copy()
+        for index in range(first_index + 1, len(self)):
+            # the group without some generator sets is a subgroup of the full group
+            if chain.order() == full_order:
+                break
+            if index in indices:
+                continue
+            for generator in self.generator_sets[index]:
+                chain.add_generator(generator)
+        order: int = chain.order()
+        self._order_without_cache[indices] = order
+        return order
+
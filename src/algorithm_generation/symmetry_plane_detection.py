@@ -7,10 +7,13 @@ References:
 [1] [Hruda et. al.](https://doi.org/10.1007/s00371-020-02034-w)
 """
 from functools import cache
+import itertools
 
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.optimize import minimize
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import pdist
 
 def init_planes(
         X: np.ndarray,
@@ -20,6 +23,7 @@ def init_planes(
     ) -> list[np.ndarray]:
     """
     Generate a set of random planes for symmetry detection by choosing two random points from X and computing the normal vector of the plane spanned by these points. The plane passes through the midpoint between these two points. Repeat `num_planes` times and only keep planes that are not too similar to the existing planes.
+    Similar planes are clustered with a spatial hash (see `Plane_Clusters`), so each plane is only compared to the planes in neighbouring cells.
 
     Args:
         X (np.ndarray): set of points as array of shape (n, 3)
@@ -30,82 +34,143 @@ def init_planes(
         list[np.ndarray]: list of planes in standard form (a, b, c, -d) (ax + by + cz + d = 0)
     """
     n_points: int = X.shape[0]
-    found_planes: dict[tuple[float, float, float, float], tuple[np.ndarray, int]] = {}
     if n_points > 500: # if there are too many points, only calculate a fixed number of random planes
         if verbosity > 0:
             print(f"Searching {num_planes} random planes for symmetries.")
-        for _ in range(num_planes):
-            # choose two random points
-            idx1: int = np.random.randint(0, n_points-1)
-            idx2: int = np.random.randint(idx1 + 1, n_points)
-            point_1, point_2 = X[idx1], X[idx2]
-            add_plane(
-                point_1=point_1,
-                point_2=point_2,
-                found_planes=found_planes,
-                plane_similarity_threshold=plane_similarity_threshold,
-                )
+        # choose pairs of random points
+        indices_1: np.ndarray = np.random.randint(0, n_points-1, size=num_planes)
+        indices_2: np.ndarray = np.random.randint(indices_1 + 1, n_points)
     else: # use all pairs of points to calculate planes
         if verbosity > 0:
             print(f"Searching all {X.shape[0] * (X.shape[0] - 1) // 2} planes for symmetries.")
-        for idx_1, point_1 in enumerate(X[:-1]):
-            for point_2 in X[idx_1+1:]:
-                add_plane(
-                    point_1=point_1,
-                    point_2=point_2,
-                    found_planes=found_planes,
-                    plane_similarity_threshold=plane_similarity_threshold,
-                    )
-    planes: list[np.ndarray] = [plane for plane, _ in found_planes.values()] # extract planes in standard form
-    return planes
-
-def add_plane(
-        point_1: np.ndarray,
-        point_2: np.ndarray,
-        found_planes: dict[tuple[float, float, float, float], tuple[np.ndarray, int]],
-        plane_similarity_threshold: float = 0.1, # $\delta$ in [1]
-        normal_diff_vectors: set[tuple[float, float, float]] = set(),
-        ) -> None:
-    """
-    Given two points and a list of current planes, compute the plane between the two points and add it to the list of planes if it is not too similar to the existing planes.
-    If it is similar, average the similar planes and update the list of planes accordingly.
+        indices_1, indices_2 = np.triu_indices(n_points, k=1)
+    # compute normal vectors of planes as the normalized difference vectors between the two points
+    diff_vectors: np.ndarray = X[indices_2] - X[indices_1]
+    normals: np.ndarray = diff_vectors / np.linalg.norm(diff_vectors, axis=1)[:, np.newaxis]
+    midpoints: np.ndarray = X[indices_1] + diff_vectors / 2
+    new_planes: np.ndarray = np.hstack((normals, np.sum(normals * midpoints, axis=1)[:, np.newaxis]))
+    # merge planes that are almost identical before clustering
+    new_planes, counts = np.unique(
+        canonical_plane_signs(new_planes).round(_decimals_for_tolerance(plane_similarity_threshold / 10)),
+        axis=0,
+        return_counts=True)
+    new_planes /= np.linalg.norm(new_planes[:, :3], axis=1)[:, np.newaxis]
+    clusters: Plane_Clusters = Plane_Clusters(plane_similarity_threshold)
+    for plane, count in zip(new_planes, counts):
+        clusters.add(plane, int(count))
+    return clusters.get_planes()
+
+
+class Plane_Clusters:
+    r"""
+    Cluster similar planes using a spatial hash on the quantized plane coefficients.
+    Cells of the hash have side length `plane_similarity_threshold`, so all planes closer than that threshold to a given plane lie in the 3^4 = 81 cells around it (three per coefficient: the plane's own cell and both adjacent cells).
+    Since `p` and `-p` describe the same plane, both signs are looked up, so up to 162 cells are searched.
 
     Args:
-        point_1 (np.ndarray): first point
-        point_2 (np.ndarray): second point
-        found_planes (dict[tuple[float, float, float, float], tuple[np.ndarray, int]]): dictionary of found planes
-        plane_similarity_threshold (float): threshold for distance between planes to consider them equal
-        normal_diff_vectors (set[tuple[float, float, float]]): set of normalized difference vectors between points that were already used to calculate a plane.
-            If a new plane would be calculated with the same difference vector, abort the calculation early to save compute time.
-    """
-    # compute normal vector of plane as the normalized difference vector between the two points
-    diff_vector: np.ndarray = point_2 - point_1
-    normal: np.ndarray = diff_vector / np.linalg.norm(diff_vector)
-    # compute midpoint
-    midpoint: np.ndarray = point_1 + diff_vector / 2
-    # TODO: check if plane is not too similar to existing planes
-    new_plane = plane_point_normal2standard_form((midpoint, normal))
-    new_plane_key = tuple(new_plane)
-    # plane_key is a 4-tuple describing the plane in standard form (0 = ax+by+cz+d)
-    # values: plane as 4D numpy vector and int counting how many planes were averaged to get this one
-    add_new_plane: bool = True
-    for plane_key, (plane, num) in list(found_planes.items()):
-        if (dist := plane_distance(new_plane, plane)) < plane_similarity_threshold:
-            if dist < plane_similarity_threshold/10: # planes are almost identical, no furhter averaging needed
-                # print(f"Planes are almost identical: {new_plane} and {plane},\n\tdistance: {dist}")
-                add_new_plane: bool = False
-                break
-            avg_plane: np.ndarray = average_planes(new_plane/num, plane)
-            avg_plane_key: tuple[float] = tuple(avg_plane)
-            found_planes[avg_plane_key] = (avg_plane, num + 1)
-            if not avg_plane_key == plane_key:
-                del found_planes[plane_key]
-            new_plane_key = avg_plane_key
-            new_plane = avg_plane
-            add_new_plane: bool = False
-            # break
-    if add_new_plane:
-        found_planes[new_plane_key] = (new_plane, 1)
+        plane_similarity_threshold (float): threshold for distance between planes to consider them equal ($\delta$ in [1])
+    """
+    def __init__(self, plane_similarity_threshold: float = 0.1):
+        self.plane_similarity_threshold: float = plane_similarity_threshold
+        # cluster index -> (average plane in standard form, sum of sign-aligned planes, number of planes in cluster)
+        self.clusters: list[tuple[np.ndarray, np.ndarray, int]] = []
+        self.cells: dict[tuple[int, int, int, int], set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.clusters)
+
+    def add(self, new_plane: np.ndarray, weight: int = 1) -> None:
+        """
+        Add a plane to the closest cluster within the similarity threshold or start a new cluster with it.
+        If the plane is almost identical to the closest cluster's average plane (distance < threshold/10), the cluster is not changed.
+
+        Args:
+            new_plane (np.ndarray): plane in standard form (a,b,c,d)
+            weight (int): number of planes `new_plane` represents
+        """
+        closest_index, closest_dist = self.find_closest(new_plane)
+        if closest_index is None:
+            self.clusters.append((new_plane, new_plane * weight, weight))
+            self._get_cell(new_plane).add(len(self.clusters) - 1)
+            return
+        if closest_dist < self.plane_similarity_threshold / 10: # planes are almost identical, no furhter averaging needed
+            return
+        plane, plane_sum, num = self.clusters[closest_index]
+        if np.dot(plane[:3], new_plane[:3]) < 0:
+            new_plane = -new_plane
+        plane_sum = plane_sum + new_plane * weight
+        num += weight
+        avg_plane: np.ndarray = plane_sum / num
+        # normalize first three components
+        avg_plane /= np.linalg.norm(avg_plane[:3])
+        self._get_cell(plane).discard(closest_index)
+        self._get_cell(avg_plane).add(closest_index)
+        self.clusters[closest_index] = (avg_plane, plane_sum, num)
+
+    def find_closest(self, new_plane: np.ndarray) -> tuple[int | None, float]:
+        """
+        Find the cluster whose average plane is closest to the given plane.
+
+        Args:
+            new_plane (np.ndarray): plane in standard form (a,b,c,d)
+
+        Returns:
+            int | None: index of the closest cluster with distance less than the threshold, None if there is no such cluster
+            float: distance to that cluster
+        """
+        closest_index: int | None = None
+        closest_dist: float = self.plane_similarity_threshold
+        for key in self._get_neighbour_keys(new_plane):
+            for index in self.cells.get(key, ()):
+                if (dist := plane_distance(new_plane, self.clusters[index][0])) < closest_dist:
+                    closest_index, closest_dist = index, dist
+        return closest_index, closest_dist
+
+    def get_planes(self) -> list[np.ndarray]:
+        """
+        Returns:
+            list[np.ndarray]: the average plane of each cluster
+        """
+        return [plane for plane, _, _ in self.clusters]
+
+    def _get_cell(self, plane: np.ndarray) -> set[int]:
+        """
+        Get the set of cluster indices in the cell containing the given plane, creating it if necessary.
+        """
+        key: tuple[int, int, int, int] = tuple(np.floor(plane / self.plane_similarity_threshold).astype(int))
+        return self.cells.setdefault(key, set())
+
+    def _get_neighbour_keys(self, plane: np.ndarray) -> set[tuple[int, int, int, int]]:
+        """
+        Get the keys of all cells that may contain planes closer than the threshold to the given plane (with either sign).
+        """
+        keys: set[tuple[int, int, int, int]] = set()
+        for signed_plane in (plane, -plane):
+            lower: np.ndarray = np.floor((signed_plane - self.plane_similarity_threshold) / self.plane_similarity_threshold).astype(int)
+            upper: np.ndarray = np.floor((signed_plane + self.plane_similarity_threshold) / self.plane_similarity_threshold).astype(int)
+            keys.update(itertools.product(*(range(low, high + 1) for low, high in zip(lower, upper))))
+        return keys
+
+
+def canonical_plane_signs(planes: np.ndarray) -> np.ndarray:
+    """
+    Flip the signs of planes in standard form such that the largest component of each normal vector is positive. `p` and `-p` describe the same plane, so this gives a unique representation of most planes.
+
+    Args:
+        planes (np.ndarray): planes in standard form (a,b,c,d) as array of shape (n, 4)
+
+    Returns:
+        np.ndarray: planes with canonical signs
+    """
+    largest_components: np.ndarray = planes[np.arange(len(planes)), np.argmax(np.abs(planes[:, :3]), axis=1)]
+    return planes * np.where(largest_components < 0, -1, 1)[:, np.newaxis]
+
+def _decimals_for_tolerance(tolerance: float) -> int:
+    """
+    Returns:
+        int: number of decimals to round to such that rounding errors are smaller than `tolerance`
+    """
+    return max(0, int(np.ceil(-np.log10(tolerance))))
 
 def average_planes(
         plane_1: np.ndarray,
@@ -185,7 +250,21 @@ def dist_similarity_function(dist: float, alpha: float = 15) -> float:
     #         (8 * (1 / 2.6 * alpha * dist)**2 + 5 * (1 / 2.6 * alpha * dist) + 1)
     #     return value
 
-def reflect_symmetry_measure(X: np.ndarray, plane: np.ndarray, alpha: float) -> float:
+def dist_similarity_derivative(dist: float, alpha: float = 15) -> float:
+    """
+    Derivative of `dist_similarity_function` with respect to the distance.
+
+    Args:
+        dist (float): distance between two points
+        alpha (float): parameter to control the similarity function
+    Returns:
+        float: derivative of the similarity at the given distance
+    """
+    alpha_term = 1 / 2.6 * alpha * dist
+    value = -14 * alpha_term * (4 * alpha_term + 1) * (1 - alpha_term)**4 * alpha / 2.6
+    return np.where(alpha * dist <= 2.6, value, 0)
+
+def reflect_symmetry_measure(X: np.ndarray, plane: np.ndarray, alpha: float, tree: cKDTree | None = None) -> float:
     """
     Compute the symmetry measure for a set of points X reflected across a plane defined by a midpoint and normal vector.
     Higher symmetry measure indicates higher symmetry.
@@ -194,24 +273,91 @@ def reflect_symmetry_measure(X: np.ndarray, plane: np.ndarray, alpha: float) ->
         X (np.ndarray): set of points
         plane (np.ndarray): plane defined by a midpoint and normal vector
         alpha (float): parameter to control the similarity function
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
 
     Returns:
         float: symmetry measure in range [0, inf)   (see Ref.[1] Eq. (2))
     """
-    n: int = X.shape[0] # number of points
-    transformed_X = reflect_points_across_plane(X, plane)
-    # transformed_X = reflect_points_across_plane(X, plane[0], plane[1])
-    # similarity_measure = 0
-    pairwise_distances = np.linalg.norm(transformed_X[:, np.newaxis] - X, axis=2)
-    # Apply the distance similarity function to all distances
-    similarity_measures = dist_similarity_function(pairwise_distances, alpha)
-    # Sum all the similarity measures
-    similarity_measure = np.sum(similarity_measures)
-    # if hasattr(reflect_symmetry_measure, "run_count"):
-    #     reflect_symmetry_measure.run_count += 1
-    # else:
-    #     reflect_symmetry_measure.run_count = 1
-    return similarity_measure
+    return reflect_symmetry_measures(X, [plane], alpha, tree=tree)[0]
+
+def reflect_symmetry_measures(
+        X: np.ndarray,
+        planes: list[np.ndarray] | np.ndarray,
+        alpha: float,
+        tree: cKDTree | None = None,
+        batch_size: int = 256,
+    ) -> np.ndarray:
+    """
+    Compute the symmetry measures (see `reflect_symmetry_measure`) of many planes at once.
+
+    Args:
+        X (np.ndarray): set of points
+        planes (list[np.ndarray] | np.ndarray): planes in standard form (a,b,c,d)
+        alpha (float): parameter to control the similarity function
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
+        batch_size (int): number of planes to evaluate in one KD-tree query
+
+    Returns:
+        np.ndarray: symmetry measure of each plane
+    """
+    planes: np.ndarray = np.asarray(planes, dtype=float).reshape(-1, 4)
+    # reflect X across all planes: x - 2 * (<n, x> + d) * n
+    def reflect(plane_batch: np.ndarray) -> np.ndarray:
+        normals: np.ndarray = plane_batch[:, np.newaxis, :3]
+        signed_dists: np.ndarray = np.sum(X * normals, axis=2, keepdims=True) + plane_batch[:, np.newaxis, 3:]
+        return X - 2 * signed_dists * normals
+    return batched_symmetry_measures(X, reflect, planes, alpha, tree=tree, batch_size=batch_size)
+
+def batched_symmetry_measures(
+        X: np.ndarray,
+        transform,
+        parameters: np.ndarray,
+        alpha: float,
+        tree: cKDTree | None = None,
+        batch_size: int = 256,
+    ) -> np.ndarray:
+    """
+    Compute the symmetry measures of many transformations of X at once.
+    The measure of a transformation T is the sum of `dist_similarity_function(||T(x_i) - x_j||, alpha)` over all pairs of points. Since the similarity function is 0 for distances > 2.6/alpha, only pairs of points within that radius are found with a KD-tree and evaluated.
+
+    Args:
+        X (np.ndarray): set of points of shape (n, 3)
+        transform (Callable[[np.ndarray], np.ndarray]): function mapping a batch of `parameters` of length m to the transformed points of shape (m, n, 3)
+        parameters (np.ndarray): parameters of all transformations, first axis indexes transformations
+        alpha (float): parameter to control the similarity function
+        tree (cKDTree, optional): KD-tree of `X`. Defaults to None (build a new one).
+        batch_size (int): number of transformations to evaluate in one KD-tree query
+
+    Returns:
+        np.ndarray: symmetry measure of each transformation
+    """
+    if tree is None:
+        tree = cKDTree(X)
+    n_points: int = X.shape[0]
+    max_dist: float = 2.6 / alpha
+    scores: np.ndarray = np.zeros(len(parameters))
+    for batch_start in range(0, len(parameters), batch_size):
+        parameter_batch: np.ndarray = parameters[batch_start:batch_start + batch_size]
+        transformed_X: np.ndarray = transform(parameter_batch).reshape(-1, 3)
+        neighbour_dists = cKDTree(transformed_X).sparse_distance_matrix(tree, max_dist, output_type="coo_matrix")
+        # row i of the distance matrix belongs to transformation i // n_points of the batch
+        scores[batch_start:batch_start + len(parameter_batch)] = np.bincount(
+            neighbour_dists.row // n_points,
+            weights=dist_similarity_function(neighbour_dists.data, alpha),
+            minlength=len(parameter_batch))
+    return scores
+
+def average_point_distance(X: np.ndarray) -> float:
+    """
+    Calculate the average distance between all pairs of points in X (including each point with itself) without building the full distance matrix.
+
+    Args:
+        X (np.ndarray): set of points of shape (n, 3)
+
+    Returns:
+        float: average distance between points
+    """
+    return 2 * np.sum(pdist(X)) / X.shape[0]**2
 
 def find_symmetry_planes(
         X: np.ndarray,
@@ -234,13 +380,14 @@ def find_symmetry_planes(
         list[tuple[np.ndarray, np.ndarray]]: list of best symmetry planes
     """
     # calculate alpha as 15/l_avg, the average distance between points in X
-    alpha = 20 / np.mean(np.linalg.norm(X[:, np.newaxis] - X, axis=2))
+    alpha = 20 / average_point_distance(X)
     print(f"Set alpha to {alpha:.3f}.")
     # print parameters
     planes: list[tuple[np.ndarray, np.ndarray]] = init_planes(X, plane_similarity_threshold, num_planes=num_init_planes, verbosity=verbosity)
     print(f"Initalized {len(planes)} planes.")
     # choose planes with best symmetry measure
-    plane_scores = [reflect_symmetry_measure(X, plane, alpha) for plane in planes]
+    tree: cKDTree = cKDTree(X)
+    plane_scores: np.ndarray = reflect_symmetry_measures(X, planes, alpha, tree=tree)
     # sort planes by score
     sorted_planes_scores: list[tuple[np.ndarray, float]] = sorted(zip(planes, plane_scores), key=lambda x: x[1], reverse=True)
     # keep the given number of planes and all other planes that have no worse scores than that.
@@ -253,7 +400,7 @@ def find_symmetry_planes(
     def objective(plane):
         # normalize the normal vector
         plane[:3] = plane[:3] / np.linalg.norm(plane[:3])
-        return -reflect_symmetry_measure(X, plane, alpha)
+        return -reflect_symmetry_measure(X, plane, alpha, tree=tree)
     symmetry_planes = []
     for plane in best_planes:
         result = minimize(objective, plane, method="BFGS")
@@ -301,7 +448,7 @@ def prune_by_symmetry_measure(
     Returns:
         list[np.ndarray]: pruned list of planes
     """
-    all_scores: list[float] = [reflect_symmetry_measure(X, plane, alpha) for plane in planes]
+    all_scores: list[float] = list(reflect_symmetry_measures(X, planes, alpha))
     scores_string: str = '\n  '.join([f'plane {i} {score:.3f}' for i, score in enumerate(all_scores)])
     print(f"symmetry_measures:\n  {scores_string}")
     best_score: float = max(all_scores)
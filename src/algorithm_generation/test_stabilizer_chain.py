@@ -0,0 +1,111 @@
+"""
+This module tests `Stabilizer_Chain` and `Group_Order_Tracker` against sympy's permutation groups.
+
+The tests can be run with pytest or by executing this file.
+
+Author: Sebastian Jost
+"""
+import os, sys, inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+parent2dir = os.path.dirname(parentdir)
+sys.path.insert(0,parent2dir)
+
+from sympy.combinatorics import Permutation, PermutationGroup
+
+from src.algorithm_generation.stabilizer_chain import Stabilizer_Chain, Group_Order_Tracker
+from src.puzzle_model import Puzzle_Model
+
+
+def sympy_order(moves: list[list[list[int]]], n_points: int) -> int:
+    """
+    Returns:
+        int: order of the group generated by the given moves, calculated with sympy
+    """
+    if not moves:
+        return 1
+    return PermutationGroup([Permutation(move, size=n_points) for move in moves]).order()
+
+def test_group_orders(puzzle_names: tuple[str] = ("cube_2x2x2", "rubiks_3x3")):
+    """
+    The order of the group generated by all moves of a puzzle must match sympy's result. The moves and their products must be elements of the group, a single swap of two points of the same move must not be.
+    """
+    for puzzle_name in puzzle_names:
+        puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
+        chain: Stabilizer_Chain = Stabilizer_Chain(puzzle.n_points)
+        for move in puzzle.moves.values():
+            chain.add_generator(move)
+        assert chain.order() == sympy_order(list(puzzle.moves.values()), puzzle.n_points)
+        moves: list[list[list[int]]] = list(puzzle.moves.values())
+        assert all(chain.contains(move) for move in moves)
+        product: Permutation = Permutation(moves[0], size=puzzle.n_points) * Permutation(moves[-1], size=puzzle.n_points)
+        assert chain.contains(product)
+        first_cycle: list[int] = moves[0][0]
+        assert not chain.contains([[first_cycle[0], first_cycle[1]]])
+
+def test_adding_redundant_generators():
+    """
+    Adding an element of the group must not change the chain.
+    """
+    puzzle: Puzzle_Model = Puzzle_Model("cube_2x2x2")
+    moves: list[list[list[int]]] = list(puzzle.moves.values())
+    chain: Stabilizer_Chain = Stabilizer_Chain(puzzle.n_points)
+    assert chain.order() == 1
+    assert chain.add_generator(moves[0])
+    order: int = chain.order()
+    assert not chain.add_generator(moves[0])
+    # the square of the move is generated by the move
+    assert not chain.add_generator(Permutation(moves[0], size=puzzle.n_points)**2)
+    assert chain.order() == order == sympy_order(moves[:1], puzzle.n_points)
+
+def test_order_without(puzzle_name: str = "cube_2x2x2"):
+    """
+    `order_without` must match sympy's order of the group generated by the remaining generator sets, also after the cache was filled.
+    """
+    puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
+    # one generator set per pair of a move and its inverse
+    generator_sets: list[list[list[list[int]]]] = [list(puzzle.moves.values())[i:i+2] for i in range(0, len(puzzle.moves), 2)]
+    tracker: Group_Order_Tracker = Group_Order_Tracker(puzzle.n_points)
+    for i, generators in enumerate(generator_sets):
+        tracker.append(i, generators)
+    assert tracker.order() == sympy_order(sum(generator_sets, []), puzzle.n_points)
+    for indices in (0, len(generator_sets) - 1, {0, 1}, {1, 3, 4}, set(range(len(generator_sets))), {0, 1}):
+        left_out: set[int] = {indices} if isinstance(indices, int) else indices
+        remaining_moves: list[list[list[int]]] = sum(
+            (generators for i, generators in enumerate(generator_sets) if i not in left_out), [])
+        assert tracker.order_without(indices) == sympy_order(remaining_moves, puzzle.n_points)
+    # indices outside the list are ignored
+    assert tracker.order_without({len(generator_sets)}) == tracker.order()
+
+def test_truncate(puzzle_name: str = "cube_2x2x2"):
+    """
+    After truncating, the order and `order_without` must only depend on the remaining generator sets, and new sets can be appended.
+    """
+    puzzle: Puzzle_Model = Puzzle_Model(puzzle_name)
+    moves: list[list[list[int]]] = list(puzzle.moves.values())
+    tracker: Group_Order_Tracker = Group_Order_Tracker(puzzle.n_points)
+    for i, move in enumerate(moves):
+        tracker.append(i, [move])
+    full_order: int = tracker.order()
+    order_without_first: int = tracker.order_without(0) # fill the cache
+    tracker.truncate(2)
+    assert len(tracker) == 2 and tracker.keys == [0, 1]
+    assert tracker.order() == sympy_order(moves[:2], puzzle.n_points)
+    assert tracker.order_without(0) == sympy_order(moves[1:2], puzzle.n_points)
+    # truncating to a longer length does nothing
+    tracker.truncate(5)
+    assert len(tracker) == 2
+    for i, move in enumerate(moves[2:], start=2):
+        tracker.append(i, [move])
+    assert tracker.order() == full_order
+    assert tracker.order_without(0) == order_without_first
+    tracker.truncate(0)
+    assert len(tracker) == 0 and tracker.order() == 1
+
+
+if __name__ == "__main__":
+    test_group_orders()
+    test_adding_redundant_generators()
+    test_order_without()
+    test_truncate()
+    print("All tests passed.")
@@ -0,0 +1,282 @@
+"""
+methods to save and load puzzles in a compiled binary format (`puzzle_definition.npz`) next to `puzzle_definition.xml`
+
+Parsing the xml definition is slow for big puzzles. The compiled format stores the same information as numpy arrays:
+    - `coords`: (n_points, 3) float array of point coordinates
+    - `colors`: (n_points, 3) float array of point colors (r, g, b in range 0-1)
+    - `sizes`: (n_points,) float array of point sizes
+    - `move_names`: (n_moves,) string array of move names
+    - `cycle_points`: flat int array of the points of all cycles of all moves
+    - `cycle_offsets`: (n_cycles+1,) int array, cycle i is `cycle_points[cycle_offsets[i]:cycle_offsets[i+1]]`
+    - `move_offsets`: (n_moves+1,) int array, move j consists of the cycles `move_offsets[j]` to `move_offsets[j+1]-1`
+    - `state_space_size`: state space size as string ("" if unknown)
+    - `source_hash`: SHA-256 hash of the xml definition the file was compiled from
+The arrays are saved uncompressed, so they can be memory-mapped. The compiled file is (re-)generated from the xml definition whenever it is missing or outdated. This module does not use vpython.
+"""
+import hashlib
+import os
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+
+import numpy as np
+
+from .load_from_xml import get_moves, get_size
+
+COMPILED_PUZZLE_FILE_NAME: str = "puzzle_definition.npz"
+XML_PUZZLE_FILE_NAME: str = "puzzle_definition.xml"
+
+
+def load_compiled_puzzle(puzzle_name: str, mmap: bool = True) -> dict:
+    """
+    load a puzzle from its compiled definition. The compiled definition is generated from the xml definition on first load and whenever the xml definition changes.
+
+    inputs:
+    -------
+        puzzle_name - (str) - the name of the puzzle or path of its `puzzle_definition.xml`
+        mmap - (bool) - whether to memory-map the point arrays
+
+    returns:
+    --------
+        (dict) - dictionary with keys:
+            'coords' - (np.ndarray) - (n_points, 3) array of point coordinates
+            'colors' - (np.ndarray) - (n_points, 3) array of point colors (r, g, b)
+            'sizes' - (np.ndarray) - (n_points,) array of point sizes
+            'moves' - (dict) - dict of moves with movenames as keys and list of lists of ints as cycles
+            'state_space_size' - (int) or (None) - the state space size if it is defined
+
+    raises:
+    -------
+        FileNotFoundError - if neither the xml nor the compiled definition exist
+    """
+    xml_path, compiled_path = get_puzzle_definition_paths(puzzle_name)
+    source_hash: str | None = get_file_hash(xml_path)
+    arrays: dict[str, np.ndarray] | None = None
+    if os.path.exists(compiled_path):
+        arrays = read_compiled_puzzle(compiled_path, mmap=mmap)
+        if source_hash is not None and str(arrays["source_hash"]) != source_hash:
+            arrays = None # outdated, recompile
+    if arrays is None:
+        if source_hash is None:
+            raise FileNotFoundError(f"No definition of puzzle '{puzzle_name}' found at {xml_path}.")
+        arrays = compile_xml_puzzle(xml_path, compiled_path)
+    return {
+        "coords": arrays["coords"],
+        "colors": arrays["colors"],
+        "sizes": arrays["sizes"],
+        "moves": flat_arrays_to_moves(
+            arrays["move_names"],
+            arrays["cycle_points"],
+            arrays["cycle_offsets"],
+            arrays["move_offsets"]),
+        "state_space_size": int(str(arrays["state_space_size"])) if str(arrays["state_space_size"]) else None,
+    }
+
+
+def compile_xml_puzzle(xml_path: str, compiled_path: str = None) -> dict[str, np.ndarray]:
+    """
+    parse an xml puzzle definition and save it in the compiled format
+
+    inputs:
+    -------
+        xml_path - (str) - path of the `puzzle_definition.xml`
+        compiled_path - (str) - path to save the compiled definition at. Defaults to `puzzle_definition.npz` in the same folder.
+
+    returns:
+    --------
+        (dict) - the arrays saved in the compiled definition
+    """
+    if compiled_path is None:
+        compiled_path = os.path.join(os.path.dirname(xml_path), COMPILED_PUZZLE_FILE_NAME)
+    with open(xml_path, "rb") as puzzle_file:
+        xml_bytes: bytes = puzzle_file.read()
+    puzzle_tree = ET.ElementTree(ET.fromstring(xml_bytes))
+    coords, colors, sizes = get_point_arrays(puzzle_tree)
+    return save_compiled_puzzle(
+        compiled_path,
+        coords=coords,
+        colors=colors,
+        sizes=sizes,
+        moves=get_moves(puzzle_tree),
+        state_space_size=get_size(puzzle_tree),
+        source_hash=hashlib.sha256(xml_bytes).hexdigest(),
+    )
+
+
+def save_compiled_puzzle(
+        compiled_path: str,
+        coords: np.ndarray,
+        colors: np.ndarray,
+        sizes: np.ndarray,
+        moves: dict[str, list[list[int]]],
+        state_space_size: int = None,
+        source_hash: str = "",
+    ) -> dict[str, np.ndarray]:
+    """
+    save a puzzle in the compiled format
+
+    inputs:
+    -------
+        compiled_path - (str) - path of the `.npz` file to write
+        coords - (np.ndarray) - (n_points, 3) array of point coordinates
+        colors - (np.ndarray) - (n_points, 3) array of point colors (r, g, b)
+        sizes - (np.ndarray) - (n_points,) array of point sizes
+        moves - (dict) - dict of moves with movenames as keys and list of lists of ints as cycles
+        state_space_size - (int) - the state space size if it is known
+        source_hash - (str) - SHA-256 hash of the xml definition
+
+    returns:
+    --------
+        (dict) - the saved arrays
+    """
+    arrays: dict[str, np.ndarray] = {
+        "coords": np.asarray(coords, dtype=np.float64).reshape(-1, 3),
+        "colors": np.asarray(colors, dtype=np.float64).reshape(-1, 3),
+        "sizes": np.asarray(sizes, dtype=np.float64).reshape(-1),
+        **moves_to_flat_arrays(moves),
+        "state_space_size": np.array("" if state_space_size is None else str(state_space_size)),
+        "source_hash": np.array(source_hash),
+    }
+    # write to a temporary file first, so that readers never see a partially written file
+    temp_path: str = compiled_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(temp_path, compiled_path)
+    return arrays
+
+
+def read_compiled_puzzle(compiled_path: str, mmap: bool = True) -> dict[str, np.ndarray]:
+    """
+    read all arrays of a compiled puzzle definition
+
+    inputs:
+    -------
+        compiled_path - (str) - path of the `.npz` file
+        mmap - (bool) - whether to memory-map the arrays instead of reading them into memory
+
+    returns:
+    --------
+        (dict) - arrays stored in the file
+    """
+    if not mmap:
+        with np.load(compiled_path) as npz_file:
+            return {key: npz_file[key] for key in npz_file.files}
+    arrays: dict[str, np.ndarray] = dict()
+    with zipfile.ZipFile(compiled_path) as zip_file, open(compiled_path, "rb") as file:
+        for info in zip_file.infolist():
+            key: str = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                arrays[key] = np.load(zip_file.open(info))
+                continue
+            # skip the local file header to find the start of the .npy data
+            file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", file.read(4))
+            file.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            if dtype.hasobject or np.prod(shape) == 0:
+                arrays[key] = np.load(zip_file.open(info))
+                continue
+            arrays[key] = np.memmap(
+                compiled_path,
+                dtype=dtype,
+                mode="r",
+                offset=file.tell(),
+                shape=shape,
+                order="F" if fortran_order else "C")
+    return arrays
+
+
+def get_point_arrays(puzzle_tree) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    load point coordinates, colors and sizes from xml tree
+
+    inputs:
+    -------
+        puzzle_tree - (ElementTree) - ET.ElementTree containing the puzzle info
+
+    returns:
+    --------
+        (np.ndarray) - (n_points, 3) array of point coordinates
+        (np.ndarray) - (n_points, 3) array of point colors (r, g, b)
+        (np.ndarray) - (n_points,) array of point sizes
+    """
+    point_elements = puzzle_tree.findall("points/point")
+    coords = np.array([[float(point.find("coords").get(attr)) for attr in "xyz"] for point in point_elements])
+    colors = np.array([[float(point.find("color").get(attr)) for attr in "rgb"] for point in point_elements])
+    sizes = np.array([float(point.get("size")) for point in point_elements])
+    return coords.reshape(-1, 3), colors.reshape(-1, 3), sizes
+
+
+def moves_to_flat_arrays(moves: dict[str, list[list[int]]]) -> dict[str, np.ndarray]:
+    """
+    convert moves to a flat array of all cycle points with offsets
+
+    inputs:
+    -------
+        moves - (dict) - dict of moves with movenames as keys and list of lists of ints as cycles
+
+    returns:
+    --------
+        (dict) - arrays 'move_names', 'cycle_points', 'cycle_offsets' and 'move_offsets' (see module docstring)
+    """
+    cycles: list[list[int]] = [cycle for move in moves.values() for cycle in move]
+    cycle_lengths: list[int] = [len(cycle) for cycle in cycles]
+    return {
+        "move_names": np.array(list(moves.keys()), dtype=str),
+        "cycle_points": np.array([point for cycle in cycles for point in cycle], dtype=np.int64),
+        "cycle_offsets": np.concatenate(([0], np.cumsum(cycle_lengths, dtype=np.int64))),
+        "move_offsets": np.concatenate(([0], np.cumsum([len(move) for move in moves.values()], dtype=np.int64))),
+    }
+
+
+def flat_arrays_to_moves(
+        move_names: np.ndarray,
+        cycle_points: np.ndarray,
+        cycle_offsets: np.ndarray,
+        move_offsets: np.ndarray,
+    ) -> dict[str, list[list[int]]]:
+    """
+    inverse of `moves_to_flat_arrays`
+
+    returns:
+    --------
+        (dict) - dict of moves with movenames as keys and list of lists of ints as cycles
+    """
+    cycles: list[list[int]] = np.split(np.asarray(cycle_points), np.asarray(cycle_offsets)[1:-1]) if len(cycle_offsets) > 1 else []
+    cycles = [cycle.tolist() for cycle in cycles]
+    move_offsets: list[int] = np.asarray(move_offsets).tolist()
+    return {
+        str(name): cycles[move_offsets[i]:move_offsets[i+1]]
+        for i, name in enumerate(move_names)
+    }
+
+
+def get_puzzle_definition_paths(puzzle_name: str) -> tuple[str, str]:
+    """
+    returns:
+    --------
+        (str) - path of the xml definition of the given puzzle
+        (str) - path of the compiled definition of the given puzzle
+    """
+    if XML_PUZZLE_FILE_NAME in puzzle_name:
+        xml_path: str = puzzle_name
+    else:
+        xml_path: str = os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, XML_PUZZLE_FILE_NAME)
+    return xml_path, os.path.join(os.path.dirname(xml_path), COMPILED_PUZZLE_FILE_NAME)
+
+
+def get_file_hash(file_path: str) -> str | None:
+    """
+    returns:
+    --------
+        (str) or (None) - SHA-256 hash of the file's content or None if the file does not exist
+    """
+    try:
+        with open(file_path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
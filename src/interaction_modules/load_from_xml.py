@@ -2,12 +2,10 @@
 methods to load a puzzle from an .xml file
 """
 import xml.etree.ElementTree as ET
-import os
-import vpython as vpy
 
 def load_puzzle(puzzle_name):
     """
-    load puzzle from .xml
+    load puzzle from .xml. The puzzle is read from its compiled definition (`puzzle_definition.npz`), which is generated from the .xml file on first load (see `compiled_puzzle.py`).
 
     inputs:
     -------
@@ -19,17 +17,16 @@ def load_puzzle(puzzle_name):
         (dict) - dict of moves with movenames as keys and 
             list of lists of ints as cycles
     """
-    if not "puzzle_definition.xml" in puzzle_name:
-        puzzle_path: str = os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, "puzzle_definition.xml")
-    else:
-        puzzle_path: str = puzzle_name
-    with open(puzzle_path) as puzzle_file:
-        puzzle_tree = ET.parse(puzzle_file)
-    point_dicts = get_points(puzzle_tree)
-    moves_dict = get_moves(puzzle_tree)
-    state_space_size = get_size(puzzle_tree)
-
-    return point_dicts, moves_dict, state_space_size
+    import vpython as vpy
+    from .compiled_puzzle import load_compiled_puzzle
+    puzzle_data = load_compiled_puzzle(puzzle_name)
+    point_dicts = [
+        {"coords":vpy.vec(*coords), "vpy_color":vpy.vec(*color), "size":size}
+        for coords, color, size in zip(
+            puzzle_data["coords"].tolist(),
+            puzzle_data["colors"].tolist(),
+            puzzle_data["sizes"].tolist())]
+    return point_dicts, puzzle_data["moves"], puzzle_data["state_space_size"]
 
 
 def get_points(puzzle_tree):
@@ -75,6 +72,7 @@ def get_float_attr(xml_elem, attributes):
     --------
         (vpython vector) - vpython vector of all requested attributes as floats
     """
+    import vpython as vpy
     attrib_values = []
     for attr in attributes:
         attrib_values.append(float(xml_elem.get(attr)))
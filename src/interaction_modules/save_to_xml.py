@@ -4,6 +4,9 @@ methods to save information about a puzzle in an xml file
 # import xml.etree.ElementTree as ET
 import lxml.etree as let
 import os
+import hashlib
+
+from .compiled_puzzle import save_compiled_puzzle, COMPILED_PUZZLE_FILE_NAME
 
 
 def save_to_xml(puzzle):
@@ -26,17 +29,18 @@ def save_to_xml(puzzle):
     outputs:
     --------
         creates a folder 'puzzlename' and in it a file 'puzzledefinition.xml'
-            containing all important puzzle information
+            containing all important puzzle information and its compiled version 'puzzle_definition.npz'
     """
     if puzzle.PUZZLE_NAME != None:
         puzzle_name = puzzle.PUZZLE_NAME
     else:
         puzzle_name = "unnamed_puzzle"
     root_elem = let.Element("puzzledefinition", name=puzzle_name)
-    if hasattr(puzzle, "state_space_size") and not puzzle.moves_changed:
+    if not puzzle.moves_changed and hasattr(puzzle, "state_space_size"):
         root_elem.set("state_space_size", str(puzzle.state_space_size))
     root_elem.tail = "\n\t"
-    save_points(root_elem, puzzle.POINT_INFO_DICTS)
+    point_info_dicts = puzzle.POINT_INFO_DICTS
+    save_points(root_elem, point_info_dicts)
     try:
         save_moves(root_elem, puzzle.moves)
     except KeyError:
@@ -49,6 +53,14 @@ def save_to_xml(puzzle):
                               encoding='UTF-8')
     with open(os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, "puzzle_definition.xml"), "wb") as file:
         file.write(xml_string)
+    save_compiled_puzzle(
+        os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, COMPILED_PUZZLE_FILE_NAME),
+        coords=[[float(x) for x in vpy_vec_to_triple(point_dict["coords"])] for point_dict in point_info_dicts],
+        colors=[[float(x) for x in vpy_vec_to_triple(point_dict["vpy_color"])] for point_dict in point_info_dicts],
+        sizes=[point_dict["size"] for point_dict in point_info_dicts],
+        moves=puzzle.moves,
+        state_space_size=root_elem.get("state_space_size"),
+        source_hash=hashlib.sha256(xml_string).hexdigest())
     # puzzle_tree.write(os.path.join(puzzlename, "puzzle_definition.xml"))
 
 
@@ -61,7 +73,7 @@ def save_points(root_elem, point_info_dicts):
         root_elem - (let.?) - root object where points will be saved
         point_info_dicts - (list) - list of dictionaries containing point information:
             "coords" - list of x,y,z coordinates
-            "vpy_color" - vpython color vector (r,g,b) in range 0-1
+            "vpy_color" - vpython color vector or triple (r,g,b) in range 0-1
 
     returns:
     --------
@@ -108,6 +120,8 @@ def save_moves(root_elem, moves_dict):
 
 def vpy_vec_to_triple(vpy_vec):
     """
-    converts a vpython vector to a python triple
+    converts a vpython vector (or a triple of floats) to a python triple of strings
     """
+    if not hasattr(vpy_vec, "x"):
+        return tuple(str(float(value)) for value in vpy_vec)
     return str(vpy_vec.x), str(vpy_vec.y), str(vpy_vec.z)
\ No newline at end of file
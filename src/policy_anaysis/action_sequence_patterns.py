@@ -31,7 +31,6 @@ import numpy as np
 
 from src.algorithm_generation.algorithm_analysis import get_inverse_moves_dict
 from src.interaction_modules.ai_file_management import load_test_file
-from src.puzzle_class import Twisty_Puzzle
 from src.interaction_modules.ai_file_management import get_policy_savepath
 
 def get_action_sequence_frequencies(
@@ -137,7 +136,7 @@ def plot_most_common_sequences(
 
 
 def screen_capture_sequence_effects(
-        puzzle: Twisty_Puzzle,
+        puzzle: "Twisty_Puzzle",
         sequence: str,
         save_path: str,
     ) -> list[str]:
@@ -14,16 +14,15 @@ from matplotlib.gridspec import GridSpec
 import numpy as np
 
 from src.ai_modules.twisty_puzzle_model import perform_action
-from src.ai_modules.ai_data_preparation import state_for_ai
 from src.algorithm_generation.algorithm_analysis import get_inverse_moves_dict
 from src.interaction_modules.ai_file_management import load_test_file
-from src.puzzle_class import Twisty_Puzzle
+from src.puzzle_model import Puzzle_Model
 from src.interaction_modules.ai_file_management import get_policy_savepath
 
 
 def get_algorithm_utilization_data(
         test_data: dict[str, any],
-        puzzle: Twisty_Puzzle
+        puzzle: Puzzle_Model
     ) -> tuple[dict[str, list[int]], dict[str, list[int]]]:
     """
     Analyze the usage of each algorithm and collect data on the number of moves to the solved state
@@ -31,14 +30,14 @@ def get_algorithm_utilization_data(
     
     Args:
         test_data (dict[str, any]): test data to analyze
-        puzzle (Twisty_Puzzle): puzzle to analyze
+        puzzle (Puzzle_Model): puzzle to analyze
 
     Returns:
         tuple: Two dictionaries: 
             - moves_to_solved_algs: dict[str, list[int]]
             - correct_points_algs: dict[str, list[int]]
     """
-    solved_state, _ = state_for_ai(puzzle.SOLVED_STATE)
+    solved_state: list[int] = puzzle.SOLVED_STATE
     moves_dict: dict[str, list[list[int]]] = puzzle.moves
     inverse_dict: dict[str, str] = get_inverse_moves_dict(puzzle.moves)
     
@@ -193,8 +192,7 @@ def main(
     puzzle_definition_path = puzzle_definition_path[:2] + "/" + puzzle_definition_path[2:]
     print(puzzle_definition_path)
     # print(ref_path)
-    puzzle = Twisty_Puzzle()
-    puzzle.load_puzzle(puzzle_definition_path)
+    puzzle = Puzzle_Model(puzzle_definition_path)
 
     # Analyze the algorithms and collect data
     moves_to_solved_algs, unsolved_points_algs = get_algorithm_utilization_data(test_data, puzzle)
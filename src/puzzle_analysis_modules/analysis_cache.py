@@ -0,0 +1,267 @@
+"""
+This module implements a cache for the results of expensive puzzle analyses (pieces, orbits, inverse moves, action orders, group order and its factorization, compiled move arrays and detected symmetries).
+
+The cache is stored next to the puzzle definition (`src/puzzles/<puzzle_name>/analysis_cache.json`, arrays as `analysis_cache_<key>_<inputs hash>.npy`) and keyed by the SHA-256 hash of `puzzle_definition.xml`: whenever the definition changes, all cached results are discarded. Each entry additionally stores a hash of the inputs it was calculated from (e.g. the moves), so results are recalculated if a loaded puzzle was modified since loading. Only the latest result is kept for each key, so alternating between different inputs for the same key recalculates the result every time. If the puzzle has no definition file, nothing is cached. All files are written to a temporary file first and then moved into place, so an interrupted write never corrupts the cache.
+
+Author: Sebastian Jost
+"""
+import hashlib
+import json
+import os
+from typing import Callable
+
+import numpy as np
+
+from .piece_detection_v2 import detect_pieces
+from .size_analysis import get_state_space_size
+from ..ai_modules.permutation_engine import INDEX_DTYPE, move_to_index_array
+from ..interaction_modules.compiled_puzzle import get_file_hash
+
+ANALYSIS_CACHE_FILE_NAME: str = "analysis_cache.json"
+PUZZLE_DEFINITION_FILE_NAME: str = "puzzle_definition.xml"
+
+
+class Puzzle_Analysis_Cache:
+    """
+    Cache of analysis results of one puzzle.
+
+    Args:
+        puzzle_name (str): name of the puzzle or path of its `puzzle_definition.xml`
+    """
+    def __init__(self, puzzle_name: str):
+        if PUZZLE_DEFINITION_FILE_NAME in puzzle_name:
+            definition_path: str = puzzle_name
+        else:
+            definition_path: str = os.path.join(os.path.dirname(__file__), "..", "puzzles", puzzle_name, PUZZLE_DEFINITION_FILE_NAME)
+        self.folder_path: str = os.path.dirname(definition_path)
+        self.file_path: str = os.path.join(self.folder_path, ANALYSIS_CACHE_FILE_NAME)
+        self.content_hash: str | None = get_file_hash(definition_path)
+        self.entries: dict[str, dict] = self._load_entries()
+
+    def get(self,
+            key: str,
+            inputs,
+            compute: Callable[[], object],
+            encode: Callable[[object], object] = None,
+            decode: Callable[[object], object] = None,
+            ):
+        """
+        Get a cached result or calculate and cache it.
+
+        Args:
+            key (str): name of the result
+            inputs (any): JSON-serializable inputs the result is calculated from
+            compute (Callable[[], any]): function calculating the result
+            encode (Callable[[any], any], optional): function converting the result to a JSON-serializable object. Defaults to None (result is JSON-serializable).
+            decode (Callable[[any], any], optional): inverse of `encode`. Defaults to None.
+
+        Returns:
+            any: the result
+        """
+        inputs_hash: str = get_inputs_hash(inputs)
+        entry: dict | None = self.entries.get(key)
+        if entry is not None and entry["inputs_hash"] == inputs_hash:
+            return entry["value"] if decode is None else decode(entry["value"])
+        value = compute()
+        if self.content_hash is not None:
+            self.entries[key] = {
+                "inputs_hash": inputs_hash,
+                "value": value if encode is None else encode(value),
+            }
+            self._save_entries()
+        return value
+
+    def get_array(self, key: str, inputs, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Get a cached array or calculate and cache it. Arrays are stored as `.npy` files named by the key and inputs hash and memory-mapped when loaded, so a file is never overwritten while it may still be mapped.
+
+        Args:
+            key (str): name of the array
+            inputs (any): JSON-serializable inputs the array is calculated from
+            compute (Callable[[], np.ndarray]): function calculating the array
+
+        Returns:
+            np.ndarray: the array
+        """
+        inputs_hash: str = get_inputs_hash(inputs)
+        array_path: str = os.path.join(self.folder_path, f"analysis_cache_{key}_{inputs_hash[:16]}.npy")
+        entry: dict | None = self.entries.get(key)
+        if entry is not None and entry["inputs_hash"] == inputs_hash and os.path.exists(array_path):
+            return np.load(array_path, mmap_mode="r")
+        array: np.ndarray = compute()
+        if self.content_hash is not None:
+            temp_path: str = array_path + ".tmp"
+            with open(temp_path, "wb") as file:
+                np.save(file, array)
+            os.replace(temp_path, array_path)
+            if entry is not None and entry["value"] != os.path.basename(array_path):
+                # remove the array of the previous inputs (fails on some systems if it is still memory-mapped)
+                try:
+                    os.remove(os.path.join(self.folder_path, entry["value"]))
+                except OSError:
+                    pass
+            self.entries[key] = {"inputs_hash": inputs_hash, "value": os.path.basename(array_path)}
+            self._save_entries()
+        return array
+
+    def get_move_arrays(self, moves: dict[str, list[list[int]]], n_points: int) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: all moves as stacked index arrays with shape (n_moves, n_points), in the order of `moves`
+        """
+        return self.get_array(
+            "move_arrays",
+            (moves, n_points),
+            lambda: np.stack([move_to_index_array(cycles, n_points) for cycles in moves.values()]).astype(INDEX_DTYPE)
+                if moves else np.zeros((0, n_points), dtype=INDEX_DTYPE))
+
+    def get_pieces(self, moves: dict[str, list[list[int]]], n_points: int) -> list[set[int]]:
+        """
+        Returns:
+            list[set[int]]: pieces of the puzzle (see `detect_pieces`)
+        """
+        return self.get(
+            "pieces",
+            (moves, n_points),
+            lambda: detect_pieces(moves, n_points),
+            encode=_encode_sets,
+            decode=_decode_sets)
+
+    def get_point_orbits(self, moves: dict[str, list[list[int]]], n_points: int) -> list[set[int]]:
+        """
+        Returns:
+            list[set[int]]: orbits of points under the given moves (see `calculate_point_orbits`)
+        """
+        from src.algorithm_generation.orbit_calculation import calculate_point_orbits
+        return self.get(
+            "point_orbits",
+            (moves, n_points),
+            lambda: calculate_point_orbits(n_points, self.get_move_arrays(moves, n_points)),
+            encode=_encode_sets,
+            decode=_decode_sets)
+
+    def get_piece_orbits(self, moves: dict[str, list[list[int]]], n_points: int) -> list[list[set[int]]]:
+        """
+        Returns:
+            list[list[set[int]]]: orbits of the pieces under the given moves (see `calculate_piece_orbits`)
+        """
+        from src.algorithm_generation.orbit_calculation import calculate_piece_orbits
+        return self.get(
+            "piece_orbits",
+            (moves, n_points),
+            lambda: calculate_piece_orbits(self.get_pieces(moves, n_points), self.get_point_orbits(moves, n_points)),
+            encode=lambda orbits: [_encode_sets(orbit) for orbit in orbits],
+            decode=lambda orbits: [_decode_sets(orbit) for orbit in orbits])
+
+    def get_inverse_moves_dict(self, moves: dict[str, list[list[int]]]) -> dict[str, str]:
+        """
+        Returns:
+            dict[str, str]: dictionary mapping move names to their inverses (see `get_inverse_moves_dict`)
+        """
+        from src.algorithm_generation.algorithm_analysis import get_inverse_moves_dict
+        return self.get("inverse_moves_dict", moves, lambda: get_inverse_moves_dict(moves))
+
+    def get_action_orders(self, moves: dict[str, list[list[int]]]) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: dictionary mapping each move name to its order (see `get_action_orders`)
+        """
+        from src.smart_scramble import get_action_orders
+        return self.get("action_orders", moves, lambda: get_action_orders(moves))
+
+    def get_state_space_size(self, moves: dict[str, list[list[int]]], n_points: int) -> int:
+        """
+        Returns:
+            int: order of the group generated by the given moves (see `get_state_space_size`)
+        """
+        return self.get(
+            "state_space_size",
+            (moves, n_points),
+            lambda: get_state_space_size(moves.values(), n_points),
+            encode=str,
+            decode=int)
+
+    def get_state_space_factorization(self, state_space_size: int) -> dict[int, int]:
+        """
+        Returns:
+            dict[int, int]: prime factorization of the state space size as dictionary mapping primes to their multiplicity
+        """
+        from sympy import factorint
+        return self.get(
+            "state_space_factorization",
+            str(state_space_size),
+            lambda: {int(prime): int(multiplicity) for prime, multiplicity in factorint(state_space_size).items()},
+            encode=lambda factors: [[str(prime), multiplicity] for prime, multiplicity in factors.items()],
+            decode=lambda factors: {int(prime): multiplicity for prime, multiplicity in factors})
+
+    def get_rotational_symmetries(
+            self,
+            inputs,
+            compute: Callable[[], list[tuple[float, np.ndarray, np.ndarray]]],
+        ) -> list[tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Get cached rotational symmetries (see `find_rotational_symmetries`) or detect and cache them.
+
+        Args:
+            inputs (any): JSON-serializable inputs of the symmetry detection (e.g. point coordinates and parameters)
+            compute (Callable[[], list[tuple[float, np.ndarray, np.ndarray]]]): function detecting the symmetries
+
+        Returns:
+            list[tuple[float, np.ndarray, np.ndarray]]: rotational symmetries (angle, axis, axis_support)
+        """
+        return self.get(
+            "rotational_symmetries",
+            inputs,
+            compute,
+            encode=lambda rotations: [[float(angle), np.asarray(axis).tolist(), np.asarray(support).tolist()] for angle, axis, support in rotations],
+            decode=lambda rotations: [(angle, np.array(axis), np.array(support)) for angle, axis, support in rotations])
+
+    def _load_entries(self) -> dict[str, dict]:
+        """
+        Load the cached entries if they belong to the current puzzle definition.
+        """
+        if self.content_hash is None:
+            return dict()
+        try:
+            with open(self.file_path, "r") as file:
+                cache: dict = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return dict()
+        if cache.get("content_hash") != self.content_hash:
+            return dict()
+        return cache.get("entries", dict())
+
+    def _save_entries(self) -> None:
+        """
+        Save all entries along with the hash of the puzzle definition.
+        """
+        cache_string: str = json.dumps({"content_hash": self.content_hash, "entries": self.entries}, default=_to_json)
+        # write to a temporary file first, so that readers never see a partially written file
+        temp_path: str = self.file_path + ".tmp"
+        with open(temp_path, "w") as file:
+            file.write(cache_string)
+        os.replace(temp_path, self.file_path)
+
+
+def get_inputs_hash(inputs) -> str:
+    """
+    Returns:
+        str: SHA-256 hash of the JSON representation of the inputs
+    """
+    return hashlib.sha256(json.dumps(inputs, default=_to_json).encode()).hexdigest()
+
+def _to_json(value):
+    """
+    Convert numpy arrays and scalars for `json.dumps`.
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def _encode_sets(sets: list[set[int]]) -> list[list[int]]:
+    return [sorted(int(i) for i in point_set) for point_set in sets]
+
+def _decode_sets(lists: list[list[int]]) -> list[set[int]]:
+    return [set(point_list) for point_list in lists]
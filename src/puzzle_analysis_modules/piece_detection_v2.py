@@ -2,61 +2,144 @@
 Calculate the pieces of a twisty puzzle based on the defined moves.
 This is version 2, version 1 had too many cases that did not work correctly.
 
+Pieces are calculated by partition refinement: the pieces are stored as a label array over all points (points with the same label belong to the same piece). Applying a move `perm` to the puzzle must map pieces to pieces, so two points `i` and `j` can only belong to the same piece if `perm[i]` and `perm[j]` do as well. Each move therefore splits pieces according to the label pairs `(label[i], label[perm[i]])`. Once no move splits any piece, the pieces are the coarsest partition that is compatible with all moves.
+
 Author: Sebastian Jost
 
 """
-import random
-import time
-from ..ai_modules.twisty_puzzle_model import perform_action
+import numpy as np
+
+from ..ai_modules.permutation_engine import move_to_index_array
 
 
 def detect_pieces(
-        moves: list[list[list[int]]],
+        moves: dict[str, list[list[int]]],
         n_points: int,
         inverse_dict: dict[str, str] = None,
-        max_moves: int = 1000
+        max_moves: int = None,
         ):
     """
     calculate all pieces of a puzzle, including those only seperable through move sequences that are longer than one move.
-    This is achieved by randomly performing [max_moves] moves and cutting pieces every time it's possible. This takes a little bit of time but shouldn't exceed 1s on most common puzzles.
-    Due to the choice of using random moves, it is possible that not all pieces are calculated correctly, but that's very, very unlikely unless the puzzle is built specifically to break this algorithm. In that case, just use more moves.
+    This is achieved by partition refinement: starting with the pieces necessary to perform each move at least once (see `get_piece_labels_template`), the moves are applied round-robin and pieces are split whenever a move maps points of one piece to different pieces. The refinement stops once `len(moves)` consecutive moves yielded no refinement; then no move sequence can split a piece any further, so the result is exact.
 
     Args:
-        moves (list[list[list[int]]]): list of moves as lists of cycles
+        moves (dict[str, list[list[int]]]): dictionary with move names and cycle lists
         n_points (int): number of points in the puzzle
-        inverse_dict (dict[str, str]): dictionary that assigns inverse moves
-        max_moves (int): number of moves to perform
-    """
-    start_time: float = time.perf_counter()
-    visited_states: set[tuple[int]] = set()
-    current_state: list[int] = list(range(n_points))
-    current_pieces: list[set[int]] = get_piece_template(
-            moves,
-            n_points,
-            inverse_dict=inverse_dict)
-    moves_list = list(moves.values())
-    for n_moves in range(max_moves):
-        # choose and apply random move
-        move = random.choice(moves_list)
-        perform_action(current_state, move)
-        # save state, if it is a new state.
-        state_tuple = tuple(current_state)
-        if not state_tuple in visited_states:
-            visited_states.add(state_tuple)
-            # get new pieces
-            new_pieces = list()
-            for piece in current_pieces:
-                new_piece = {current_state[i] for i in piece}
-                if not new_piece in current_pieces:
-                    new_pieces.append(new_piece)
-            # if new pieces were found, intersect them with the previous ones.
-            if len(new_pieces) > 0:
-                current_pieces = (intersect_pieces([current_pieces, new_pieces]))
-    end_time = time.perf_counter()
-    # print(f"calculation of {max_moves} moves took {end_time - start_time:.2f} s.")
+        inverse_dict (dict[str, str]): dictionary that assigns inverse moves. Inverse moves are skipped since they yield the same pieces.
+        max_moves (int): maximum number of moves to apply. Defaults to None (no limit; at most `(n_points + 1) * len(moves)` moves are necessary).
+
+    Returns:
+        list[set[int]]: list of pieces as sets of point indices, sorted by their smallest point
+    """
+    move_arrays: list[np.ndarray] = [
+        move_to_index_array(cycles, n_points)
+        for cycles in _skip_inverse_moves(moves, inverse_dict).values()]
+    labels: np.ndarray = get_piece_labels_template(move_arrays, n_points)
+    n_pieces: int = labels.max() + 1 if n_points > 0 else 0
+    moves_without_refinement: int = 0
+    n_moves: int = 0
+    while moves_without_refinement < len(move_arrays):
+        if max_moves is not None and n_moves >= max_moves:
+            break
+        move_array: np.ndarray = move_arrays[n_moves % len(move_arrays)]
+        labels, n_new_pieces = refine_labels(labels, labels[move_array])
+        if n_new_pieces > n_pieces:
+            n_pieces = n_new_pieces
+            moves_without_refinement = 0
+        else:
+            moves_without_refinement += 1
+        n_moves += 1
+    current_pieces: list[set[int]] = labels_to_pieces(labels)
     anaylse_pieces(current_pieces)
     return current_pieces
 
+def get_piece_labels_template(move_arrays: list[np.ndarray], n_points: int) -> np.ndarray:
+    """
+    Calculate piece labels of all points such that each move can be performed at least once:
+    Within each move, points in cycles of the same length form one piece and all unaffected points form another (see `split_move`).
+
+    Args:
+        move_arrays (list[np.ndarray]): moves as index arrays
+        n_points (int): number of points in the puzzle
+
+    Returns:
+        np.ndarray: piece label of each point, labels are 0, 1, ..., n_pieces-1
+    """
+    labels: np.ndarray = np.zeros(n_points, dtype=np.int64)
+    for move_array in move_arrays:
+        labels, _ = refine_labels(labels, get_cycle_lengths(move_array))
+    return labels
+
+def get_cycle_lengths(move_array: np.ndarray) -> np.ndarray:
+    """
+    Calculate the length of the cycle each point belongs to in the given move (1 for unaffected points).
+
+    Args:
+        move_array (np.ndarray): move as index array
+
+    Returns:
+        np.ndarray: cycle length of each point
+    """
+    cycle_lengths: np.ndarray = np.ones(len(move_array), dtype=np.int64)
+    images: np.ndarray = move_array.astype(np.int64)
+    while True:
+        # points that did not return to themselves yet have cycles longer than the current length
+        unfinished: np.ndarray = images != np.arange(len(move_array))
+        if not unfinished.any():
+            return cycle_lengths
+        cycle_lengths[unfinished] += 1
+        images = move_array[images]
+
+def refine_labels(labels: np.ndarray, other_labels: np.ndarray) -> tuple[np.ndarray, int]:
+    """
+    Calculate the coarsest common refinement of two partitions given as label arrays: two points get the same new label if and only if they have the same label in both partitions.
+
+    Args:
+        labels (np.ndarray): labels of the first partition
+        other_labels (np.ndarray): labels of the second partition
+
+    Returns:
+        np.ndarray: labels of the refined partition, labels are 0, 1, ..., n_pieces-1
+        int: number of pieces of the refined partition
+    """
+    label_pairs: np.ndarray = labels.astype(np.int64) * (other_labels.max() + 1) + other_labels
+    unique_pairs, new_labels = np.unique(label_pairs, return_inverse=True)
+    return new_labels, len(unique_pairs)
+
+def labels_to_pieces(labels: np.ndarray) -> list[set[int]]:
+    """
+    Convert a label array to a list of pieces.
+
+    Args:
+        labels (np.ndarray): piece label of each point
+
+    Returns:
+        list[set[int]]: list of pieces as sets of point indices, sorted by their smallest point
+    """
+    sorted_points: np.ndarray = np.argsort(labels, kind="stable")
+    split_indices: np.ndarray = np.flatnonzero(np.diff(labels[sorted_points])) + 1
+    pieces: list[set[int]] = [set(piece.tolist()) for piece in np.split(sorted_points, split_indices) if len(piece) > 0]
+    pieces.sort(key=min)
+    return pieces
+
+def _skip_inverse_moves(
+        moves: dict[str, list[list[int]]],
+        inverse_dict: dict[str, str] = None,
+    ) -> dict[str, list[list[int]]]:
+    """
+    Remove every move whose inverse is an earlier move in `moves`.
+    """
+    if not inverse_dict:
+        return moves
+    calculated_moves: set[str] = set()
+    filtered_moves: dict[str, list[list[int]]] = dict()
+    for move_name, cycles in moves.items():
+        if move_name in inverse_dict and inverse_dict[move_name] in calculated_moves:
+            continue
+        calculated_moves.add(move_name)
+        filtered_moves[move_name] = cycles
+    return filtered_moves
+
 def get_piece_template(moves, n_points, inverse_dict=None):
     """
     calculate all puzzle pieces necessary to perform each move at least once.
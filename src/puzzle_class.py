@@ -4,8 +4,6 @@ a class for storing information about twisty puzzles and performing various task
 # import standard library modules
 import cProfile
 from copy import deepcopy
-import json
-import os
 import pstats
 import time
 
@@ -14,7 +12,6 @@ import numpy as np
 import matplotlib.pyplot as plt
 # from sympy.combinatorics.perm_groups import PermutationGroup
 import vpython as vpy
-from sympy import factorint
 from sympy.combinatorics import Permutation
 
 # import custom modules
@@ -24,10 +21,8 @@ from .ggb_import.ggb_to_vpy import draw_points, get_point_dicts
 
 from .interaction_modules.colored_text import colored_text as colored
 from .interaction_modules.save_to_xml import save_to_xml
-from .interaction_modules.load_from_xml import load_puzzle
 
-from .puzzle_analysis_modules.size_analysis import get_state_space_size, approx_int
-from .puzzle_analysis_modules.piece_detection_v2 import detect_pieces
+from .puzzle_model import Puzzle_Model
 from .puzzle_analysis_modules.state_validation import State_Validator, gen_puzzle_group
 
 from .vpython_modules.vpy_functions import create_canvas, next_color, bind_next_color
@@ -50,10 +45,36 @@ from .ai_modules.nn_solver_interface import NN_Solver
 # from .ai_modules.nn_v_her_puzzle_class import Puzzle_NN_V_HER_AI
 
 
+def _model_attribute(name):
+    """
+    property that reads and writes the attribute [name] of the puzzle's model (`self.model`)
+    """
+    return property(
+        lambda self: getattr(self.model, name),
+        lambda self, value: setattr(self.model, name, value))
+
 
 class Twisty_Puzzle():
-    def __init__(self):
-        self.PUZZLE_NAME = None
+    """
+    vpython view of a twisty puzzle. All puzzle data that is independent of the visualization
+    (name, moves, pieces, state space size, ...) is stored in the headless `Puzzle_Model` `self.model`.
+    """
+    PUZZLE_NAME = _model_attribute("PUZZLE_NAME")
+    moves = _model_attribute("moves") # dictionary containing all moves for the puzzle
+    base_moves = _model_attribute("base_moves")
+    moves_changed = _model_attribute("moves_changed")
+    alg_to_moves = _model_attribute("alg_to_moves")
+    state_space_size = _model_attribute("state_space_size")
+    pieces = _model_attribute("pieces")
+    analysis_cache = _model_attribute("analysis_cache")
+
+    def __init__(self, model: Puzzle_Model = None):
+        """
+        inputs:
+        -------
+            model - (Puzzle_Model) - the puzzle to show. If None, start with an empty puzzle.
+        """
+        self.model: Puzzle_Model = Puzzle_Model() if model is None else model
 
         self.POINT_POSITIONS = [] # list of vpython vectors - correct position of 3d points
         self.SOLVED_STATE = [] # list of vpython vectors - correct colors of 3d points
@@ -64,9 +85,9 @@ class Twisty_Puzzle():
         self.max_animation_time: float = 120 # maximum time for a sequence of moves (move_v, move_nn etc.)
         self.alg_anim_style: str = "moves" # animation style for algorithm moves. will be either "moves" or "shortened"
         self.canvas = None
-        self.moves = dict() # dcitionary containing all moves for the puzzle
         self.movecreator_mode = False
-        self.moves_changed = False
+        if self.model.n_points > 0:
+            self._draw_model()
 
 
     def validate_state(self):
@@ -551,50 +572,32 @@ but was of type '{type(shape_str)}'")
             puzzle_name - (str) - name of the puzzle
                 must not include spaces or other invalid characters for filenames
         """
-        self.POINT_INFO_DICTS, self.moves, state_space_size = load_puzzle(puzzle_name)
-        self.base_moves = {name: cycles for name, cycles in self.moves.items() if not name[:4] in ("rot_", "alg_")}
+        self.model.load_puzzle(puzzle_name)
         self.canvas = create_canvas()
+        self._draw_model()
+        self.model.print_summary()
+
+
+    def _draw_model(self):
+        """
+        draw the points of `self.model` and set all visualization variables accordingly
+        """
+        self.POINT_INFO_DICTS = [
+            {"coords":vpy.vec(*coords), "vpy_color":vpy.vec(*color), "size":size}
+            for coords, color, size in zip(
+                self.model.point_coordinates.tolist(),
+                self.model.point_colors.tolist(),
+                self.model.point_sizes.tolist())]
+        if self.canvas is None:
+            self.canvas = create_canvas()
         self.vpy_objects = draw_points(self.POINT_INFO_DICTS)
 
         self.POINT_POSITIONS = [point["coords"] for point in self.POINT_INFO_DICTS]
         self.SOLVED_STATE = [point["vpy_color"] for point in self.POINT_INFO_DICTS]
         self.COM = get_com(self.vpy_objects)
-        self.PUZZLE_NAME = puzzle_name
-        # load or calculate the state space size
-        if state_space_size == None:
-            self.state_space_size = get_state_space_size(
-                    self.moves.values(), len(self.SOLVED_STATE))
-        else:
-            self.state_space_size = state_space_size
-
-        # try to load algorithm moves if applicable
-        for move in self.moves:
-            if move.startswith("alg_"):
-                # load algorithm moves from `algorithm_moves.json`
-                try:
-                    alg_moves_filepath = os.path.join("src", "puzzles", self.PUZZLE_NAME, "algorithm_moves.json")
-                    with open(alg_moves_filepath, "r") as file:
-                        self.alg_to_moves: dict[str, str] = json.load(file)
-                    print(f"Loaded algorithm moves from {alg_moves_filepath}")
-                    break
-                except FileNotFoundError as exception:
-                    print(exception)
-                    print("No algorithm moves file found.")
-                    self.alg_to_moves: dict[str, str] = dict()
-                    self.alg_anim_style: str = "shortened"
-        else:
-            self.alg_to_moves: dict[str, str] = dict()
+        if not self.alg_to_moves:
             self.alg_anim_style: str = "shortened"
 
-        print(f"The loaded puzzle has {approx_int(self.state_space_size)} possible states and {len(self.moves)} availiable moves.")
-        print(f"Exact number of states: {self.state_space_size}")
-        print(f"prime factors: {factorint(self.state_space_size)}")
-        # calculate the number of pieces in the puzzle
-        if len(self.moves) > 0:
-            self.pieces = detect_pieces(self.moves, len(self.SOLVED_STATE))
-            print(f"The loaded puzzle has {len(self.pieces)} pieces:\n", *self.pieces)
-        self.moves_changed = False
-
 
     def import_puzzle(self, filepath):
         """
@@ -622,6 +625,10 @@ but was of type '{type(shape_str)}'")
 
         self.POINT_POSITIONS = [point["coords"] for point in self.POINT_INFO_DICTS]
         self.SOLVED_STATE = [point["vpy_color"] for point in self.POINT_INFO_DICTS]
+        self.model.set_points(
+            [vpy_vec_to_tuple(point["coords"]) for point in self.POINT_INFO_DICTS],
+            [vpy_vec_to_tuple(point["vpy_color"]) for point in self.POINT_INFO_DICTS],
+            [point["size"] for point in self.POINT_INFO_DICTS])
         self.moves_changed = False
 
 
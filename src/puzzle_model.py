@@ -0,0 +1,228 @@
+"""
+This module implements a headless model of a twisty puzzle: point coordinates, colors and sizes as numpy arrays, the solved state as color indices, moves and pieces.
+
+`Puzzle_Model` does not use vpython, so training, analysis and batch tools can load puzzles without starting the vpython server. The interactive `Twisty_Puzzle` is a view of a `Puzzle_Model` that adds the 3D animation. Expensive analysis results (state space size, pieces) are calculated on first access and cached in the puzzle's `Puzzle_Analysis_Cache`.
+
+Author: Sebastian Jost
+"""
+import json
+import os
+
+import numpy as np
+
+from .interaction_modules.compiled_puzzle import load_compiled_puzzle, get_puzzle_definition_paths
+from .interaction_modules.save_to_xml import save_to_xml
+from .puzzle_analysis_modules.analysis_cache import Puzzle_Analysis_Cache
+from .puzzle_analysis_modules.size_analysis import approx_int
+
+
+class Puzzle_Model():
+    """
+    Headless model of a twisty puzzle.
+
+    Args:
+        puzzle_name (str, optional): name of the puzzle or path of its `puzzle_definition.xml`. Defaults to None (empty puzzle).
+    """
+    def __init__(self, puzzle_name: str | None = None):
+        self.PUZZLE_NAME: str | None = None
+        self.point_coordinates: np.ndarray = np.zeros((0, 3)) # (n_points, 3) - correct position of 3d points
+        self._point_colors: np.ndarray = np.zeros((0, 3)) # (n_points, 3) - correct colors (r, g, b) of 3d points
+        self._solved_state: list[int] | None = None
+        self._color_list: list[tuple[float, float, float]] | None = None
+        self.point_sizes: np.ndarray = np.zeros(0) # (n_points,) - sizes of the points
+        self.moves: dict[str, list[list[int]]] = dict() # dictionary containing all moves for the puzzle
+        self.base_moves: dict[str, list[list[int]]] = dict() # moves that are neither rotations nor algorithms
+        self.alg_to_moves: dict[str, str] = dict() # algorithm moves -> move sequences
+        self.moves_changed: bool = False
+        self.analysis_cache: Puzzle_Analysis_Cache | None = None
+        self._state_space_size: int | None = None
+        self._pieces: list[set[int]] | None = None
+        if puzzle_name is not None:
+            self.load_puzzle(puzzle_name)
+
+    @property
+    def n_points(self) -> int:
+        return len(self.point_coordinates)
+
+    @property
+    def point_colors(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: (n_points, 3) array of the correct colors (r, g, b) of the points
+        """
+        return self._point_colors
+
+    @point_colors.setter
+    def point_colors(self, point_colors: np.ndarray):
+        self._point_colors = point_colors
+        self._solved_state = None
+        self._color_list = None
+
+    @property
+    def color_list(self) -> list[tuple[float, float, float]]:
+        """
+        Returns:
+            list[tuple[float, float, float]]: all colors of the puzzle in order of their first occurrence. The index of a color is its representation in `SOLVED_STATE`.
+        """
+        if self._color_list is None:
+            self._calculate_solved_state()
+        return self._color_list
+
+    @property
+    def SOLVED_STATE(self) -> list[int]:
+        """
+        Returns:
+            list[int]: solved state of the puzzle as list of color indices (see `color_list`), same as `state_for_ai` of the point colors. Calculated once per set of point colors.
+        """
+        if self._solved_state is None:
+            self._calculate_solved_state()
+        return self._solved_state
+
+    @property
+    def POINT_INFO_DICTS(self) -> list[dict[str, tuple[float, float, float] | float]]:
+        """
+        Returns:
+            list[dict]: dictionaries describing the points with keys 'coords', 'vpy_color' (r, g, b) and 'size', as used by `save_to_xml`
+        """
+        return [
+            {"coords": tuple(coords), "vpy_color": tuple(color), "size": size}
+            for coords, color, size in zip(
+                self.point_coordinates.tolist(),
+                self.point_colors.tolist(),
+                self.point_sizes.tolist())]
+
+    @property
+    def state_space_size(self) -> int:
+        """
+        Returns:
+            int: number of reachable states of the puzzle. Calculated on first access if it is not defined in the puzzle definition.
+        """
+        if self._state_space_size is None:
+            if self.analysis_cache is not None:
+                self._state_space_size = self.analysis_cache.get_state_space_size(self.moves, self.n_points)
+            else:
+                from .puzzle_analysis_modules.size_analysis import get_state_space_size
+                self._state_space_size = get_state_space_size(self.moves.values(), self.n_points)
+        return self._state_space_size
+
+    @state_space_size.setter
+    def state_space_size(self, state_space_size: int):
+        self._state_space_size = state_space_size
+
+    @property
+    def pieces(self) -> list[set[int]]:
+        """
+        Returns:
+            list[set[int]]: pieces of the puzzle (see `detect_pieces`). Calculated on first access.
+        """
+        if self._pieces is None:
+            if self.analysis_cache is not None:
+                self._pieces = self.analysis_cache.get_pieces(self.moves, self.n_points)
+            else:
+                from .puzzle_analysis_modules.piece_detection_v2 import detect_pieces
+                self._pieces = detect_pieces(self.moves, self.n_points)
+        return self._pieces
+
+    @pieces.setter
+    def pieces(self, pieces: list[set[int]]):
+        self._pieces = pieces
+
+    def load_puzzle(self, puzzle_name: str):
+        """
+        Load the given puzzle from its definition file.
+
+        Args:
+            puzzle_name (str): name of the puzzle or path of its `puzzle_definition.xml`
+        """
+        puzzle_data: dict = load_compiled_puzzle(puzzle_name)
+        self.point_coordinates = puzzle_data["coords"]
+        self.point_colors = puzzle_data["colors"]
+        self.point_sizes = puzzle_data["sizes"]
+        self.set_moves(puzzle_data["moves"])
+        self.PUZZLE_NAME = puzzle_name
+        # cached analysis results, recalculated whenever the puzzle definition changes
+        self.analysis_cache = Puzzle_Analysis_Cache(puzzle_name)
+        self._state_space_size = puzzle_data["state_space_size"]
+        self.alg_to_moves = self._load_algorithm_moves()
+        self.moves_changed = False
+
+    def set_points(self, point_coordinates: np.ndarray, point_colors: np.ndarray, point_sizes: np.ndarray):
+        """
+        Replace all points of the puzzle.
+
+        Args:
+            point_coordinates (np.ndarray): (n_points, 3) array of point coordinates
+            point_colors (np.ndarray): (n_points, 3) array of point colors (r, g, b)
+            point_sizes (np.ndarray): (n_points,) array of point sizes
+        """
+        self.point_coordinates = np.asarray(point_coordinates, dtype=float).reshape(-1, 3)
+        self.point_colors = np.asarray(point_colors, dtype=float).reshape(-1, 3)
+        self.point_sizes = np.asarray(point_sizes, dtype=float).reshape(-1)
+        self._pieces = None
+
+    def set_moves(self, moves: dict[str, list[list[int]]]):
+        """
+        Replace all moves of the puzzle.
+        """
+        self.moves = moves
+        self.base_moves = {name: cycles for name, cycles in self.moves.items() if not name[:4] in ("rot_", "alg_")}
+        self._state_space_size = None
+        self._pieces = None
+
+    def save_puzzle(self, puzzle_name: str):
+        """
+        Save the puzzle under the given name. If `puzzle_name` is empty, save it as `self.PUZZLE_NAME`.
+
+        Args:
+            puzzle_name (str): name of the puzzle. Must not include spaces or other invalid characters for filenames.
+        """
+        if puzzle_name != '':
+            self.PUZZLE_NAME = puzzle_name
+        save_to_xml(self)
+
+    def print_summary(self):
+        """
+        Print the number of states, prime factors of the state space size and pieces of the puzzle.
+        """
+        print(f"The loaded puzzle has {approx_int(self.state_space_size)} possible states and {len(self.moves)} availiable moves.")
+        print(f"Exact number of states: {self.state_space_size}")
+        if self.analysis_cache is not None:
+            print(f"prime factors: {self.analysis_cache.get_state_space_factorization(self.state_space_size)}")
+        # calculate the number of pieces in the puzzle
+        if len(self.moves) > 0:
+            print(f"The loaded puzzle has {len(self.pieces)} pieces:\n", *self.pieces)
+
+    def _calculate_solved_state(self):
+        """
+        Calculate the solved state as color indices and the list of colors from the point colors.
+        """
+        if len(self.point_colors) == 0:
+            self._solved_state, self._color_list = [], []
+            return
+        colors, first_indices, color_indices = np.unique(self.point_colors, axis=0, return_index=True, return_inverse=True)
+        # renumber colors by their first occurrence
+        color_order: np.ndarray = np.argsort(first_indices)
+        color_ranks: np.ndarray = np.argsort(color_order)
+        self._solved_state = color_ranks[color_indices.reshape(-1)].tolist()
+        self._color_list = [tuple(color) for color in colors[color_order].tolist()]
+
+    def _load_algorithm_moves(self) -> dict[str, str]:
+        """
+        Load the move sequences of algorithm moves from `algorithm_moves.json` next to the puzzle definition if the puzzle has algorithm moves.
+
+        Returns:
+            dict[str, str]: dictionary mapping algorithm names to their move sequences. Empty if the puzzle has no algorithm moves or the file does not exist.
+        """
+        if not any(move.startswith("alg_") for move in self.moves):
+            return dict()
+        definition_path, _ = get_puzzle_definition_paths(self.PUZZLE_NAME)
+        alg_moves_filepath: str = os.path.join(os.path.dirname(definition_path), "algorithm_moves.json")
+        try:
+            with open(alg_moves_filepath, "r") as file:
+                alg_to_moves: dict[str, str] = json.load(file)
+        except FileNotFoundError as exception:
+            print(exception)
+            print("No algorithm moves file found.")
+            return dict()
+        print(f"Loaded algorithm moves from {alg_moves_filepath}")
+        return alg_to_moves
@@ -2,14 +2,18 @@
 implementation of an A* algorithm for solving a given twisty puzzle
 """
 import time
+import heapq
+from itertools import count
 
 import numpy as np
-from sortedcontainers import SortedDict
 
 from .ai_modules.twisty_puzzle_model import perform_action
 from .ai_modules.q_puzzle_class import Puzzle_Q_AI
 from .ai_modules.v_puzzle_class import Puzzle_V_AI
-from .ai_modules.greedy_solver import Greedy_Puzzle_Solver
+from .ai_modules.greedy_solver import Greedy_Puzzle_Solver, get_symmetric_solvable_states
+from .ai_modules.permutation_engine import Permutation_Engine, invert_index_array
+from .ai_modules.move_algebra import Move_Algebra, START_STATE
+from .ai_modules.state_table import State_Encoder, Hashed_State_Table, KEY_DTYPE, first_occurrences, hash_packed_states
 # from .ai_modules.nn_puzzle_class import Puzzle_Network
 
 def solve_puzzle(
@@ -18,142 +22,554 @@ def solve_puzzle(
         SOLVED_STATE: list[int],
         ai_class: Puzzle_Q_AI | Puzzle_V_AI | Greedy_Puzzle_Solver,
         max_time: float = 60,
-        WEIGHT: float = 0.1):
+        WEIGHT: float = 0.1,
+        batch_size: int = 1,
+        mode: str = "a_star",
+        max_nodes: int = None):
     """
-    The the puzzle starting from [start_state] and find a sequence of actions that leads to the solved state. This uses a weighted A* search algorithm where the distance-to-goal heuristic is determined by the given ai_class.
+    The the puzzle starting from [start_state] and find a sequence of actions that leads to the solved state. By default, this uses a weighted A* search algorithm where the distance-to-goal heuristic is determined by the given ai_class.
     
     inputs:
     -------
         start_state - (list) - scrambled state of the puzzle, that shall be solved
         ACTIONS_DICT - (dict) - dictionary containing all availiable moves for the puzzle
         SOLVED_STATE - (list) - solved state representation as for the Q-Learning
-        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Puzzle_Network) - an instance of the Q/V-learning puzzle class or the puzzle network class
+        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Greedy_Puzzle_Solver) or (NN_Solver) - an instance of the Q/V-learning puzzle class, the greedy solver or the neural network solver
             this determines what is used for the solving process
             the Q/V-table or neural network should already be loaded.
         max_time - (float) - maximum time (in seconds) allowed for finding the solution
         WEIGHT - (float) - weight for weighted A* search. 1 for normal A*
+        batch_size - (int) - number of nodes expanded at once. The children of all these nodes are evaluated with a single call of `ai_class.get_state_values`.
+            Larger values speed up neural network heuristics but expand some nodes that A* would not have expanded yet.
+        mode - (str) - search algorithm to use:
+            "a_star" - weighted A* search using the heuristic of `ai_class`
+            "bidirectional" - bidirectional breadth-first search (see `solve_puzzle_bidirectional`). `ai_class` is not used.
+            "ida_star" - iterative deepening A* search with constant memory (see `solve_puzzle_ida_star`). `WEIGHT` and `batch_size` are not used.
+        max_nodes - (int) - maximum number of nodes expanded by the IDA* search. None for no limit.
 
     returns:
     --------
         - list/tuple/str of moves chosen to solve the puzzle
     """
-    # def _get_key(key):
-    #     """
-    #     helper function for max() to get the best action from open_states
-    #     """
-    #     return open_states[key][0]
-    def seq_length_from_key(key):
-        return len(key[1])
-
+    if mode == "bidirectional":
+        return solve_puzzle_bidirectional(start_state, ACTIONS_DICT, SOLVED_STATE, max_time=max_time)
+    if mode == "ida_star":
+        return solve_puzzle_ida_star(start_state, ACTIONS_DICT, SOLVED_STATE, ai_class, max_time=max_time, max_nodes=max_nodes)
+    if mode != "a_star":
+        raise ValueError(f"Unknown search mode '{mode}'. Use 'a_star', 'bidirectional' or 'ida_star'.")
     end_time = time.time() + max_time
 
-    # open_states = {():(0, start_state)} # init starting state with value 0, no actions taken so far
-    open_states = SortedDict({(0,()):tuple(start_state)})
-    # open_states = SortedDict({(0, ): start_state})
-    closed_states = dict()
-
+    permutation_engine = Permutation_Engine(ACTIONS_DICT, len(SOLVED_STATE))
+    move_algebra = Move_Algebra(permutation_engine.move_arrays, permutation_engine.move_names)
+    n_colors = max(max(SOLVED_STATE), max(start_state)) + 1
+    frontier = A_Star_Frontier(start_state, n_colors)
 
     while time.time() < end_time:
-        # best_action_seq = max(open_states, key=_get_key)
-        # best_action_seq = open_states.peekitem(index=-1)
-        # value, puzzle_state = open_states[best_action_seq]
-        solution_sequence = expand_node(#best_action_seq,
-                                        open_states,
-                                        closed_states,
-                                        ACTIONS_DICT,
+        solution_sequence = expand_node(frontier,
+                                        permutation_engine,
+                                        move_algebra,
                                         SOLVED_STATE,
                                         ai_class,
-                                        WEIGHT=WEIGHT)
+                                        WEIGHT=WEIGHT,
+                                        batch_size=batch_size)
         if solution_sequence is not None:
-            print(f"Searched {len(closed_states) + len(open_states)} state-action pairs to find a solution.")
-            print(f"Maximum search depth was {max([seq_length_from_key(key) for key in open_states.keys()])} moves.")
+            print(f"Searched {frontier.n_nodes} states to find a solution.")
+            print(f"Maximum search depth was {frontier.max_depth()} moves.")
             return " ".join(solution_sequence)
-    print(f"Searched {len(closed_states) + len(open_states)} state-action pairs but found no solution.")
-    print(f"Maximum search depth was {max([seq_length_from_key(key) for key in open_states.keys()])} moves.")
+    print(f"Searched {frontier.n_nodes} states but found no solution.")
+    print(f"Maximum search depth was {frontier.max_depth()} moves.")
     return ""
 
 
-def expand_node(#action_seq,
-                open_states,
-                closed_states,
-                ACTIONS_DICT,
+def expand_node(frontier,
+                permutation_engine,
+                move_algebra,
                 SOLVED_STATE,
                 ai_class,
-                WEIGHT=0.1):
+                WEIGHT=0.1,
+                batch_size=1):
     """
-    for all possible actions in [ACTIONS_DICT], add the action to [action_seq] and add that to open_states, unless the state resulting from that action was already visited and had a better value than it has now.
+    pop the best [batch_size] nodes from the frontier. Apply all actions allowed by the move automaton to their states at once and evaluate all resulting states with a single batched call of the heuristic. Add the resulting states to the frontier, unless they were already reached with a better value.
 
     inputs:
     -------
-        action_seq - (tuple) - 
-        open_states - (dict) - 
-        closed_states - (dict) - 
-        ACTIONS_DICT - (dict) - 
-        SOLVED_STATE - (list) - 
-        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Puzzle_Network) - an instance of the Q/V-learning puzzle class or the puzzle network class
+        frontier - (A_Star_Frontier) - all nodes of the search
+        permutation_engine - (Permutation_Engine) - all availiable moves of the puzzle compiled to index arrays
+        move_algebra - (Move_Algebra) - move algebra of the puzzle. Its automaton determines which moves are applied to each node.
+        SOLVED_STATE - (list) - the solved state
+        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Greedy_Puzzle_Solver) or (NN_Solver) - an instance of the Q/V-learning puzzle class, the greedy solver or the neural network solver
             this determines what is used for the solving process
             the Q/V-table or neural network should already be loaded.
         WEIGHT - (float) - weight factor in [0,1] for weighted A*. 
             default value .1
+        batch_size - (int) - maximum number of nodes expanded at once
 
     returns:
     --------
         None if no solution was found,
         (tuple) action_key sequence of the solution if it was found.
     """
-    (prev_value, action_seq), prev_state = open_states.popitem(index=0)
-    # prev_value, prev_state = open_states.pop(action_seq)
-    for action_key, action_cycles in ACTIONS_DICT.items():
-        puzzle_state = list(prev_state)
-        perform_action(puzzle_state, action_cycles)
-        new_action_seq = action_seq + (action_key,)
-        if puzzle_state == SOLVED_STATE:
-            return new_action_seq
-        # start_time = time.perf_counter()
-        value = -get_a_star_eval(prev_value, puzzle_state, ai_class, WEIGHT=WEIGHT)
-        # end_time = time.perf_counter()
-        # print(f"evaluation of state took {(end_time-start_time)*1000:5} ms.")
-
-        state_tuple = tuple(puzzle_state)
-        if not state_tuple in closed_states:
-            # state was not seen before -> explore
-            open_states[(value, new_action_seq)] = state_tuple
+    node_ids = frontier.pop_many(batch_size)
+    if len(node_ids) == 0:
+        return None
+    # all allowed children of all expanded nodes with shape (n_children, n_points)
+    parent_indices, moves = np.nonzero(move_algebra.successor_mask[frontier.automaton_states[node_ids]])
+    parents = node_ids[parent_indices]
+    child_states = np.take_along_axis(frontier.states[parents], permutation_engine.move_arrays[moves], axis=1)
+    automaton_states = move_algebra.transitions[frontier.automaton_states[parents], moves]
+    solved = np.flatnonzero(np.all(child_states == np.array(SOLVED_STATE), axis=-1))
+    if len(solved) > 0:
+        solution = frontier.get_move_sequence(parents[solved[0]]) + [moves[solved[0]]]
+        return tuple(permutation_engine.move_names[move] for move in solution)
+    # start_time = time.perf_counter()
+    values = -get_a_star_eval(frontier.values[parents], child_states, ai_class, WEIGHT=WEIGHT)
+    # end_time = time.perf_counter()
+    # print(f"evaluation of {len(values)} states took {(end_time-start_time)*1000:5} ms.")
+    frontier.push_many(child_states, parents, moves, values, automaton_states)
+
+
+def solve_puzzle_bidirectional(
+        start_state: list[int],
+        ACTIONS_DICT: dict[str, list[list[int]]],
+        SOLVED_STATE: list[int],
+        max_time: float = 60,
+        chunk_size: int = 4096):
+    """
+    Solve the puzzle with a bidirectional breadth-first search: a forward search starts at [start_state], a backward search applies the inverse moves starting at the solved state and its rotated variants (see `get_symmetric_solvable_states`). The smaller frontier is expanded by one layer at a time until the two searches meet. For a solution of length d, both searches only need to reach depth d/2.
+    Solutions ending in a rotated variant of the solved state solve the puzzle up to a rotation of the whole puzzle. The solutions have the minimal number of moves up to one move.
+
+    inputs:
+    -------
+        start_state - (list) - scrambled state of the puzzle, that shall be solved
+        ACTIONS_DICT - (dict) - dictionary containing all availiable moves for the puzzle
+        SOLVED_STATE - (list) - solved state representation as for the Q-Learning
+        max_time - (float) - maximum time (in seconds) allowed for finding the solution
+        chunk_size - (int) - number of nodes expanded at once
+
+    returns:
+    --------
+        - (str) of moves chosen to solve the puzzle. Empty if no solution was found.
+    """
+    end_time = time.time() + max_time
+    permutation_engine = Permutation_Engine(ACTIONS_DICT, len(SOLVED_STATE))
+    inverse_move_arrays = np.array([invert_index_array(move_array) for move_array in permutation_engine.move_arrays])
+    forward_move_algebra = Move_Algebra(permutation_engine.move_arrays)
+    backward_move_algebra = Move_Algebra(inverse_move_arrays)
+    solved_states = get_symmetric_solvable_states(SOLVED_STATE, ACTIONS_DICT)
+    n_colors = max(max(SOLVED_STATE), max(start_state)) + 1
+    forward = Breadth_First_Frontier([start_state], n_colors)
+    backward = Breadth_First_Frontier(solved_states, n_colors)
+
+    meeting = _find_meeting_nodes(forward, backward, np.array([0]))
+    while meeting is None and time.time() < end_time:
+        # expand the frontier with the smaller current layer
+        if len(forward.layer) <= len(backward.layer):
+            expanded, other, move_arrays, move_algebra = forward, backward, permutation_engine.move_arrays, forward_move_algebra
         else:
-            if value < closed_states[state_tuple]:
-                # found better path to a state visited before.
-                # delete from closed_states and add to open_states
-                del(closed_states[state_tuple])
-                open_states[(value, new_action_seq)] = state_tuple
-                # open_states[new_action_seq] = (value, puzzle_state)
-        closed_states[tuple(prev_state)] = prev_value
+            expanded, other, move_arrays, move_algebra = backward, forward, inverse_move_arrays, backward_move_algebra
+        if len(expanded.layer) == 0: # all reachable states were visited
+            break
+        layer = expanded.layer
+        expanded.start_layer()
+        for chunk_start in range(0, len(layer), chunk_size):
+            new_node_ids = expanded.expand(layer[chunk_start:chunk_start+chunk_size], move_arrays, move_algebra)
+            meeting = _find_meeting_nodes(expanded, other, new_node_ids)
+            if meeting is not None:
+                if expanded is backward:
+                    meeting = meeting[::-1]
+                break
+            if time.time() >= end_time:
+                break
+    print(f"Searched {forward.n_nodes} states forward and {backward.n_nodes} states backward.")
+    if meeting is None:
+        print("Found no solution.")
+        return ""
+    forward_node, backward_node = meeting
+    # the backward search applied inverse moves starting at the solved state
+    solution = forward.get_move_sequence(forward_node) + backward.get_move_sequence(backward_node)[::-1]
+    return " ".join(permutation_engine.move_names[move] for move in solution)
 
 
-def get_a_star_eval(prev_value, prev_state, ai_class, WEIGHT=0.1):
+def _find_meeting_nodes(frontier, other_frontier, node_ids):
     """
-    evaluate the current sequence of actions according to the usual formula of weighted A*:
+    Check whether any of the given nodes of `frontier` has a state that `other_frontier` has visited.
+
+    returns:
+    --------
+        None if the searches did not meet,
+        (tuple) of (int) - id of the meeting node in `frontier` and `other_frontier`. The meeting node with the lowest depth in `other_frontier` is chosen.
+    """
+    other_node_ids = other_frontier.node_ids.get_many(frontier.states[node_ids], default=-1)
+    met = np.flatnonzero(other_node_ids >= 0)
+    if len(met) == 0:
+        return None
+    best = met[np.argmin(other_frontier.depths[other_node_ids[met]])]
+    return int(node_ids[best]), int(other_node_ids[best])
+
+
+def solve_puzzle_ida_star(
+        start_state: list[int],
+        ACTIONS_DICT: dict[str, list[list[int]]],
+        SOLVED_STATE: list[int],
+        ai_class,
+        max_time: float = 60,
+        max_nodes: int = None,
+        table_size: int = 1 << 20):
+    """
+    Solve the puzzle with an iterative deepening A* search. Each iteration is a depth-first search that cuts off all nodes with
+        f(s) = g(s) + h(s) > bound,
+    where g(s) is the number of moves leading to s and h(s) = -ai_class.get_state_value(s). The next iteration uses the lowest f(s) that was cut off as bound.
+    If h never overestimates the number of moves needed (e.g. `Pattern_Database_Solver`), the solution is optimal. Other heuristics still find solutions, but not necessarily optimal ones.
+
+    Memory does not grow with the search: only the current path and the unexpanded siblings along it are stored, plus a transposition table of fixed size that prunes states already reached with fewer moves in the current iteration. Redundant move sequences like moves undoing previous moves and non-canonical orders of commuting moves are never applied (see `Move_Algebra`).
+
+    inputs:
+    -------
+        start_state - (list) - scrambled state of the puzzle, that shall be solved
+        ACTIONS_DICT - (dict) - dictionary containing all availiable moves for the puzzle
+        SOLVED_STATE - (list) - solved state representation as for the Q-Learning
+        ai_class - any puzzle solver implementing `get_state_values`. Higher values must be better.
+        max_time - (float) - maximum time (in seconds) allowed for finding the solution
+        max_nodes - (int) - maximum number of nodes expanded in all iterations. None for no limit.
+        table_size - (int) - number of slots of the transposition table
+
+    returns:
+    --------
+        - (str) of moves chosen to solve the puzzle. Empty if no solution was found.
+    """
+    end_time = time.time() + max_time
+    permutation_engine = Permutation_Engine(ACTIONS_DICT, len(SOLVED_STATE))
+    move_arrays = permutation_engine.move_arrays
+    move_algebra = Move_Algebra(move_arrays, permutation_engine.move_names)
+    n_colors = max(max(SOLVED_STATE), max(start_state)) + 1
+    transposition_table = Transposition_Table(len(SOLVED_STATE), n_colors, size=table_size)
+    solved_state = np.array(SOLVED_STATE)
+    root = np.array(start_state)
+    if np.array_equal(root, solved_state):
+        return ""
+
+    bound = -float(ai_class.get_state_values(root[None])[0])
+    n_expanded = 0
+    out_of_budget = False
+    while not out_of_budget:
+        transposition_table.start_iteration()
+        next_bound = np.inf
+        # stack of nodes that were not expanded yet: (state, depth, index of the move leading to it, automaton state)
+        stack = [(root, 0, -1, START_STATE)]
+        path = []
+        while stack:
+            if time.time() >= end_time or (max_nodes is not None and n_expanded >= max_nodes):
+                out_of_budget = True
+                break
+            state, depth, move, automaton_state = stack.pop()
+            del path[max(0, depth-1):]
+            if depth > 0:
+                path.append(move)
+            n_expanded += 1
+            moves = move_algebra.get_allowed_moves(automaton_state)
+            children = state[move_arrays[moves]]
+            solved = np.flatnonzero(np.all(children == solved_state, axis=-1))
+            if len(solved) > 0:
+                print(f"Searched {n_expanded} states in {transposition_table.iteration} iterations to find a solution.")
+                return " ".join(permutation_engine.move_names[move] for move in path + [moves[solved[0]]])
+            unvisited = transposition_table.insert_many(children, depth + 1)
+            children, moves = children[unvisited], moves[unvisited]
+            if len(children) == 0:
+                continue
+            costs = depth + 1 - ai_class.get_state_values(children)
+            within_bound = costs <= bound
+            if not within_bound.all():
+                next_bound = min(next_bound, float(costs[~within_bound].min()))
+            # push the most promising children last, so they are expanded first
+            order = np.argsort(-costs[within_bound], kind="stable")
+            for child, child_move in zip(children[within_bound][order], moves[within_bound][order].tolist()):
+                stack.append((child, depth + 1, child_move, int(move_algebra.transitions[automaton_state, child_move])))
+        if next_bound == np.inf: # the whole search tree was searched
+            break
+        bound = next_bound
+    print(f"Searched {n_expanded} states in {transposition_table.iteration} iterations but found no solution.")
+    return ""
+
+
+class Transposition_Table():
+    """
+    Fixed-size hash table storing the lowest depth at which each state was reached in the current iteration of a depth-first search. Each state can only be stored in one slot. If two states collide, the one reached with fewer moves is kept (replace-by-depth), since its subtree is larger.
+
+    Args:
+        n_points (int): number of points of the puzzle
+        n_colors (int): number of different colors in the states
+        size (int, optional): number of slots. Rounded up to a power of two. Defaults to 2**20.
+    """
+    def __init__(self, n_points: int, n_colors: int, size: int = 1 << 20):
+        self.encoder: State_Encoder = State_Encoder(n_points, n_colors)
+        size = 1 << max(1, (size-1).bit_length())
+        self.keys: np.ndarray = np.zeros((size, self.encoder.n_words), dtype=KEY_DTYPE)
+        self.depths: np.ndarray = np.zeros(size, dtype=np.int32)
+        # iteration in which each slot was written. Entries of older iterations count as empty.
+        self.iterations: np.ndarray = np.zeros(size, dtype=np.int32)
+        self.iteration: int = 0
+
+    def start_iteration(self) -> None:
+        """
+        Start a new iteration. This invalidates all entries in constant time.
+        """
+        self.iteration += 1
+
+    def insert_many(self, states: np.ndarray, depth: int) -> np.ndarray:
+        """
+        Store that the given states were reached with `depth` moves.
+
+        Args:
+            states (np.ndarray): states with shape (n_states, n_points)
+            depth (int): number of moves leading to the states
+
+        Returns:
+            np.ndarray: whether each state was not reached with at most `depth` moves before in this iteration. Only these states need to be searched.
+        """
+        words = self.encoder.encode(states)
+        slots = (hash_packed_states(words) & KEY_DTYPE(len(self.depths) - 1)).astype(np.int64)
+        current = self.iterations[slots] == self.iteration
+        same_state = current & np.all(self.keys[slots] == words, axis=-1)
+        visited = same_state & (self.depths[slots] <= depth)
+        replace = ~visited & (~current | same_state | (self.depths[slots] > depth))
+        self.keys[slots[replace]] = words[replace]
+        self.depths[slots[replace]] = depth
+        self.iterations[slots[replace]] = self.iteration
+        return ~visited
+
+
+class Search_Nodes():
+    """
+    Nodes of a search tree stored in preallocated arrays. Each node stores its state, a pointer to its parent node and the move leading to it, so action sequences are only reconstructed for the solution. Each node also stores the state of the move automaton (see `Move_Algebra`) after the moves leading to it.
+
+    Args:
+        n_points (int): number of points of the puzzle
+        n_colors (int): number of different colors in the states
+        capacity (int, optional): initial number of nodes that can be stored. Defaults to 2**16.
+    """
+    def __init__(self, n_points: int, n_colors: int, capacity: int = 1 << 16):
+        self.states: np.ndarray = np.empty((capacity, n_points), dtype=np.uint8 if n_colors <= 256 else np.uint16)
+        self.parents: np.ndarray = np.empty(capacity, dtype=np.int64)
+        self.moves: np.ndarray = np.empty(capacity, dtype=np.int32)
+        self.depths: np.ndarray = np.empty(capacity, dtype=np.int32)
+        self.automaton_states: np.ndarray = np.empty(capacity, dtype=np.int32)
+        self.n_nodes: int = 0
+
+    def add_nodes(self, states: np.ndarray, parents: np.ndarray, moves: np.ndarray, automaton_states: np.ndarray = START_STATE) -> np.ndarray:
+        """
+        Store new nodes.
+
+        Args:
+            states (np.ndarray): states of the new nodes with shape (n_nodes, n_points)
+            parents (np.ndarray): id of the parent of each node. -1 for root nodes.
+            moves (np.ndarray): index of the move leading from the parent to each node
+            automaton_states (np.ndarray, optional): state of the move automaton of each node. Defaults to the start state.
+
+        Returns:
+            np.ndarray: ids of the new nodes
+        """
+        start = self.n_nodes
+        end = start + len(states)
+        self._reserve(end)
+        self.states[start:end] = states
+        self.parents[start:end] = parents
+        self.moves[start:end] = moves
+        self.depths[start:end] = np.where(parents >= 0, self.depths[np.maximum(parents, 0)] + 1, 0)
+        self.automaton_states[start:end] = automaton_states
+        self.n_nodes = end
+        return np.arange(start, end)
+
+    def get_move_sequence(self, node_id: int) -> list[int]:
+        """
+        Follow the parent pointers from the given node to the root.
+
+        Returns:
+            list[int]: indices of the moves leading from the root to the given node
+        """
+        moves = []
+        while self.parents[node_id] >= 0:
+            moves.append(int(self.moves[node_id]))
+            node_id = self.parents[node_id]
+        return moves[::-1]
+
+    def max_depth(self) -> int:
+        """
+        Returns:
+            int: depth of the deepest node
+        """
+        return int(self.depths[:self.n_nodes].max())
+
+    def _reserve(self, n_nodes: int) -> None:
+        """
+        Double the capacity of the node arrays until `n_nodes` nodes fit.
+        """
+        capacity = len(self.parents)
+        if n_nodes <= capacity:
+            return
+        while capacity < n_nodes:
+            capacity *= 2
+        for name in self._array_names():
+            old_array = getattr(self, name)
+            new_array = np.empty((capacity,) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:self.n_nodes] = old_array[:self.n_nodes]
+            setattr(self, name, new_array)
+
+    def _array_names(self) -> tuple[str, ...]:
+        """
+        Returns:
+            tuple[str, ...]: names of all arrays with one entry per node
+        """
+        return ("states", "parents", "moves", "depths", "automaton_states")
+
+
+class A_Star_Frontier(Search_Nodes):
+    """
+    Nodes of an A* search. Nodes that were not expanded yet are kept in a binary heap of `(value, counter, node_id)`. A compact hash table stores the best value each state was reached with, so that states reached again with a worse value are skipped.
+
+    Args:
+        start_state (list[int]): the state of the root node
+        n_colors (int): number of different colors in the states
+        capacity (int, optional): initial number of nodes that can be stored. Defaults to 2**16.
+    """
+    def __init__(self, start_state: list[int], n_colors: int, capacity: int = 1 << 16):
+        super().__init__(len(start_state), n_colors, capacity=capacity)
+        self.values: np.ndarray = np.empty(capacity, dtype=np.float32)
+        self.heap: list[tuple[float, int, int]] = []
+        self.counter = count()
+        self.best_values: Hashed_State_Table = Hashed_State_Table(len(start_state), n_colors)
+        self.push_many(np.array([start_state]), np.array([-1]), np.array([-1]), np.zeros(1))
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def push_many(self, states: np.ndarray, parents: np.ndarray, moves: np.ndarray, values: np.ndarray, automaton_states: np.ndarray = None) -> None:
+        """
+        Add new nodes to the frontier unless their state was already reached with a lower value.
+
+        Args:
+            states (np.ndarray): states of the new nodes with shape (n_nodes, n_points)
+            parents (np.ndarray): id of the parent of each node. -1 for the root.
+            moves (np.ndarray): index of the move leading from the parent to each node
+            values (np.ndarray): value of each node. Nodes with lower values are expanded first.
+            automaton_states (np.ndarray, optional): state of the move automaton of each node. Defaults to None (start state).
+        """
+        values = np.asarray(values, dtype=np.float32)
+        if automaton_states is None:
+            automaton_states = np.full(len(states), START_STATE)
+        improved = values < self.best_values.get_many(states, default=np.inf)
+        if not improved.any():
+            return
+        states, parents, moves, values, automaton_states = \
+            states[improved], parents[improved], moves[improved], values[improved], automaton_states[improved]
+        self.best_values.set_many(states, values)
+        node_ids = self.add_nodes(states, parents, moves, automaton_states)
+        self.values[node_ids] = values
+        for value, node_id in zip(values.tolist(), node_ids.tolist()):
+            heapq.heappush(self.heap, (value, next(self.counter), node_id))
+
+    def pop_many(self, n_nodes: int) -> np.ndarray:
+        """
+        Remove up to `n_nodes` nodes with the lowest values from the frontier. Nodes whose state was reached with a lower value after they were added are discarded.
+
+        Returns:
+            np.ndarray: ids of the removed nodes
+        """
+        while self.heap:
+            node_ids = np.array([heapq.heappop(self.heap)[2] for _ in range(min(n_nodes, len(self.heap)))])
+            up_to_date = self.values[node_ids] <= self.best_values.get_many(self.states[node_ids], default=np.inf)
+            if up_to_date.any():
+                return node_ids[up_to_date]
+        return np.empty(0, dtype=np.int64)
+
+    def _array_names(self) -> tuple[str, ...]:
+        return super()._array_names() + ("values",)
+
+
+class Breadth_First_Frontier(Search_Nodes):
+    """
+    Nodes of a breadth-first search. Every state is visited at most once; a compact hash table maps visited states to their node id.
+
+    Args:
+        root_states (list[list[int]]): the states of the root nodes
+        n_colors (int): number of different colors in the states
+        capacity (int, optional): initial number of nodes that can be stored. Defaults to 2**16.
+    """
+    def __init__(self, root_states: list[list[int]], n_colors: int, capacity: int = 1 << 16):
+        super().__init__(len(root_states[0]), n_colors, capacity=capacity)
+        self.node_ids: Hashed_State_Table = Hashed_State_Table(len(root_states[0]), n_colors, value_dtype=np.int64)
+        self.layer_start: int = 0
+        n_roots = len(root_states)
+        self._add_unvisited(np.array(root_states), np.full(n_roots, -1), np.full(n_roots, -1))
+
+    @property
+    def layer(self) -> np.ndarray:
+        """
+        ids of the nodes in the current layer, i.e. the nodes that were not expanded yet
+        """
+        return np.arange(self.layer_start, self.n_nodes)
+
+    def start_layer(self) -> None:
+        """
+        Start a new layer. All nodes added afterwards belong to it.
+        """
+        self.layer_start = self.n_nodes
+
+    def expand(self, node_ids: np.ndarray, move_arrays: np.ndarray, move_algebra: Move_Algebra) -> np.ndarray:
+        """
+        Apply all moves allowed by the move automaton to the states of the given nodes and add the resulting states that were not visited yet.
+
+        Args:
+            node_ids (np.ndarray): ids of the nodes to expand
+            move_arrays (np.ndarray): moves as stacked index arrays
+            move_algebra (Move_Algebra): move algebra of `move_arrays`
+
+        Returns:
+            np.ndarray: ids of the new nodes
+        """
+        parent_indices, moves = np.nonzero(move_algebra.successor_mask[self.automaton_states[node_ids]])
+        parents = node_ids[parent_indices]
+        child_states = np.take_along_axis(self.states[parents], move_arrays[moves], axis=1)
+        automaton_states = move_algebra.transitions[self.automaton_states[parents], moves]
+        return self._add_unvisited(child_states, parents, moves, automaton_states)
+
+    def _add_unvisited(self, states: np.ndarray, parents: np.ndarray, moves: np.ndarray, automaton_states: np.ndarray = START_STATE) -> np.ndarray:
+        """
+        Add all nodes whose state was not visited yet. Of several new nodes with the same state, only the first one is added.
+
+        Returns:
+            np.ndarray: ids of the new nodes
+        """
+        unvisited = self.node_ids.get_many(states, default=-1) < 0
+        automaton_states = np.broadcast_to(automaton_states, unvisited.shape)
+        states, parents, moves, automaton_states = states[unvisited], parents[unvisited], moves[unvisited], automaton_states[unvisited]
+        # remove duplicate states among the new nodes
+        first_indices = first_occurrences(self.node_ids.encoder.encode(states))
+        states, parents, moves, automaton_states = \
+            states[first_indices], parents[first_indices], moves[first_indices], automaton_states[first_indices]
+        node_ids = self.add_nodes(states, parents, moves, automaton_states)
+        self.node_ids.set_many(states, node_ids)
+        return node_ids
+
+
+def get_a_star_eval(prev_values, states, ai_class, WEIGHT=0.1):
+    """
+    evaluate the current sequences of actions according to the usual formula of weighted A*:
         f(s) = WEIGHT * g(s) + h(s)
     
     inputs:
     -------
-        action_key - (str) - new action_key added to the currently investigated action sequence
-        prev_value - (float) - value of the current action sequence without `action_key` added to it
-        prev_state - (list) - resulting state of the current action sequence without `action_key` added to it
-        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Puzzle_Network) - an instance of the Q/V-learning puzzle class or the puzzle network class
+        prev_values - (np.ndarray) - values of the action sequences that led to the parents of `states`
+        states - (np.ndarray) - resulting states of the action sequences with shape (n_states, n_points)
+        ai_class - (Puzzle_Q_AI) or (Puzzle_V_AI) or (Greedy_Puzzle_Solver) or (NN_Solver) - an instance of the Q/V-learning puzzle class, the greedy solver or the neural network solver
             this determines what is used for the solving process
             the Q/V-table or neural network should already be loaded.
         WEIGHT - (float) - weight in [0,1] representing lambda in the above equation.
 
     returns:
     --------
-        (float) - representing f(s)
-    """
-    return WEIGHT*prev_value + ai_class.get_state_value(tuple(prev_state))#, action_key, action_cycles)
-    # if isinstance(ai_class, Puzzle_Q_AI):
-    #     return WEIGHT*prev_value-WEIGHT + get_q_value(tuple(prev_state), action_key, ai_class)
-    # if isinstance(ai_class, Puzzle_V_AI):
-    #     return WEIGHT*prev_value-WEIGHT + get_v_value(tuple(prev_state), action_cycles, ai_class)
-    # if isinstance(ai_class, Puzzle_Network):
-    #     return WEIGHT*prev_value-WEIGHT + get_nn_value(prev_state, action_cycles, ai_class)
+        (np.ndarray) - representing f(s) for each state
+    """
+    return WEIGHT*prev_values + ai_class.get_state_values(states)
 
 
 def get_q_value(state, action_key, ai_class):
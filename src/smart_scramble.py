@@ -2,16 +2,20 @@ import random
 import time
 
 from copy import deepcopy
-from numpy import lcm
+from numpy import lcm, ndarray
 try:
     from .ai_modules.twisty_puzzle_model import perform_action
+    from .ai_modules.permutation_engine import permutation_order
+    from .ai_modules.move_algebra import Move_Algebra, START_STATE
 except ImportError:
     from ai_modules.twisty_puzzle_model import perform_action
+    from ai_modules.permutation_engine import permutation_order
+    from ai_modules.move_algebra import Move_Algebra, START_STATE
 
 def smart_scramble(SOLVED_STATE, ACTIONS_DICT, n_moves, max_time: float = 60) -> list[str]:
     """
     Generate a sequence of scramble moves of length `<= n_moves` that is more efficient in achieving the final state than a random scramble of the same length.
-    This is done by replacing moves with their inverses if they are repeated more than half of their order and removing moves if the same state is reached twice during a scramble.
+    This is done by only choosing moves allowed by the puzzle's move automaton (see `Move_Algebra`), replacing moves with their inverses if they are repeated more than half of their order and removing moves if the same state is reached twice during a scramble.
     If this shortening process does not terminate within `max_time`, the current, possibly shorter scramble is returned.
     
     inputs:
@@ -31,6 +35,7 @@ def smart_scramble(SOLVED_STATE, ACTIONS_DICT, n_moves, max_time: float = 60) ->
             n_moves,
             get_action_orders(ACTIONS_DICT),
             max_time,
+            Move_Algebra.from_actions_dict(ACTIONS_DICT, len(SOLVED_STATE)),
             )
     return scramble_moves
 
@@ -53,9 +58,11 @@ def scramble_n(
         ACTIONS_DICT,
         n_moves,
         action_orders,
-        max_time: float = 60) -> list[str]:
+        max_time: float = 60,
+        move_algebra: Move_Algebra = None) -> list[str]:
     """
     scrambles the puzzle such that the result state is approximately `n_moves` away from the solved state
+    If `move_algebra` is given, redundant move sequences like `R R'` or `R L R'` (for commuting `R` and `L`) are never chosen in the first place and every returned scramble is accepted by its automaton. The scramble is then not shortened with `shorten_scramble`, since the automaton already forbids unnecessary repetitions of moves.
 
     inputs:
     -------
@@ -64,6 +71,7 @@ def scramble_n(
         n_moves - (int) - number of moves the scrambled state is from a solved_state
         ACTION_ORDERS - (dict) - order of each action possible in the puzzle
         max_time - (float) - maximum time in seconds to generate the scramble. If this is exceeded, the current scramble is returned, which may be shorter than `n_moves`.
+        move_algebra - (Move_Algebra) - move algebra of `ACTIONS_DICT`. None to choose any action.
 
     returns:
     --------
@@ -72,13 +80,18 @@ def scramble_n(
     action_keys = list(ACTIONS_DICT.keys())
     scramble_hist = [] #list of moves
     state_hist = [tuple(SOLVED_STATE)]
+    automaton_hist = [START_STATE] # automaton state after each move of the scramble
     state = deepcopy(SOLVED_STATE)
     start_time = time.time()
     while len(scramble_hist) < n_moves:
         if time.time() - start_time > max_time:
             print("scramble generation timed out. Returning current scramble.")
             break
-        action = random.choice(action_keys)
+        if move_algebra is None:
+            action = random.choice(action_keys)
+        else:
+            move_index = random.choice(move_algebra.get_allowed_moves(automaton_hist[-1]).tolist())
+            action = action_keys[move_index]
         perform_action(state, ACTIONS_DICT[action])
         state_tuple = tuple(state)
         if state_tuple in state_hist:
@@ -86,11 +99,14 @@ def scramble_n(
             state_index = state_hist.index(tuple(state))
             scramble_hist = scramble_hist[:state_index]
             state_hist = state_hist[:state_index+1]
+            automaton_hist = automaton_hist[:state_index+1]
             continue
         else:
             scramble_hist.append(action)
             state_hist.append(state_tuple)
-        if len(scramble_hist) == n_moves:
+            if move_algebra is not None:
+                automaton_hist.append(move_algebra.next_state(automaton_hist[-1], move_index))
+        if len(scramble_hist) == n_moves and move_algebra is None:
             # print("\nprevious:   " , " ".join(scramble_hist))
             shorten_scramble(scramble_hist, state_hist, action_orders, ACTIONS_DICT)
             # print("shortened:  ", " ".join(scramble_hist))
@@ -234,10 +250,13 @@ def get_action_order(action):
     inputs:
     -------
         action - (list) of lists of ints - a move given as a list of cycles
+            or as an index array compiled by `Permutation_Engine`
 
     returns:
     --------
         (int) - the order of the given move
     """
+    if isinstance(action, ndarray):
+        return permutation_order(action)
     cycle_lengths = [len(cycle) for cycle in action]
     return lcm.reduce(cycle_lengths)
\ No newline at end of file